@@ -1,15 +1,18 @@
-import os
 import logging
 import asyncio
-from typing import Dict, Union
+from typing import Awaitable, Callable, Dict, List, Optional, Union
 
-from aiogram import types
+from aiogram import Bot, types
 from aiogram.fsm.context import FSMContext
 from agents.router_agent import RouterAgent
 from use_cases.function_handler import FunctionHandler
 from telegram.responder import TelegramResponder
 from core.task_manager import task_manager, TaskIdentifier
+from core.report import Report
+from services.batch_service import BatchPollResult, BatchState
 from telegram.states import ProcessingState
+from telegram.outbox import Priority
+from telegram.utils.message import edit_message
 
 OrchestratorResponse = Dict[str, Union[str, bool]]
 
@@ -21,7 +24,10 @@ class OrchestratorAgent:
         self.logger = logging.getLogger("OrchestratorAgent")
 
     async def process_request(self, user_text: str, message: types.Message, state: FSMContext) -> OrchestratorResponse:
-        routing_decision = await self.router_agent.route(user_text)
+        fsm_data = await state.get_data()
+        followup_video_id = fsm_data.get("followup_video_id")
+        has_video_context = bool(followup_video_id) and await self.function_handler.has_video_context(followup_video_id)
+        routing_decision = await self.router_agent.route(user_text, has_video_context=has_video_context)
         
         if not routing_decision or "function_to_call" not in routing_decision:
             return {'type': 'text', 'content': 'Я не смог понять ваш запрос.'}
@@ -34,12 +40,29 @@ class OrchestratorAgent:
             return {'type': 'text', 'content': "Пожалуйста, подождите, предыдущая обработка видео еще не завершена."}
 
         if function_to_call == "analyze_video_content":
+            analysis_mode = routing_decision.get("analysis_mode") or "full"
             await state.update_data(
                 original_prompt=user_text,
-                language=language
+                language=language,
+                analysis_mode=analysis_mode
             )
-            self.logger.info(f"Saved to state: prompt='{user_text}', language='{language}'")
-            return await self.function_handler.estimate_and_propose_analysis(user_text, message)
+            self.logger.info(f"Saved to state: prompt='{user_text}', language='{language}', mode='{analysis_mode}'")
+            proposal = await self.function_handler.estimate_and_propose_analysis(user_text, message)
+            if proposal.get('video_ids'):
+                # Список видео пачки ждет подтверждения в FSM: в callback_data он не помещается
+                await state.update_data(pending_video_batch={
+                    "id": proposal['batch_id'],
+                    "video_ids": proposal['video_ids'],
+                    "durations": proposal['durations']
+                })
+            return proposal
+
+        if function_to_call in ("answer_video_followup", "search_video_segments"):
+            if not followup_video_id:
+                return {'type': 'text', 'content': 'Нет видео, по которому можно задать вопрос. Отправьте ссылку на YouTube.'}
+            method_to_call = getattr(self.function_handler, function_to_call)
+            final_result = await method_to_call(user_text, followup_video_id)
+            return self._format_response(final_result)
         
         if hasattr(self.function_handler, function_to_call):
             method_to_call = getattr(self.function_handler, function_to_call)
@@ -50,55 +73,146 @@ class OrchestratorAgent:
 
     # --- ВОТ ВОССТАНОВЛЕННЫЕ МЕТОДЫ ---
 
-    async def launch_analysis_task(self, video_id: str, original_message: types.Message, state: FSMContext):
+    async def launch_analysis_task(self, video_id: str, original_message: types.Message, state: FSMContext, deliver_later: bool = False):
         """Запускает тяжелую задачу анализа в фоне и сохраняет ее в TaskManager."""
+        fsm_data = await state.get_data()
+        if not deliver_later and fsm_data.get("analysis_mode") == "search":
+            # Поиск момента: пробы сегментов с ранней остановкой вместо полного отчета
+            search = lambda prompt, language: self.function_handler.execute_video_search(
+                video_id=video_id,
+                original_user_prompt=prompt,
+                language=language,
+                message=original_message,
+                on_queue_position=lambda position, eta: self._report_queue_position(original_message, position, eta)
+            )
+            self._launch(search, original_message, state, followup_video_id=video_id)
+            return
+
+        analyze = lambda prompt, language: self.function_handler.execute_video_analysis(
+            video_id=video_id,
+            original_user_prompt=prompt,
+            language=language,
+            message=original_message,
+            deliver_later=deliver_later,
+            on_queue_position=lambda position, eta: self._report_queue_position(original_message, position, eta)
+        )
+        if deliver_later:
+            self._launch(
+                analyze, original_message, state, done_text="🕒 Видео передано в пакетную обработку.",
+                succeeded=lambda result: result == self.function_handler.BATCH_SUBMITTED_MESSAGE
+            )
+        else:
+            self._launch(analyze, original_message, state, followup_video_id=video_id)
+
+    async def launch_multi_analysis_task(self, video_ids: List[str], durations: Optional[List[float]], original_message: types.Message, state: FSMContext):
+        """Запускает в фоне анализ нескольких видео одного запроса с общим отчетом."""
+        analyze = lambda prompt, language: self.function_handler.execute_multi_video_analysis(
+            video_ids=video_ids,
+            original_user_prompt=prompt,
+            language=language,
+            message=original_message,
+            durations=durations,
+            on_progress=lambda finished, total: self._report_multi_video_progress(original_message, finished, total)
+        )
+        self._launch(analyze, original_message, state)
+
+    def _launch(
+        self, analyze: Callable[[str, str], Awaitable[Union[Report, str]]], original_message: types.Message, state: FSMContext,
+        done_text: str = "✅ Обработка успешно завершена.", followup_video_id: Optional[str] = None,
+        succeeded: Optional[Callable[[Union[Report, str]], bool]] = None
+    ):
         task_identifier: TaskIdentifier = (original_message.chat.id, original_message.message_id)
         task = asyncio.create_task(
-            self._run_analysis_and_respond(video_id, original_message, task_identifier, state)
+            self._run_analysis_and_respond(analyze, original_message, task_identifier, state, done_text, followup_video_id, succeeded)
         )
         task_manager.add_task(task_identifier, task)
 
     async def _run_analysis_and_respond(
-        self, video_id: str, message: types.Message, task_identifier: TaskIdentifier, state: FSMContext
+        self, analyze: Callable[[str, str], Awaitable[Union[Report, str]]], message: types.Message, task_identifier: TaskIdentifier,
+        state: FSMContext, done_text: str, followup_video_id: Optional[str] = None,
+        succeeded: Optional[Callable[[Union[Report, str]], bool]] = None
     ):
         """Обертка для фоновой задачи: выполняет анализ, обрабатывает результат, ошибки и отмену."""
+        completed = False
         try:
             fsm_data = await state.get_data()
             original_prompt = fsm_data.get("original_prompt", "Summarize this video.")
             language = fsm_data.get("language", "English")
             self.logger.info(f"Retrieved from state: prompt='{original_prompt}', language='{language}'")
 
-            result_str = await self.function_handler.execute_video_analysis(
-                video_id=video_id,
-                original_user_prompt=original_prompt,
-                language=language,
-                message=message
-            )
+            result_str = await analyze(original_prompt, language)
             
             response_data = self._format_response(result_str)
             await self.responder.send_response(message, response_data)
-            await message.edit_text("✅ Обработка успешно завершена.", reply_markup=None)
+            if succeeded is not None and not succeeded(result_str):
+                # Текст ошибки уже отправлен ответом; статус "готово" показывать нельзя
+                await edit_message(message, "❌ Во время обработки произошла ошибка.")
+                return
+            await edit_message(message, done_text)
+            completed = True
 
         except asyncio.CancelledError:
             self.logger.warning(f"Task {task_identifier} was cancelled by user {message.chat.id}.")
-            await message.edit_text("✅ Обработка успешно отменена.")
+            await edit_message(message, "✅ Обработка успешно отменена.")
 
         except Exception as e:
             self.logger.error(f"Task {task_identifier} failed for user {message.chat.id}: {e}", exc_info=True)
             error_response = {'type': 'text', 'content': f'Произошла критическая ошибка: {e}'}
             await self.responder.send_response(message, error_response)
-            await message.edit_text("❌ Во время обработки произошла ошибка.", reply_markup=None)
+            await edit_message(message, "❌ Во время обработки произошла ошибка.")
         finally:
             self.logger.info(f"Cleaning up for task {task_identifier}, user {message.chat.id}.")
             await state.clear()
+            if completed and followup_video_id:
+                # Режим дополнительных вопросов: следующие сообщения могут относиться к этому видео
+                await state.update_data(followup_video_id=followup_video_id)
             task_manager.remove_task(task_identifier)
 
-    def _format_response(self, result: str) -> OrchestratorResponse:
+    async def _report_queue_position(self, message: types.Message, position: int, eta_seconds: float):
+        """Показывает пользователю его место в очереди анализа и примерное время ожидания."""
+        if position == 0:
+            await edit_message(
+                message,
+                "⏳ Обработка началась... Вы можете отменить ее в любой момент.",
+                reply_markup=self.responder.cancel_keyboard(message)
+            )
+            return
+        await edit_message(
+            message,
+            f"⏳ Ваше видео в очереди: позиция {position}, ожидание около {max(eta_seconds / 60, 1):.0f} мин. "
+            f"Вы можете отменить обработку в любой момент.",
+            reply_markup=self.responder.cancel_keyboard(message),
+            priority=Priority.PROGRESS
+        )
+
+    async def _report_multi_video_progress(self, message: types.Message, finished: int, total: int):
+        """Показывает, сколько видео пачки уже проанализировано."""
+        await edit_message(
+            message,
+            f"⏳ Проанализировано видео: {finished} из {total}. Вы можете отменить обработку в любой момент.",
+            reply_markup=self.responder.cancel_keyboard(message),
+            priority=Priority.PROGRESS
+        )
+
+    async def deliver_batch_report(self, bot: Bot, job: Dict, result: BatchPollResult):
+        """Собирает отчет по завершенному пакету и отправляет его в чат, из которого пришел запрос."""
+        if result.state == BatchState.FAILED:
+            # Отчет из одних ошибок не собираем и в индекс ничего не пишем
+            response_data = {
+                'type': 'text',
+                'content': f"❌ Пакетный анализ видео {job['video_id']} не удался ({result.error}). Отправьте запрос еще раз."
+            }
+        else:
+            report = await self.function_handler.complete_batch_analysis(job, result.texts)
+            response_data = self._format_response(report)
+        await self.responder.send_response_to_chat(bot, job["chat_id"], response_data)
+
+    def _format_response(self, result: Union[Report, str]) -> OrchestratorResponse:
         """Форматирует финальный результат (строку) в словарь для Responder."""
         if not result:
             self.logger.error("A function handler returned a None or empty result.")
             return {'type': 'text', 'content': "К сожалению, произошла внутренняя ошибка..."}
-        if isinstance(result, str) and os.path.isfile(result):
+        if isinstance(result, Report):
             return {'type': 'document', 'content': result, 'caption': 'Ваш детальный анализ видео готов.'}
         else:
             return {'type': 'text', 'content': str(result)}
\ No newline at end of file
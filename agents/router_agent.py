@@ -12,8 +12,13 @@ class RouterAgent:
         self.model = GeminiModel.GEMINI_2_5_FLASH_LITE
         self.logger = logging.getLogger("RouterAgent")
 
-    def _create_prompt(self, user_text: str) -> str:
+    def _create_prompt(self, user_text: str, has_video_context: bool = False) -> str:
         # --- ПРОМПТ ОБНОВЛЕН И УПРОЩЕН ---
+        followup_option = (
+            "\n        - 'search_video_segments': If the request asks when or where something is mentioned or shown in the previously analyzed video, and contains no new YouTube link."
+            "\n        - 'answer_video_followup': If the request is any other follow-up question about the previously analyzed video and contains no new YouTube link."
+            if has_video_context else ""
+        )
         return f"""
         You are an AI-dispatcher. Your tasks are to determine the correct function to call and the language of the user's request.
         Your response MUST be ONLY a valid JSON object. Do not add any explanatory text.
@@ -21,13 +26,16 @@ class RouterAgent:
         Available functions:
         - 'analyze_video_content': If the request contains a YouTube link.
         - 'get_hard_text_response': For complex questions.
-        - 'get_light_text_response': For simple questions.
+        - 'get_light_text_response': For simple questions.{followup_option}
+
+        For 'analyze_video_content' also set 'analysis_mode': 'search' if the user only wants to find when
+        something is said or shown in the linked video (e.g. "at what minute do they talk about pricing"), otherwise 'full'.
         
         User request: "{user_text}"
         """
 
-    async def route(self, user_text: str) -> Optional[Dict[str, Any]]:
-        prompt = self._create_prompt(user_text)
+    async def route(self, user_text: str, has_video_context: bool = False) -> Optional[Dict[str, Any]]:
+        prompt = self._create_prompt(user_text, has_video_context)
         routing_result = await self.gemini_service.generate_json(
             prompt=prompt,
             response_schema=self.routing_schema,
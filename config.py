@@ -1,7 +1,49 @@
+from typing import List
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Config(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     bot_token: str
-    gemini_api_key: str
\ No newline at end of file
+    gemini_api_key: str
+    # Дополнительные ключи (проекты) Gemini: у каждого свои лимиты и дневная квота (GEMINI_API_KEYS='["key2", "key3"]')
+    gemini_api_keys: List[str] = []
+
+    segment_index_path: str = "segment_index.db"
+    # "gemini" - настоящий Batch API, "local" - локальная заглушка для разработки и тестов
+    batch_backend: str = "gemini"
+    batch_jobs_path: str = "batch_jobs.json"
+    time_estimator_path: str = "time_estimator.json"
+    # Глобальная очередь анализов: сколько видео обрабатывается одновременно и сколько может ждать
+    max_concurrent_analyses: int = 3
+    max_analysis_queue_depth: int = 20
+    # Несколько ссылок или плейлист в одном сообщении: сколько видео берем и сколько анализируем одновременно
+    max_videos_per_request: int = 10
+    multi_video_concurrency: int = 2
+    # Перекодирование перед загрузкой: файлы больше порога уменьшаются по разрешению, fps и битрейту звука.
+    # По умолчанию выключено: ffmpeg занимает общий пул "media" (ffprobe всех задач), выигрыш еще не измерен
+    transcode_enabled: bool = False
+    transcode_min_size_mb: int = 150
+    transcode_max_height: int = 480
+    transcode_fps: float = 2.0
+    transcode_audio_bitrate: str = "48k"
+    # Видео не больше порога отправляются inline в generate_content, без Files API (0 - выключено);
+    # порог подбирается по scripts/inline_benchmark.py, потолок - лимит запроса ~20 МБ с учетом base64
+    inline_video_max_mb: float = 14.0
+    # Поиск момента в видео: сколько сегментов пробуется одновременно и с какой уверенностью поиск останавливается
+    search_concurrency: int = 3
+    search_min_confidence: float = 0.7
+    # Общий HTTP-пул клиента Gemini (генерация, Files API, кэши, Batch API)
+    genai_max_connections: int = 20
+    genai_max_keepalive_connections: int = 10
+    genai_keepalive_expiry: float = 60.0
+    genai_http2: bool = True
+    genai_connect_timeout: float = 10.0
+    genai_request_timeout: float = 600.0
+    # Мониторинг event loop: зависания дольше порога пишутся в лог со стеком; профиль снимают
+    # администраторы командой /profile или сигналом SIGUSR1 (ADMIN_USER_IDS='[123456789]')
+    admin_user_ids: List[int] = []
+    loop_slow_threshold: float = 0.5
+    profile_dir: str = "profiles"
+    signal_profile_seconds: float = 10.0
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from core.exceptions import AdmissionRejectedError
+
+# Колбэк обновления статуса: (позиция в очереди, ожидаемое ожидание в секундах); позиция 0 - задача допущена
+QueuePositionCallback = Callable[[int, float], Awaitable[None]]
+
+
+class AnalysisAdmissionQueue:
+    """
+    Глобальная очередь допуска задач анализа видео.
+
+    Одновременно выполняется не более `max_concurrent` анализов, остальные
+    ждут в FIFO-очереди глубиной не более `max_depth`. Если очередь заполнена,
+    новая задача сразу отклоняется (AdmissionRejectedError), чтобы задержка
+    уже принятых задач оставалась ограниченной при всплесках нагрузки.
+    """
+    STATUS_UPDATE_INTERVAL = 10.0
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, max_concurrent: int, max_depth: int, initial_job_seconds: float = 300.0):
+        if max_concurrent <= 0 or max_depth < 0:
+            raise ValueError("Admission limits must be positive.")
+        self.max_concurrent = max_concurrent
+        self.max_depth = max_depth
+        self._running = 0
+        self._waiters: deque = deque()
+        # Средняя длительность задачи (EWMA) для расчета ETA в очереди
+        self.avg_job_seconds = initial_job_seconds
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.max_depth_seen = 0
+        self.logger = logging.getLogger("AnalysisAdmissionQueue")
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def position_of(self, waiter: asyncio.Future) -> int:
+        """Позиция в очереди, начиная с 1 (0 - задача уже допущена или не найдена)."""
+        try:
+            return self._waiters.index(waiter) + 1
+        except ValueError:
+            return 0
+
+    def eta_seconds(self, position: int) -> float:
+        """Ожидаемое время до допуска задачи на указанной позиции."""
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_concurrent) * self.avg_job_seconds
+
+    def expected_wait_seconds(self) -> float:
+        """Сколько будет ждать новая задача, если поставить ее в очередь сейчас."""
+        if self._running < self.max_concurrent and not self._waiters:
+            return 0.0
+        return self.eta_seconds(len(self._waiters) + 1)
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[QueuePositionCallback] = None):
+        """Ждет допуска задачи (с периодическим сообщением позиции) и удерживает слот до выхода из блока."""
+        reported_queue = await self._acquire(on_position)
+        started = time.monotonic()
+        try:
+            # Сообщение о допуске - уже внутри try: отмена во время него не должна терять слот
+            if on_position and reported_queue:
+                # Позиция 0 - задача допущена и начинает выполняться
+                try:
+                    await on_position(0, 0.0)
+                except Exception as e:
+                    self.logger.warning(f"Failed to report admission: {e}")
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.avg_job_seconds += self.EWMA_ALPHA * (elapsed - self.avg_job_seconds)
+            self._release()
+
+    async def _acquire(self, on_position: Optional[QueuePositionCallback]) -> bool:
+        """Занимает слот; возвращает True, если задача ждала в очереди и пользователю сообщалась позиция."""
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            self.admitted_total += 1
+            return False
+
+        if len(self._waiters) >= self.max_depth:
+            self.rejected_total += 1
+            self.logger.warning(f"Rejecting analysis: queue is full ({len(self._waiters)}/{self.max_depth})")
+            raise AdmissionRejectedError(len(self._waiters))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_depth_seen = max(self.max_depth_seen, len(self._waiters))
+        last_reported = None
+        try:
+            while not waiter.done():
+                position = self.position_of(waiter)
+                if on_position and position != last_reported:
+                    last_reported = position
+                    try:
+                        await on_position(position, self.eta_seconds(position))
+                    except Exception as e:
+                        self.logger.warning(f"Failed to report queue position: {e}")
+                await asyncio.wait({waiter}, timeout=self.STATUS_UPDATE_INTERVAL)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже был передан этой задаче - возвращаем его следующей
+                self._release()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            raise
+        self.admitted_total += 1
+        return last_reported is not None
+
+    def _remove_waiter(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self):
+        # Передаем слот первому живому ожидающему, не уменьшая счетчик выполняющихся
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_depth": self.max_depth,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "max_depth_seen": self.max_depth_seen,
+            "avg_job_seconds": round(self.avg_job_seconds, 1),
+        }
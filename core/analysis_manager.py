@@ -1,52 +1,135 @@
 import asyncio
+import logging
+import sys
+import time
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+from core.timer_wheel import HierarchicalTimerWheel, TimerHandle, timer_wheel
 
 class AnalysisStatus(str, Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
 
-class AnalysisManager:
+
+class AnalysisEntry:
+    """Запись об анализе видео. __slots__ вместо dict: несколько сотен байт экономии на запись."""
+    __slots__ = ("status", "result", "event", "created_at", "timer")
+
     def __init__(self):
-        # Структура: { "video_id": {"status": AnalysisStatus, "result": str | None, "event": asyncio.Event} }
-        self._analyses: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()  # Для потокобезопасного создания записей
-
-    async def get_or_create_analysis_entry(self, video_id: str) -> Dict[str, Any]:
-        """Потокобезопасно получает или создает запись для анализа видео."""
-        async with self._lock:
-            if video_id not in self._analyses:
-                self._analyses[video_id] = {
-                    "status": AnalysisStatus.IN_PROGRESS,
-                    "result": None,
-                    "event": asyncio.Event()  # Событие для ожидания завершения
-                }
-            return self._analyses[video_id]
-
-    async def complete_analysis(self, video_id: str, report_path: str):
+        self.status = AnalysisStatus.IN_PROGRESS
+        self.result: Any = None  # Report | str | None
+        self.event = asyncio.Event()  # Событие для ожидания завершения
+        self.created_at = time.monotonic()
+        self.timer: Optional[TimerHandle] = None
+
+
+class AnalysisManager:
+    """
+    Общие результаты анализа видео для одновременных запросов одного видео.
+
+    Записи защищены полосами блокировок (lock striping): разные видео почти
+    никогда не ждут друг друга. Завершенная запись живет `ttl_seconds` и
+    удаляется общим колесом таймеров, без отдельной спящей корутины на запись.
+    """
+    STUCK_ENTRY_MESSAGE = "Анализ этого видео был прерван. Попробуйте отправить запрос еще раз."
+
+    def __init__(self, ttl_seconds: float = 600.0, lock_stripes: int = 16, wheel: HierarchicalTimerWheel = timer_wheel):
+        self.ttl_seconds = ttl_seconds
+        self._analyses: Dict[str, AnalysisEntry] = {}
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(lock_stripes)]
+        self._wheel = wheel
+        self.expired = 0
+        self.logger = logging.getLogger("AnalysisManager")
+
+    def _lock_for(self, video_id: str) -> asyncio.Lock:
+        return self._locks[hash(video_id) % len(self._locks)]
+
+    async def get_or_create_analysis_entry(self, video_id: str) -> Tuple[AnalysisEntry, bool]:
+        """
+        Потокобезопасно получает или создает запись для анализа видео.
+
+        Возвращает (запись, создана_сейчас): анализ выполняет только тот, кто создал запись,
+        остальные ждут ее события.
+        """
+        async with self._lock_for(video_id):
+            entry = self._analyses.get(video_id)
+            if entry is not None:
+                return entry, False
+            entry = AnalysisEntry()
+            self._analyses[video_id] = entry
+            return entry, True
+
+    async def complete_analysis(self, video_id: str, report: Any):
         """Отмечает анализ как успешно завершенный и уведомляет всех ожидающих."""
-        async with self._lock:
-            if video_id in self._analyses:
-                entry = self._analyses[video_id]
-                entry["status"] = AnalysisStatus.COMPLETED
-                entry["result"] = report_path
-                entry["event"].set()  # "Поднимаем флаг" - будим всех, кто ждал
+        async with self._lock_for(video_id):
+            entry = self._analyses.get(video_id)
+            if entry is not None:
+                entry.status = AnalysisStatus.COMPLETED
+                entry.result = report
+                entry.event.set()  # "Поднимаем флаг" - будим всех, кто ждал
+                self._arm_expiry(video_id, entry)
 
     async def fail_analysis(self, video_id: str, error_message: str):
         """Отмечает анализ как проваленный."""
-        async with self._lock:
-            if video_id in self._analyses:
-                entry = self._analyses[video_id]
-                entry["status"] = AnalysisStatus.FAILED
-                entry["result"] = error_message
-                entry["event"].set()
+        async with self._lock_for(video_id):
+            entry = self._analyses.get(video_id)
+            if entry is not None:
+                entry.status = AnalysisStatus.FAILED
+                entry.result = error_message
+                entry.event.set()
+                self._arm_expiry(video_id, entry)
+
+    def schedule_expiry(self, video_id: str):
+        """Гарантирует, что запись будет удалена через TTL (например, если обработчик отменили)."""
+        entry = self._analyses.get(video_id)
+        if entry is not None:
+            self._arm_expiry(video_id, entry)
 
     async def cleanup_entry(self, video_id: str):
-        """Удаляет запись из менеджера (можно вызывать через некоторое время)."""
-        async with self._lock:
-            if video_id in self._analyses:
-                del self._analyses[video_id]
+        """Удаляет запись из менеджера сразу."""
+        async with self._lock_for(video_id):
+            entry = self._analyses.pop(video_id, None)
+            if entry is not None:
+                self._wheel.cancel(entry.timer)
+                entry.timer = None
+
+    def _arm_expiry(self, video_id: str, entry: AnalysisEntry):
+        if entry.timer is None:
+            entry.timer = self._wheel.schedule(self.ttl_seconds, lambda: self._expire(video_id, entry))
+
+    def _expire(self, video_id: str, entry: AnalysisEntry):
+        # Удаляем только ту запись, для которой ставился таймер, а не созданную позже
+        if self._analyses.get(video_id) is not entry:
+            return
+        del self._analyses[video_id]
+        entry.timer = None
+        self.expired += 1
+        if not entry.event.is_set():
+            # Обработчик пропал, не завершив анализ: будим ожидающих, чтобы они не висели вечно
+            entry.status = AnalysisStatus.FAILED
+            entry.result = self.STUCK_ENTRY_MESSAGE
+            entry.event.set()
+        self.logger.info(f"Expired cached analysis entry for video_id: {video_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        by_status = {status.value: 0 for status in AnalysisStatus}
+        result_bytes = 0
+        for entry in self._analyses.values():
+            by_status[entry.status.value] += 1
+            if entry.result is not None:
+                result_bytes += getattr(entry.result, "size_bytes", None) or sys.getsizeof(entry.result)
+        entry_bytes = sys.getsizeof(self._analyses) + len(self._analyses) * (
+            sys.getsizeof(AnalysisEntry()) + sys.getsizeof(asyncio.Event())
+        )
+        return {
+            "entries": len(self._analyses),
+            **by_status,
+            "expired": self.expired,
+            "approx_entry_bytes": entry_bytes,
+            "approx_result_bytes": result_bytes,
+        }
 
 # Глобальный экземпляр для всего приложения
-analysis_manager = AnalysisManager()
\ No newline at end of file
+analysis_manager = AnalysisManager()
@@ -10,4 +10,11 @@ class RateLimits(int, Enum):
     RATE_LIMIT_2_5_FLASH_LITE=16
     RATE_LIMIT_2_5_PRO=6
     
-    RATE_LIMIT_WINDOW=60
\ No newline at end of file
+    RATE_LIMIT_WINDOW=60
+
+
+class TokenLimits(int, Enum):
+    # Лимиты входных токенов в минуту (TPM) для free tier
+    TOKEN_LIMIT_2_5_FLASH=250_000
+    TOKEN_LIMIT_2_5_FLASH_LITE=250_000
+    TOKEN_LIMIT_2_5_PRO=250_000
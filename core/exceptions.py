@@ -19,4 +19,15 @@ class VideoProcessingError(ServiceError):
     """Выбрасывается при ошибках скачивания или обработки видео."""
     pass
 
-    
\ No newline at end of file
+class AdmissionRejectedError(ServiceError):
+    """Выбрасывается, когда очередь анализа переполнена и новая задача не принимается."""
+    def __init__(self, queue_depth: int):
+        self.queue_depth = queue_depth
+        super().__init__(f"Analysis queue is full ({queue_depth} jobs waiting)")
+
+class CircuitOpenError(ServiceError):
+    """Выбрасывается, когда предохранитель модели разомкнут после серии ошибок и вызов отклонен сразу."""
+    def __init__(self, model: str, retry_after: float):
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(f"Model {model} is temporarily unavailable, retry in {retry_after:.0f}s")
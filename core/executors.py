@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+# Размеры пулов: (число потоков, максимальная длина очереди ожидания)
+EXECUTOR_LIMITS: Dict[str, tuple] = {
+    "youtube": (4, 32),  # yt-dlp: получение метаданных и скачивание
+    "media": (2, 16),    # ffmpeg/ffprobe
+    "disk": (4, 64),     # прочие блокирующие операции с файлами
+}
+
+
+class BoundedExecutor:
+    """
+    Именованный пул потоков с ограниченным числом воркеров и ограниченной очередью.
+
+    Если очередь заполнена, вызывающая корутина ждет свободного места,
+    а не наращивает бесконечную очередь внутри ThreadPoolExecutor.
+    Пул собирает метрики насыщения: активные задачи, длину очереди и время ожидания.
+    """
+    SLOW_QUEUE_WAIT = 5.0
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        if max_workers <= 0 or max_queue < 0:
+            raise ValueError("Executor limits must be positive.")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._admission = asyncio.Semaphore(max_workers + max_queue)
+        self.active = 0
+        self.queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queued_seen = 0
+        self.total_queue_wait = 0.0
+        self.logger = logging.getLogger(f"BoundedExecutor[{name}]")
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполняет блокирующую функцию в пуле и возвращает ее результат."""
+        await self._admission.acquire()
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        self.queued += 1
+        self.max_queued_seen = max(self.max_queued_seen, self.queued)
+        enqueued_at = time.monotonic()
+        started = False
+
+        # Счетчики и место в очереди меняются только в потоке event loop
+        def _on_started(started_at: float):
+            nonlocal started
+            started = True
+            self.queued -= 1
+            self.active += 1
+            queue_wait = started_at - enqueued_at
+            self.total_queue_wait += queue_wait
+            if queue_wait > self.SLOW_QUEUE_WAIT:
+                self.logger.warning(f"Task waited {queue_wait:.1f}s in queue, executor is saturated: {self.stats()}")
+
+        def _on_done(future: Future):
+            # Место освобождается, только когда поток действительно закончил (или задачу сняли
+            # из очереди): отмененный вызывающий не оставляет работающий поток "вне" лимита
+            if started:
+                self.active -= 1
+            else:
+                self.queued -= 1
+            if not future.cancelled():
+                if future.exception() is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._admission.release()
+
+        def _call():
+            # Выполняется уже в потоке пула: задача вышла из очереди
+            self._call_on_loop(loop, _on_started, time.monotonic())
+            return func(*args, **kwargs)
+
+        try:
+            future = self._executor.submit(_call)
+        except BaseException:
+            self.queued -= 1
+            self._admission.release()
+            raise
+        future.add_done_callback(lambda done: self._call_on_loop(loop, _on_done, done))
+        # Отмена ожидающего снимает задачу из очереди пула, если она еще не началась
+        return await asyncio.wrap_future(future, loop=loop)
+
+    @staticmethod
+    def _call_on_loop(loop: asyncio.AbstractEventLoop, callback: Callable[..., Any], *args):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Loop уже закрыт (остановка бота): счетчики больше никто не прочитает
+            pass
+
+    @property
+    def saturation(self) -> float:
+        """Доля занятых воркеров (1.0 - пул полностью загружен)."""
+        return self.active / self.max_workers
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "name": self.name,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "saturation": round(self.saturation, 2),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_queued_seen": self.max_queued_seen,
+            "avg_queue_wait": round(self.total_queue_wait / finished, 3) if finished else 0.0,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    """Возвращает (и при первом обращении создает) именованный пул потоков."""
+    executor = _executors.get(name)
+    if executor is None:
+        if name not in EXECUTOR_LIMITS:
+            raise KeyError(f"Unknown executor: {name}")
+        max_workers, max_queue = EXECUTOR_LIMITS[name]
+        executor = BoundedExecutor(name, max_workers, max_queue)
+        _executors[name] = executor
+    return executor
+
+
+async def run_blocking(executor_name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Удобная обертка: `await run_blocking("media", ffmpeg.probe, path)`."""
+    return await get_executor(executor_name).run(partial(func, *args, **kwargs))
+
+
+def read_file_bytes(path: str) -> bytes:
+    """Читает файл целиком (для пула "disk")."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors(logger: Optional[logging.Logger] = None):
+    for name, executor in list(_executors.items()):
+        if logger:
+            logger.info(f"Executor stats on shutdown: {executor.stats()}")
+        executor.shutdown()
+    _executors.clear()
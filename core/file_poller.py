@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from core.exceptions import VideoProcessingError
+
+FileFetcher = Callable[[str], Awaitable[Any]]
+
+
+class _PendingFile:
+    """Файл, ожидающий перехода из PROCESSING в ACTIVE/FAILED."""
+    __slots__ = ("name", "fetch", "future", "size_bytes", "started_at", "deadline", "next_check_at", "overdue_checks", "errors")
+
+    def __init__(self, name: str, fetch: FileFetcher, future: asyncio.Future, size_bytes: int, timeout: float):
+        now = time.monotonic()
+        self.name = name
+        self.fetch = fetch
+        self.future = future
+        self.size_bytes = size_bytes
+        self.started_at = now
+        self.deadline = now + timeout
+        self.next_check_at = now
+        self.overdue_checks = 0
+        self.errors = 0
+
+
+class FilePoller:
+    """
+    Единый фоновый опросчик состояния загруженных файлов Gemini Files API.
+
+    Вместо того чтобы каждая корутина сама раз в 5 секунд дергала `files.get`,
+    все ожидающие файлы регистрируются здесь. Один фоновый цикл опрашивает
+    только те файлы, для которых подошло время проверки, пачкой за один тик.
+    Интервал проверки подбирается по размеру файла и по наблюдаемому времени
+    обработки предыдущих файлов (EWMA секунд на мегабайт).
+    """
+    MIN_INTERVAL = 1.0
+    MAX_INTERVAL = 15.0
+    DEFAULT_TIMEOUT = 600.0
+    MAX_FETCH_ERRORS = 5
+    # Проверки тика ждутся вместе: один зависший files.get не должен держать остальные файлы до таймаута клиента
+    FETCH_TIMEOUT = 10.0
+    EWMA_ALPHA = 0.3
+
+    def __init__(self):
+        self._pending: Dict[str, _PendingFile] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Начальные оценки: фиксированная задержка + время на мегабайт
+        self._base_latency = 2.0
+        self._seconds_per_mb = 0.1
+        self.logger = logging.getLogger("FilePoller")
+
+    async def wait_until_active(self, file: Any, fetch: FileFetcher, size_bytes: int = 0, timeout: Optional[float] = None) -> Any:
+        """
+        Ждет, пока файл выйдет из состояния PROCESSING, и возвращает его актуальную версию.
+
+        `fetch` - корутина, получающая файл по имени (например, `client.aio.files.get`).
+        Выбрасывает VideoProcessingError, если файл перешел в FAILED или не успел обработаться за `timeout`.
+        """
+        if not file.state or file.state.name != "PROCESSING":
+            return self._resolve_state(file)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = _PendingFile(file.name, fetch, future, size_bytes or file.size_bytes or 0, timeout or self.DEFAULT_TIMEOUT)
+        entry.next_check_at = entry.started_at + self._next_interval(entry, entry.started_at)
+        self._pending[file.name] = entry
+        self._ensure_running()
+        self._wakeup.set()
+        try:
+            return await future
+        finally:
+            self._pending.pop(file.name, None)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _expected_duration(self, size_bytes: int) -> float:
+        return self._base_latency + self._seconds_per_mb * (size_bytes / (1024 * 1024))
+
+    def _next_interval(self, entry: _PendingFile, now: float) -> float:
+        elapsed = now - entry.started_at
+        expected = self._expected_duration(entry.size_bytes)
+        if elapsed < expected:
+            # До ожидаемого момента готовности проверяем все чаще, приближаясь к нему
+            interval = (expected - elapsed) / 2
+        else:
+            # Файл обрабатывается дольше ожидаемого - плавно увеличиваем интервал
+            interval = self.MIN_INTERVAL * (1.5 ** entry.overdue_checks)
+        return min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+    def _observe(self, entry: _PendingFile, now: float):
+        """Обновляет оценку времени обработки по фактическим данным."""
+        size_mb = entry.size_bytes / (1024 * 1024)
+        elapsed = now - entry.started_at
+        if size_mb < 1:
+            return
+        observed = max(elapsed - self._base_latency, 0) / size_mb
+        self._seconds_per_mb += self.EWMA_ALPHA * (observed - self._seconds_per_mb)
+
+    def _resolve_state(self, file: Any) -> Any:
+        if file.state and file.state.name == "FAILED":
+            raise VideoProcessingError(f"Server failed to process file: {file.name}")
+        return file
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            due = [entry for entry in self._pending.values() if entry.next_check_at <= now and not entry.future.done()]
+            if due:
+                await asyncio.gather(*(self._check(entry) for entry in due))
+
+            # Спим до ближайшей проверки или до регистрации нового файла
+            upcoming = [entry.next_check_at for entry in self._pending.values() if not entry.future.done()]
+            if not upcoming:
+                continue
+            delay = max(min(upcoming) - time.monotonic(), 0)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, entry: _PendingFile):
+        try:
+            file = await asyncio.wait_for(entry.fetch(entry.name), timeout=self.FETCH_TIMEOUT)
+        except Exception as e:
+            # Таймаут запроса считается такой же ошибкой опроса, как сбой сети
+            reason = f"no response within {self.FETCH_TIMEOUT:.0f}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            entry.errors += 1
+            self.logger.warning(f"Failed to poll file {entry.name} ({entry.errors}/{self.MAX_FETCH_ERRORS}): {reason}")
+            if entry.errors >= self.MAX_FETCH_ERRORS and not entry.future.done():
+                entry.future.set_exception(VideoProcessingError(f"Could not get state of file {entry.name}: {reason}"))
+                return
+            file = None
+
+        now = time.monotonic()
+        if entry.future.done():
+            return
+
+        if file is not None and file.state and file.state.name != "PROCESSING":
+            if file.state.name == "ACTIVE":
+                self._observe(entry, now)
+                self.logger.info(f"File {entry.name} became ACTIVE after {now - entry.started_at:.1f}s")
+            try:
+                entry.future.set_result(self._resolve_state(file))
+            except VideoProcessingError as e:
+                entry.future.set_exception(e)
+            return
+
+        if now >= entry.deadline:
+            entry.future.set_exception(
+                VideoProcessingError(f"File {entry.name} was not processed by Gemini within {now - entry.started_at:.0f} seconds.")
+            )
+            return
+
+        if now - entry.started_at >= self._expected_duration(entry.size_bytes):
+            entry.overdue_checks += 1
+        entry.next_check_at = min(now + self._next_interval(entry, now), entry.deadline)
+
+
+# Глобальный экземпляр для всего приложения
+file_poller = FilePoller()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Скользящее окно последних задержек для расчета перцентилей."""
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+
+class RequestHedger:
+    """
+    Хеджирование запросов для снижения хвостовой задержки.
+
+    Если основной запрос не ответил за адаптивный порог (p90 недавних задержек
+    модели), отправляется второй такой же запрос. Побеждает первый успешный
+    ответ, проигравший отменяется. Доля хеджей ограничена бюджетом
+    (`budget_ratio` от числа запросов), чтобы не удваивать нагрузку на API.
+    """
+    def __init__(self, percentile: float = 0.9, min_samples: int = 20, budget_ratio: float = 0.1,
+                 min_delay: float = 0.3, max_delay: float = 10.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.logger = logging.getLogger("RequestHedger")
+
+    def _tracker(self, key: str) -> LatencyTracker:
+        return self._latencies.setdefault(key, LatencyTracker())
+
+    def _counters(self, key: str) -> Dict[str, int]:
+        return self._stats.setdefault(key, {"requests": 0, "hedges": 0, "hedge_wins": 0})
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """Порог ожидания основного запроса или None, пока статистики недостаточно."""
+        tracker = self._tracker(key)
+        if len(tracker) < self.min_samples:
+            return None
+        return min(max(tracker.percentile(self.percentile), self.min_delay), self.max_delay)
+
+    def _within_budget(self, key: str) -> bool:
+        counters = self._counters(key)
+        # +1: разрешаем первый хедж, даже если запросов еще немного
+        return counters["hedges"] < self.budget_ratio * counters["requests"] + 1
+
+    async def run(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[T]],
+        is_success: Callable[[T], bool],
+        has_capacity: Optional[Callable[[], bool]] = None
+    ) -> T:
+        """Выполняет `call`, при необходимости дублируя его, и возвращает первый успешный результат."""
+        counters = self._counters(key)
+        counters["requests"] += 1
+        started = time.monotonic()
+        primary = asyncio.create_task(call())
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await self._finish_single(key, primary, started, is_success)
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not self._within_budget(key) or (has_capacity and not has_capacity()):
+            return await self._finish_single(key, primary, started, is_success)
+
+        counters["hedges"] += 1
+        self.logger.info(f"Hedging request to {key}: no response after {delay:.2f}s")
+        hedge = asyncio.create_task(call())
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and is_success(task.result()):
+                        if task is hedge:
+                            counters["hedge_wins"] += 1
+                        self._tracker(key).record(time.monotonic() - started)
+                        return task.result()
+                if not pending:
+                    # Оба запроса неуспешны - возвращаем результат основного, как без хеджирования
+                    return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _finish_single(self, key: str, task: asyncio.Task, started: float, is_success: Callable[[Any], bool]) -> Any:
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        # Быстрые ошибки не должны занижать порог хеджирования
+        if is_success(result):
+            self._tracker(key).record(time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for key, counters in self._stats.items():
+            tracker = self._tracker(key)
+            p50, p90, p99 = (tracker.percentile(q) for q in (0.5, 0.9, 0.99))
+            result[key] = {
+                **counters,
+                "hedge_rate": round(counters["hedges"] / counters["requests"], 3) if counters["requests"] else 0.0,
+                "win_rate": round(counters["hedge_wins"] / counters["hedges"], 3) if counters["hedges"] else 0.0,
+                "p50": round(p50, 3) if p50 is not None else None,
+                "p90": round(p90, 3) if p90 is not None else None,
+                "p99": round(p99, 3) if p99 is not None else None,
+            }
+        return result
@@ -1,9 +1,11 @@
 import time
 from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 import asyncio
 
-from typing import Dict
-from core.enums import GeminiModel, RateLimits
+from typing import Dict, Iterator, Optional
+from core.enums import GeminiModel, RateLimits, TokenLimits
 
 _limiter_pool: Dict[str, 'SlidingWindowLimiter'] | None = None
 _pool_init_lock = asyncio.Lock()
@@ -119,16 +121,67 @@ async def get_concurrency_limiter_pool() -> Dict[str, ConcurrencyLimiter]:
     return _limiter_pool
 
 
+class LimiterWaitTracker:
+    """
+    Сколько времени группа параллельных запросов (например, сегменты одного видео)
+    простояла только из-за лимитеров: ни один запрос не выполнялся, но хотя бы один ждал слота.
+    """
+    __slots__ = ("waiting", "running", "blocked_since", "blocked_seconds")
+
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.blocked_since: Optional[float] = None
+        self.blocked_seconds = 0.0
+
+    def _update(self, delta_waiting: int = 0, delta_running: int = 0):
+        now = time.monotonic()
+        self.waiting += delta_waiting
+        self.running += delta_running
+        blocked = self.running == 0 and self.waiting > 0
+        if blocked and self.blocked_since is None:
+            self.blocked_since = now
+        elif not blocked and self.blocked_since is not None:
+            self.blocked_seconds += now - self.blocked_since
+            self.blocked_since = None
+
+
+_wait_tracker: ContextVar[Optional[LimiterWaitTracker]] = ContextVar("limiter_wait_tracker", default=None)
+
+
+@contextmanager
+def track_limiter_wait() -> Iterator[LimiterWaitTracker]:
+    """Считает ожидание в лимитерах всех запросов, запущенных внутри блока (в том числе в дочерних задачах)."""
+    tracker = LimiterWaitTracker()
+    token = _wait_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _wait_tracker.reset(token)
+
+
+class TokenReservation:
+    """Резерв токенов в окне TPM. После ответа уточняется фактическим расходом."""
+    __slots__ = ("timestamp", "tokens", "active")
+
+    def __init__(self, timestamp: float, tokens: int):
+        self.timestamp = timestamp
+        self.tokens = tokens
+        self.active = True
+
+
 class DualLimiter:
     """
     Комбинированный лимитер, который одновременно отслеживает:
     1. Количество одновременных запросов (с помощью семафора).
     2. Частоту запросов в минуту (с помощью скользящего окна).
+    3. Число токенов в минуту (TPM), если задан max_tokens_per_window.
 
     Это позволяет избежать как мгновенной перегрузки, так и превышения
-    официальных лимитов API в течение минуты.
+    официальных лимитов API в течение минуты. Запрос допускается, только
+    когда его оценка токенов помещается в текущее окно.
     """
-    def __init__(self, max_concurrent: int, max_per_window: int, window_size: int):
+    def __init__(self, max_concurrent: int, max_per_window: int, window_size: int, max_tokens_per_window: Optional[int] = None):
         if max_concurrent <= 0 or max_per_window <= 0:
             raise ValueError("Limiter values must be positive.")
         
@@ -140,85 +193,192 @@ class DualLimiter:
         self.max_per_window = max_per_window
         self.window_size = window_size
         self._window_lock = asyncio.Lock() # Блокировка для защиты deque
+
+        # 3. Скользящее окно токенов
+        self.max_tokens_per_window = max_tokens_per_window
+        self.token_reservations: deque = deque()
+        self.tokens_in_window = 0
+
+        # Сколько корутин и токенов сейчас ждут места в окне (для оценки очереди)
+        self.waiting = 0
+        self.waiting_tokens = 0
+
+        # Пауза после 429: до этого момента (time.time()) новые запросы к модели не выпускаются
+        self.paused_until = 0.0
         
         print(
             f"DualLimiter initialized: "
             f"{max_concurrent} concurrent requests, "
-            f"{max_per_window} requests per {window_size}s window."
+            f"{max_per_window} requests and {max_tokens_per_window or 'unlimited'} tokens per {window_size}s window."
         )
 
+    def _prune(self, current_time: float):
+        while self.requests and self.requests[0] <= current_time - self.window_size:
+            self.requests.popleft()
+        while self.token_reservations and self.token_reservations[0].timestamp <= current_time - self.window_size:
+            reservation = self.token_reservations.popleft()
+            reservation.active = False
+            self.tokens_in_window -= reservation.tokens
+
+    def _tokens_fit(self, estimated_tokens: int) -> bool:
+        if self.max_tokens_per_window is None or not self.token_reservations:
+            # Пустое окно пропускает даже запрос крупнее лимита, иначе он ждал бы вечно
+            return True
+        return self.tokens_in_window + estimated_tokens <= self.max_tokens_per_window
+
+    def _token_wait_time(self, estimated_tokens: int, current_time: float) -> float:
+        """Через сколько секунд в окне освободится достаточно токенов."""
+        freed = 0
+        for reservation in self.token_reservations:
+            freed += reservation.tokens
+            if self.tokens_in_window - freed + estimated_tokens <= self.max_tokens_per_window:
+                return (reservation.timestamp + self.window_size) - current_time
+        return (self.token_reservations[-1].timestamp + self.window_size) - current_time
+
     @asynccontextmanager
-    async def request_slot(self):
+    async def request_slot(self, estimated_tokens: int = 0):
         """
         Асинхронный контекстный менеджер для получения слота на выполнение.
 
-        Гарантирует, что перед выполнением кода будут соблюдены оба лимита.
+        Гарантирует, что перед выполнением кода будут соблюдены все лимиты.
+        Возвращает TokenReservation, который можно уточнить через record_actual_tokens.
         """
-        # --- Шаг 1: Дождаться места в скользящем окне (RPM лимит) ---
-        while True:
-            async with self._window_lock:
-                current_time = time.time()
-                
-                # Очищаем старые временные метки
-                while self.requests and self.requests[0] <= current_time - self.window_size:
-                    self.requests.popleft()
-                
-                # Если есть место в окне, резервируем его и выходим из цикла
-                if len(self.requests) < self.max_per_window:
-                    self.requests.append(current_time)
-                    break
+        tracker = _wait_tracker.get()
+        if tracker:
+            tracker._update(delta_waiting=1)
+        try:
+            # --- Шаг 1: Дождаться места в скользящих окнах (RPM и TPM лимиты) ---
+            self.waiting += 1
+            self.waiting_tokens += estimated_tokens
+            try:
+                while True:
+                    async with self._window_lock:
+                        current_time = time.time()
+                    
+                        # Очищаем старые временные метки и резервы токенов
+                        self._prune(current_time)
+                    
+                        rpm_ok = len(self.requests) < self.max_per_window
+                        tpm_ok = self._tokens_fit(estimated_tokens)
+                        paused = current_time < self.paused_until
+
+                        # Если есть место в обоих окнах, резервируем его и выходим из цикла
+                        if rpm_ok and tpm_ok and not paused:
+                            self.requests.append(current_time)
+                            reservation = TokenReservation(current_time, estimated_tokens)
+                            self.token_reservations.append(reservation)
+                            self.tokens_in_window += estimated_tokens
+                            break
+                    
+                        # Если места нет, вычисляем, сколько нужно ждать
+                        wait_time = 0.0
+                        if not rpm_ok:
+                            wait_time = (self.requests[0] + self.window_size) - current_time
+                        if not tpm_ok:
+                            wait_time = max(wait_time, self._token_wait_time(estimated_tokens, current_time))
+                        if paused:
+                            wait_time = max(wait_time, self.paused_until - current_time)
                 
-                # Если места нет, вычисляем, сколько нужно ждать
-                wait_time = (self.requests[0] + self.window_size) - current_time
-            
-            # Ждем вне блокировки, чтобы не мешать другим проверкам
-            await asyncio.sleep(wait_time + 0.01) # Добавляем небольшой буфер
+                    # Ждем вне блокировки, чтобы не мешать другим проверкам
+                    await asyncio.sleep(max(wait_time, 0) + 0.01) # Добавляем небольшой буфер
+            finally:
+                self.waiting -= 1
+                self.waiting_tokens -= estimated_tokens
 
-        # --- Шаг 2: Захватить слот на одновременное выполнение ---
-        await self.semaphore.acquire()
-        
+            # --- Шаг 2: Захватить слот на одновременное выполнение ---
+            await self.semaphore.acquire()
+        except BaseException:
+            if tracker:
+                tracker._update(delta_waiting=-1)
+            raise
+        if tracker:
+            tracker._update(delta_waiting=-1, delta_running=1)
         try:
             # Все лимиты соблюдены, можно выполнять запрос
-            yield
+            yield reservation
         finally:
             # --- Шаг 3: Освободить слот на одновременное выполнение ---
             # Слот в скользящем окне освободится сам со временем.
             self.semaphore.release()
+            if tracker:
+                tracker._update(delta_running=-1)
+
+    def has_spare_capacity(self) -> bool:
+        """Есть ли свободное место в окне прямо сейчас (никто не ждет и RPM не исчерпан)."""
+        current_time = time.time()
+        in_window = sum(1 for timestamp in self.requests if timestamp > current_time - self.window_size)
+        return self.waiting == 0 and current_time >= self.paused_until and in_window < self.max_per_window
+
+    def headroom(self) -> float:
+        """
+        Доля свободного места в окне с учетом ожидающих (1.0 - лимитер пуст).
+
+        Берется худшее из RPM и TPM; лимитер на паузе после 429 уходит в минус,
+        чтобы при выборе между лимитерами оказаться последним.
+        """
+        current_time = time.time()
+        self._prune(current_time)
+        free = 1.0 - (len(self.requests) + self.waiting) / self.max_per_window
+        if self.max_tokens_per_window:
+            free = min(free, 1.0 - (self.tokens_in_window + self.waiting_tokens) / self.max_tokens_per_window)
+        if current_time < self.paused_until:
+            free -= 1.0
+        return free
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу слотов (например, по retryDelay из ответа 429), не удерживая уже выданные."""
+        self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def record_actual_tokens(self, reservation: TokenReservation, actual_tokens: int):
+        """Заменяет оценку токенов в окне на фактический расход из usage_metadata."""
+        if reservation.active and actual_tokens:
+            self.tokens_in_window += actual_tokens - reservation.tokens
+            reservation.tokens = actual_tokens
 
 
 # --- НОВАЯ ФАБРИЧНАЯ ФУНКЦИЯ ---
 
+_dual_limiter_pool: Dict[str, DualLimiter] | None = None
+
+
 async def get_dual_limiter_pool() -> Dict[str, DualLimiter]:
     """
     Создает и возвращает пул комбинированных лимитеров (DualLimiter).
     """
-    global _limiter_pool
-    if _limiter_pool is not None:
-        return _limiter_pool
+    global _dual_limiter_pool
+    if _dual_limiter_pool is not None:
+        return _dual_limiter_pool
     
     async with _pool_init_lock:
         # Повторная проверка на случай, если другой поток уже создал пул
-        if _limiter_pool is None:
+        if _dual_limiter_pool is None:
             print("Initializing Dual Limiter Pool...")
+            _dual_limiter_pool = build_dual_limiter_pool()
             
-            # Здесь можно задать разные значения для одновременных и минутных лимитов,
-            # но для простоты используем одно и то же значение из RateLimits.
-            _limiter_pool = {
-                GeminiModel.GEMINI_2_5_PRO: DualLimiter(
-                    max_concurrent=RateLimits.RATE_LIMIT_2_5_PRO.value,
-                    max_per_window=RateLimits.RATE_LIMIT_2_5_PRO.value,
-                    window_size=RateLimits.RATE_LIMIT_WINDOW.value
-                ),
-                GeminiModel.GEMINI_2_5_FLASH: DualLimiter(
-                    max_concurrent=RateLimits.RATE_LIMIT_2_5_FLASH.value,
-                    max_per_window=RateLimits.RATE_LIMIT_2_5_FLASH.value,
-                    window_size=RateLimits.RATE_LIMIT_WINDOW.value
-                ),
-                GeminiModel.GEMINI_2_5_FLASH_LITE: DualLimiter(
-                    max_concurrent=RateLimits.RATE_LIMIT_2_5_FLASH_LITE.value,
-                    max_per_window=RateLimits.RATE_LIMIT_2_5_FLASH_LITE.value,
-                    window_size=RateLimits.RATE_LIMIT_WINDOW.value
-                ),
-            }
-            
-    return _limiter_pool
+    return _dual_limiter_pool
+
+
+def build_dual_limiter_pool() -> Dict[str, DualLimiter]:
+    """Новый набор лимитеров по моделям (например, для каждого дополнительного API-ключа свой)."""
+    # Здесь можно задать разные значения для одновременных и минутных лимитов,
+    # но для простоты используем одно и то же значение из RateLimits.
+    return {
+        GeminiModel.GEMINI_2_5_PRO: DualLimiter(
+            max_concurrent=RateLimits.RATE_LIMIT_2_5_PRO.value,
+            max_per_window=RateLimits.RATE_LIMIT_2_5_PRO.value,
+            window_size=RateLimits.RATE_LIMIT_WINDOW.value,
+            max_tokens_per_window=TokenLimits.TOKEN_LIMIT_2_5_PRO.value
+        ),
+        GeminiModel.GEMINI_2_5_FLASH: DualLimiter(
+            max_concurrent=RateLimits.RATE_LIMIT_2_5_FLASH.value,
+            max_per_window=RateLimits.RATE_LIMIT_2_5_FLASH.value,
+            window_size=RateLimits.RATE_LIMIT_WINDOW.value,
+            max_tokens_per_window=TokenLimits.TOKEN_LIMIT_2_5_FLASH.value
+        ),
+        GeminiModel.GEMINI_2_5_FLASH_LITE: DualLimiter(
+            max_concurrent=RateLimits.RATE_LIMIT_2_5_FLASH_LITE.value,
+            max_per_window=RateLimits.RATE_LIMIT_2_5_FLASH_LITE.value,
+            window_size=RateLimits.RATE_LIMIT_WINDOW.value,
+            max_tokens_per_window=TokenLimits.TOKEN_LIMIT_2_5_FLASH_LITE.value
+        ),
+    }
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+class LoopMonitor:
+    """
+    Наблюдение за event loop: лаг, зависания и профиль по запросу.
+
+    - Heartbeat-корутина каждые `interval` секунд засыпает и меряет, насколько
+      позже срока она проснулась - это и есть лаг event loop.
+    - Сторожевой поток следит за heartbeat; если loop не отвечает дольше
+      `slow_threshold`, он снимает стек потока loop прямо во время зависания
+      и пишет его в лог - видно, какой именно блокирующий вызов держит все чаты.
+    - `capture_profile` - семплирующий профайлер на заданное время: отдельный
+      поток снимает стек потока loop каждые `sample_interval` секунд и пишет
+      свернутые стеки (формат flamegraph.pl / speedscope) в файл.
+    """
+    def __init__(
+        self,
+        interval: float = 0.1,
+        slow_threshold: float = 0.5,
+        history_size: int = 600,
+        profile_dir: str = "profiles",
+        sample_interval: float = 0.005,
+        max_profile_seconds: float = 120.0
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.max_profile_seconds = max_profile_seconds
+        self._lags: deque = deque(maxlen=history_size)
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._reported_beat = 0.0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._profiling = False
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.stacks_logged = 0
+        self.profiles_written = 0
+        self.logger = logging.getLogger("LoopMonitor")
+
+    def start(self):
+        """Запускает heartbeat и сторожевой поток; вызывать из работающего event loop."""
+        if self._heartbeat_task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_beat = time.monotonic()
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.slow_threshold:
+                self.stalls += 1
+                self.logger.warning(f"Event loop was blocked for {lag:.2f}s")
+
+    def _watch(self):
+        # Работает в отдельном потоке: loop заблокирован, но GIL периодически отпускается
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            if blocked_for <= self.slow_threshold or last_beat == self._reported_beat:
+                continue
+            # Один стек на зависание: следующий - только после нового heartbeat
+            self._reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self.stacks_logged += 1
+            stack = "".join(traceback.format_stack(frame))
+            self.logger.warning(f"Event loop blocked for {blocked_for:.2f}s so far, loop thread stack:\n{stack}")
+
+    async def capture_profile(self, seconds: float) -> Tuple[str, List[Tuple[str, int]]]:
+        """
+        Снимает профиль потока loop за `seconds` секунд и пишет его в файл.
+
+        Возвращает путь к файлу и самые частые функции на вершине стека.
+        Одновременно снимается только один профиль.
+        """
+        if self._loop_thread_id is None:
+            raise RuntimeError("Loop monitor is not started.")
+        if self._profiling:
+            raise RuntimeError("A profile is already being captured.")
+        seconds = max(0.1, min(seconds, self.max_profile_seconds))
+        self._profiling = True
+        try:
+            stacks, samples = await asyncio.to_thread(self._sample, seconds)
+            path = os.path.join(self.profile_dir, f"loop-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            await asyncio.to_thread(self._write_profile, path, stacks)
+        finally:
+            self._profiling = False
+        self.profiles_written += 1
+        top = Counter()
+        for stack, count in stacks.items():
+            top[stack.rsplit(";", 1)[-1]] += count
+        self.logger.info(f"Captured {samples} loop samples over {seconds:.1f}s to {path}")
+        return path, top.most_common(10)
+
+    def _sample(self, seconds: float) -> Tuple[Counter, int]:
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stacks[self._fold(frame)] += 1
+                samples += 1
+            time.sleep(self.sample_interval)
+        return stacks, samples
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    @staticmethod
+    def _write_profile(path: str, stacks: Counter):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+        return {
+            "samples": len(lags),
+            "lag_p50_ms": round(_percentile(lags, 0.50) * 1000, 1),
+            "lag_p99_ms": round(_percentile(lags, 0.99) * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "stacks_logged": self.stacks_logged,
+            "profiles_written": self.profiles_written,
+        }
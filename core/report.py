@@ -0,0 +1,24 @@
+import asyncio
+from typing import Optional
+
+
+class Report:
+    """
+    Готовый отчет, который хранится в памяти и отправляется без записи на диск.
+
+    После первой отправки Telegram возвращает `file_id` документа; он
+    сохраняется здесь, и остальные получатели того же отчета получают
+    документ по `file_id` без повторной загрузки.
+    """
+    __slots__ = ("filename", "content", "file_id", "upload_lock")
+
+    def __init__(self, filename: str, text: str):
+        self.filename = filename
+        self.content = text.encode("utf-8")
+        self.file_id: Optional[str] = None
+        # Первая отправка загружает файл; параллельные получатели ждут ее и берут file_id
+        self.upload_lock = asyncio.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.content)
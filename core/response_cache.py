@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+class ResponseCache:
+    """
+    LRU-кэш с TTL для текстовых ответов модели с объединением одинаковых запросов.
+
+    Ключ - (модель, системный промпт, нормализованный промпт). Если такой же
+    запрос уже выполняется, новый вызывающий не идет в API, а ждет результата
+    первого запроса (single-flight). Ошибочные ответы не кэшируются.
+    """
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 300, max_bytes: int = 8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key -> (expires_at, value, size_bytes)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.logger = logging.getLogger("ResponseCache")
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, prompt: str) -> str:
+        normalized = _WHITESPACE_REGEX.sub(" ", unicodedata.normalize("NFC", prompt)).strip()
+        raw = "\x1f".join((str(model), system_prompt, normalized))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        is_cacheable: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """Возвращает ответ из кэша, присоединяется к такому же запросу в полете или выполняет `compute`."""
+        cached = self._get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._on_computed(key, t, is_cacheable))
+
+        # shield: отмена одного из ожидающих не должна отменять общий запрос для остальных
+        return await asyncio.shield(task)
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, size = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _on_computed(self, key: str, task: asyncio.Task, is_cacheable: Optional[Callable[[str], bool]]):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if not isinstance(value, str) or (is_cacheable and not is_cacheable(value)):
+            return
+        self._put(key, value)
+
+    def _put(self, key: str, value: str):
+        size = len(value.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,224 @@
+import logging
+import random
+import re
+import time
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional
+
+from core.exceptions import CircuitOpenError
+
+# Признак исчерпанной дневной квоты в QuotaFailure: ретраи до конца суток бессмысленны
+DAILY_QUOTA_MARKER = "PerDay"
+_RETRY_INFO_TYPE = "type.googleapis.com/google.rpc.RetryInfo"
+_QUOTA_FAILURE_TYPE = "type.googleapis.com/google.rpc.QuotaFailure"
+_DURATION_REGEX = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+# Запасной вариант, если детали ошибки пришли только текстом
+_RETRY_DELAY_TEXT_REGEX = re.compile(r"""['"]?retryDelay['"]?\s*:\s*['"](\d+(?:\.\d+)?)s['"]""")
+_STATUS_CODE_REGEX = re.compile(r"^\s*(\d{3})\b")
+
+
+class ErrorKind(str, Enum):
+    RATE_LIMITED = "rate_limited"      # 429: ждем столько, сколько просит сервер
+    DAILY_QUOTA = "daily_quota"        # 429 с дневной квотой: сразу отказ
+    TRANSIENT = "transient"            # 5xx, таймауты, сетевые ошибки: ретрай с джиттером
+    FATAL = "fatal"                    # 4xx и прочее: ретраи не помогут
+
+
+class ErrorInfo:
+    __slots__ = ("kind", "code", "retry_delay", "quota_ids")
+
+    def __init__(self, kind: ErrorKind, code: Optional[int] = None, retry_delay: Optional[float] = None, quota_ids: Iterable[str] = ()):
+        self.kind = kind
+        self.code = code
+        self.retry_delay = retry_delay
+        self.quota_ids = tuple(quota_ids)
+
+
+def _parse_duration(value: Any) -> Optional[float]:
+    """Разбирает google.protobuf.Duration в JSON-представлении ("37s", "1.5s")."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return float(value.get("seconds", 0)) + float(value.get("nanos", 0)) / 1e9
+    if isinstance(value, str):
+        match = _DURATION_REGEX.match(value)
+        return float(match.group(1)) if match else None
+    return None
+
+
+def _error_details(exc: BaseException) -> list:
+    """Возвращает список google.rpc details из тела ошибки API (APIError.details)."""
+    body = getattr(exc, "details", None)
+    if not isinstance(body, dict):
+        return []
+    error = body.get("error", body)
+    details = error.get("details") if isinstance(error, dict) else None
+    return details if isinstance(details, list) else []
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    # httpx и прочие транспортные ошибки кода не имеют; у старых обёрток код в начале текста
+    match = _STATUS_CODE_REGEX.match(str(exc))
+    return int(match.group(1)) if match else None
+
+
+def classify_error(exc: BaseException) -> ErrorInfo:
+    """Классифицирует ошибку вызова модели по коду и структурированным деталям (RetryInfo, QuotaFailure)."""
+    code = _status_code(exc)
+    retry_delay = None
+    quota_ids = []
+    for detail in _error_details(exc):
+        if not isinstance(detail, dict):
+            continue
+        detail_type = detail.get("@type")
+        if detail_type == _RETRY_INFO_TYPE:
+            retry_delay = _parse_duration(detail.get("retryDelay"))
+        elif detail_type == _QUOTA_FAILURE_TYPE:
+            quota_ids.extend(
+                str(violation.get("quotaId", "")) for violation in detail.get("violations", []) if isinstance(violation, dict)
+            )
+    if retry_delay is None:
+        match = _RETRY_DELAY_TEXT_REGEX.search(str(exc))
+        retry_delay = float(match.group(1)) if match else None
+
+    status = getattr(exc, "status", None) or ""
+    if code == 429 or status == "RESOURCE_EXHAUSTED":
+        if any(DAILY_QUOTA_MARKER in quota_id for quota_id in quota_ids):
+            return ErrorInfo(ErrorKind.DAILY_QUOTA, 429, retry_delay, quota_ids)
+        return ErrorInfo(ErrorKind.RATE_LIMITED, 429, retry_delay, quota_ids)
+    if code is not None and (code >= 500 or code == 408):
+        return ErrorInfo(ErrorKind.TRANSIENT, code, retry_delay)
+    if code is None and (isinstance(exc, (TimeoutError, ConnectionError, OSError)) or type(exc).__module__.startswith("httpx")):
+        return ErrorInfo(ErrorKind.TRANSIENT, code)
+    return ErrorInfo(ErrorKind.FATAL, code)
+
+
+class DecorrelatedJitterBackoff:
+    """
+    Экспоненциальная задержка с декоррелированным джиттером:
+    sleep = min(cap, random(base, prev * 3)). Разносит повторы параллельных
+    запросов во времени, чтобы они не били в API одновременно.
+    """
+    def __init__(self, base: float = 1.0, cap: float = 60.0):
+        self.base = base
+        self.cap = cap
+        self._previous = base
+
+    def next_delay(self, server_delay: Optional[float] = None) -> float:
+        delay = min(self.cap, random.uniform(self.base, self._previous * 3))
+        if server_delay is not None:
+            # Сервер назвал минимальное время ожидания; джиттер только сверху
+            delay = max(delay, server_delay + random.uniform(0, self.base))
+        self._previous = delay
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для одной модели.
+
+    После `failure_threshold` подряд неудачных вызовов (5xx, таймауты) цепь
+    размыкается на `reset_timeout` секунд и вызовы сразу отклоняются с
+    CircuitOpenError. Затем пропускается один пробный вызов (half-open):
+    успех замыкает цепь, неудача снова размыкает ее.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self.logger = logging.getLogger("CircuitBreaker")
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def before_call(self) -> bool:
+        """
+        Проверяет, можно ли выполнить вызов; иначе выбрасывает CircuitOpenError.
+
+        Возвращает True, если этот вызов - пробный (half-open): только он может
+        освободить пробу через `release_probe`.
+        """
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            self.logger.info(f"Circuit for {self.name} closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                self.logger.warning(
+                    f"Circuit for {self.name} opened after {self.consecutive_failures} failures, "
+                    f"rejecting calls for {self.reset_timeout:.0f}s"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Пробный вызов завершился без вердикта (например, 429) - разрешаем следующий."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls,
+        }
+
+
+class RetryPolicy:
+    """Параметры повторов вызовов модели и предохранители по моделям."""
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def backoff(self) -> DecorrelatedJitterBackoff:
+        return DecorrelatedJitterBackoff(self.base_delay, self.max_delay)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        name = str(getattr(model, "value", model))
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            self._breakers[name] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model: breaker.stats() for model, breaker in self._breakers.items()}
@@ -1,18 +1,44 @@
-from google.genai.types import Schema, Type
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.genai.types import Schema
+
+
+def get_routing_schema() -> "Schema":
+    # SDK импортируется при первом использовании, а не при старте бота
+    from google.genai.types import Schema, Type
 
-def get_routing_schema() -> Schema:
     return Schema(
         type=Type.OBJECT,
         properties={
             'function_to_call': Schema(
                 type=Type.STRING,
-                description="Name of the function to call: 'analyze_video_content', 'get_hard_text_response', or 'get_light_text_response'."
+                description="Name of the function to call: 'analyze_video_content', 'get_hard_text_response', 'get_light_text_response', 'search_video_segments' or 'answer_video_followup'."
             ),
             'language': Schema(
                 type=Type.STRING,
                 description="The detected language of the user's request (e.g., 'Russian', 'English')."
+            ),
+            'analysis_mode': Schema(
+                type=Type.STRING,
+                description="Only for 'analyze_video_content': 'search' if the user wants to find the moment in the video where something is said or shown, otherwise 'full'."
             )
         },
         # 'text_for_next_step' больше не требуется
         required=['function_to_call', 'language']
-    )
\ No newline at end of file
+    )
+
+def get_search_probe_schema() -> "Schema":
+    """Ответ пробы сегмента в режиме поиска момента в видео."""
+    from google.genai.types import Schema, Type
+
+    return Schema(
+        type=Type.OBJECT,
+        properties={
+            'found': Schema(type=Type.BOOLEAN, description="Whether the requested moment is in this segment."),
+            'timestamp_seconds': Schema(type=Type.NUMBER, description="Time of the moment in seconds from the start of the whole video."),
+            'confidence': Schema(type=Type.NUMBER, description="Confidence from 0 to 1 that this is the requested moment."),
+            'description': Schema(type=Type.STRING, description="One sentence about what happens at this moment.")
+        },
+        required=['found', 'confidence']
+    )
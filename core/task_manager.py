@@ -1,41 +1,90 @@
 import asyncio
 import logging
-from typing import Dict, Tuple
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from core.timer_wheel import HierarchicalTimerWheel, TimerHandle, timer_wheel
 
 TaskIdentifier = Tuple[int, int]  # (chat_id, message_id)
 
+
+class TaskEntry:
+    __slots__ = ("task", "created_at", "timer")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.created_at = time.monotonic()
+        self.timer: Optional[TimerHandle] = None
+
+
 class TaskManager:
-    """Простой менеджер для отслеживания и отмены фоновых задач asyncio."""
-    def __init__(self):
-        self._tasks: Dict[TaskIdentifier, asyncio.Task] = {}
+    """
+    Простой менеджер для отслеживания и отмены фоновых задач asyncio.
+
+    Обычно задачу убирает ее владелец; на случай утечки каждая запись
+    проверяется колесом таймеров раз в `max_age_seconds` и удаляется,
+    если задача уже завершилась.
+    """
+    def __init__(self, max_age_seconds: float = 1800.0, wheel: HierarchicalTimerWheel = timer_wheel):
+        self.max_age_seconds = max_age_seconds
+        self._tasks: Dict[TaskIdentifier, TaskEntry] = {}
+        self._wheel = wheel
+        self.expired = 0
         self.logger = logging.getLogger("TaskManager")
 
     def add_task(self, identifier: TaskIdentifier, task: asyncio.Task):
         """Добавляет задачу в пул отслеживаемых."""
         self.logger.info(f"Adding task with identifier {identifier}")
-        self._tasks[identifier] = task
+        previous = self._tasks.get(identifier)
+        if previous is not None:
+            self._wheel.cancel(previous.timer)
+        entry = TaskEntry(task)
+        self._tasks[identifier] = entry
+        self._arm_expiry(identifier, entry)
 
     def cancel_task(self, identifier: TaskIdentifier) -> bool:
         """Находит и отменяет задачу по ее идентификатору."""
-        task = self._tasks.get(identifier)
-        if task and not task.done():
-            self.logger.info(f"Cancelling task with identifier {identifier}")
-            task.cancel()
-            # Удаляем сразу после запроса на отмену
-            del self._tasks[identifier]
-            return True
-        elif task:
-            # Задача уже завершилась, просто удаляем
-            del self._tasks[identifier]
-        
+        entry = self._tasks.pop(identifier, None)
+        if entry is not None:
+            self._wheel.cancel(entry.timer)
+            if not entry.task.done():
+                self.logger.info(f"Cancelling task with identifier {identifier}")
+                entry.task.cancel()
+                return True
+
         self.logger.warning(f"Task with identifier {identifier} not found or already done.")
         return False
 
     def remove_task(self, identifier: TaskIdentifier):
         """Удаляет задачу из пула (обычно после ее завершения)."""
-        if identifier in self._tasks:
+        entry = self._tasks.pop(identifier, None)
+        if entry is not None:
             self.logger.info(f"Removing finished/cancelled task {identifier}")
-            del self._tasks[identifier]
+            self._wheel.cancel(entry.timer)
+
+    def _arm_expiry(self, identifier: TaskIdentifier, entry: TaskEntry):
+        entry.timer = self._wheel.schedule(self.max_age_seconds, lambda: self._expire(identifier, entry))
+
+    def _expire(self, identifier: TaskIdentifier, entry: TaskEntry):
+        if self._tasks.get(identifier) is not entry:
+            return
+        if not entry.task.done():
+            # Задача еще работает (длинное видео) - проверим позже
+            self._arm_expiry(identifier, entry)
+            return
+        del self._tasks[identifier]
+        self.expired += 1
+        self.logger.warning(f"Task {identifier} finished without being removed; dropped by TTL")
+
+    def stats(self) -> Dict[str, Any]:
+        running = sum(1 for entry in self._tasks.values() if not entry.task.done())
+        return {
+            "tasks": len(self._tasks),
+            "running": running,
+            "expired": self.expired,
+            "approx_entry_bytes": sys.getsizeof(self._tasks) + len(self._tasks) * sys.getsizeof(TaskEntry(None)),
+        }
 
 # Создаем глобальный экземпляр, чтобы он был один на все приложение
 task_manager = TaskManager()
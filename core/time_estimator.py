@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from core.executors import run_blocking
+from core.timer_wheel import HierarchicalTimerWheel, TimerHandle, timer_wheel
+
+# Априорные параметры стадий: время = base + rate * объем.
+# Объем для download/upload/processing - мегабайты, для analysis - минуты видео.
+DEFAULT_STAGE_MODELS: Dict[str, Dict[str, float]] = {
+    "download": {"base": 3.0, "rate": 0.8, "dev": 0.4},
+    "upload": {"base": 2.0, "rate": 0.8, "dev": 0.4},
+    "processing": {"base": 2.0, "rate": 0.1, "dev": 0.1},
+    "analysis": {"base": 60.0, "rate": 4.5, "dev": 2.0},
+}
+# Если yt-dlp не вернул размер файла, оцениваем его по длительности (~2 Мбит/с)
+DEFAULT_BYTES_PER_SECOND = 250_000
+# Сколько хранится выданная оценка: предложения анализа, которые так и не подтвердили, забываются
+PENDING_ESTIMATE_TTL_SECONDS = 6 * 3600
+
+
+class TimeEstimator:
+    """
+    Оценка времени обработки видео, обучаемая на фактической телеметрии.
+
+    Для каждой стадии (скачивание, загрузка, обработка файла, анализ) хранится
+    линейная модель `base + rate * объем`, где rate и его разброс обновляются
+    EWMA по завершенным задачам. К оценке добавляется ожидание в очереди и в
+    лимитере модели; стадия анализа поэтому учится на времени за вычетом
+    ожидания в лимитере. Ошибка оценки по завершенным задачам тоже отслеживается.
+    """
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, state_path: Optional[str] = None, wheel: HierarchicalTimerWheel = timer_wheel):
+        self.state_path = state_path
+        self._models: Dict[str, Dict[str, float]] = {stage: dict(model) for stage, model in DEFAULT_STAGE_MODELS.items()}
+        # video_id -> (ожидаемое время, таймер забывания оценки)
+        self._pending_estimates: Dict[str, Tuple[float, TimerHandle]] = {}
+        self._wheel = wheel
+        self.completed_jobs = 0
+        self.mean_abs_error = 0.0  # EWMA относительной ошибки |факт - оценка| / факт
+        self.logger = logging.getLogger("TimeEstimator")
+        self._load()
+
+    @staticmethod
+    def stage_units(stage: str, duration_seconds: float, filesize_bytes: int) -> float:
+        if stage == "analysis":
+            return duration_seconds / 60
+        size = filesize_bytes or duration_seconds * DEFAULT_BYTES_PER_SECOND
+        return size / (1024 * 1024)
+
+    def estimate(self, duration_seconds: float, filesize_bytes: int = 0, wait_seconds: float = 0.0) -> Tuple[float, float, float]:
+        """Возвращает (минимум, ожидаемое, максимум) в секундах. `wait_seconds` - ожидание в очереди и лимитерах."""
+        expected = low = high = wait_seconds
+        for stage, model in self._models.items():
+            units = self.stage_units(stage, duration_seconds, filesize_bytes)
+            expected += model["base"] + model["rate"] * units
+            low += model["base"] + max(model["rate"] - model["dev"], 0) * units
+            high += model["base"] + (model["rate"] + model["dev"]) * units
+        return low, expected, high
+
+    @staticmethod
+    def limiter_wait_seconds(limiter: Any, estimated_tokens: int) -> float:
+        """Сколько придется ждать места в окне лимитера при текущей загрузке (RPM и TPM)."""
+        if limiter is None:
+            return 0.0
+        wait = 0.0
+        max_tokens = getattr(limiter, "max_tokens_per_window", None)
+        if max_tokens:
+            backlog = getattr(limiter, "tokens_in_window", 0) + getattr(limiter, "waiting_tokens", 0) + estimated_tokens
+            wait = max(wait, (backlog / max_tokens - 1) * limiter.window_size)
+        queued_requests = len(limiter.requests) + getattr(limiter, "waiting", 0)
+        wait = max(wait, (queued_requests / limiter.max_per_window - 1) * limiter.window_size)
+        return max(wait, 0.0)
+
+    def remember_estimate(self, video_id: str, expected_seconds: float):
+        self._forget_estimate(video_id)
+        handle = self._wheel.schedule(PENDING_ESTIMATE_TTL_SECONDS, lambda: self._pending_estimates.pop(video_id, None))
+        self._pending_estimates[video_id] = (expected_seconds, handle)
+
+    def _forget_estimate(self, video_id: str) -> Optional[float]:
+        pending = self._pending_estimates.pop(video_id, None)
+        if pending is None:
+            return None
+        self._wheel.cancel(pending[1])
+        return pending[0]
+
+    def record_stage(self, stage: str, duration_seconds: float, filesize_bytes: int, elapsed_seconds: float):
+        """Обновляет модель стадии по фактическому времени ее выполнения."""
+        model = self._models.get(stage)
+        units = self.stage_units(stage, duration_seconds, filesize_bytes)
+        if model is None or units <= 0:
+            return
+        observed_rate = max(elapsed_seconds - model["base"], 0) / units
+        model["dev"] += self.EWMA_ALPHA * (abs(observed_rate - model["rate"]) - model["dev"])
+        model["rate"] += self.EWMA_ALPHA * (observed_rate - model["rate"])
+
+    async def record_job(self, video_id: str, actual_seconds: float):
+        """Сравнивает фактическую длительность задачи с выданной пользователю оценкой."""
+        expected = self._forget_estimate(video_id)
+        if expected is not None and actual_seconds > 0:
+            error = abs(actual_seconds - expected) / actual_seconds
+            self.completed_jobs += 1
+            self.mean_abs_error += self.EWMA_ALPHA * (error - self.mean_abs_error) if self.completed_jobs > 1 else error
+            self.logger.info(
+                f"Job {video_id}: estimated {expected:.0f}s, actual {actual_seconds:.0f}s, "
+                f"error {error:.0%} (mean {self.mean_abs_error:.0%} over {self.completed_jobs} jobs)"
+            )
+        await run_blocking("disk", self._save)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": {stage: {k: round(v, 3) for k, v in model.items()} for stage, model in self._models.items()},
+            "completed_jobs": self.completed_jobs,
+            "mean_abs_error": round(self.mean_abs_error, 3),
+        }
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            for stage, model in state.get("models", {}).items():
+                if stage in self._models:
+                    self._models[stage].update({k: float(v) for k, v in model.items() if k in ("base", "rate", "dev")})
+            self.completed_jobs = int(state.get("completed_jobs", 0))
+            self.mean_abs_error = float(state.get("mean_abs_error", 0.0))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Failed to load estimator state from {self.state_path}: {e}")
+
+    def _save(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump({**self.stats(), "saved_at": int(time.time())}, f, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Failed to save estimator state to {self.state_path}: {e}")
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import math
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+TimerCallback = Callable[[], Any]
+
+
+class TimerHandle:
+    """Запланированный таймер. Отмена - O(1) удаление из слота колеса."""
+    __slots__ = ("deadline_tick", "callback", "slot", "__weakref__")
+
+    def __init__(self, deadline_tick: int, callback: TimerCallback):
+        self.deadline_tick = deadline_tick
+        self.callback = callback
+        # Слот (dict), в котором сейчас лежит таймер; None - сработал или отменен
+        self.slot: Optional[Dict[int, "TimerHandle"]] = None
+
+
+class HierarchicalTimerWheel:
+    """
+    Иерархическое колесо таймеров для TTL.
+
+    Вместо отдельной спящей корутины на каждую запись все сроки истечения
+    хранятся в `levels` колесах по `slots` слотов. Уровень 0 покрывает
+    `slots * tick` секунд, каждый следующий - в `slots` раз больше. Добавление
+    и отмена - O(1); раз в тик один фоновый цикл срабатывает текущий слот
+    уровня 0, а при обороте колеса переносит таймеры с верхнего уровня вниз.
+    """
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 64, levels: int = 3):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        self._wheels: List[List[Dict[int, TimerHandle]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._current_tick = 0
+        self._started_at = time.monotonic()
+        self._count = 0
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.cancelled = 0
+        self.logger = logging.getLogger("TimerWheel")
+
+    @property
+    def max_delay(self) -> float:
+        return self.slots ** self.levels * self.tick_seconds
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay_seconds: float, callback: TimerCallback) -> TimerHandle:
+        """Вызывает `callback` примерно через `delay_seconds` (с точностью до тика)."""
+        ticks = max(1, math.ceil(delay_seconds / self.tick_seconds))
+        if not self._count:
+            # Пустое колесо не вращается; чтобы не прокручивать пропущенные тики, переставляем его на текущий
+            self._current_tick = self._elapsed_ticks()
+        handle = TimerHandle(self._elapsed_ticks() + ticks, callback)
+        self._place(handle)
+        self._count += 1
+        self._ensure_running()
+        return handle
+
+    def cancel(self, handle: Optional[TimerHandle]) -> bool:
+        if handle is None or handle.slot is None:
+            return False
+        handle.slot.pop(id(handle), None)
+        handle.slot = None
+        self._count -= 1
+        self.cancelled += 1
+        return True
+
+    def _elapsed_ticks(self) -> int:
+        return int((time.monotonic() - self._started_at) / self.tick_seconds)
+
+    def _place(self, handle: TimerHandle):
+        remaining = max(handle.deadline_tick - self._current_tick, 1)
+        level = 0
+        span = self.slots
+        while level < self.levels - 1 and remaining >= span:
+            level += 1
+            span *= self.slots
+        # Слишком далекие сроки ставятся в последний слот верхнего уровня и переносятся при обороте
+        deadline_tick = min(handle.deadline_tick, self._current_tick + span - 1)
+        index = (deadline_tick // (span // self.slots)) % self.slots
+        slot = self._wheels[level][index]
+        slot[id(handle)] = handle
+        handle.slot = slot
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._count:
+            target = self._current_tick + 1
+            delay = self._started_at + target * self.tick_seconds - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Если цикл отстал (например, из-за блокировки event loop), догоняем все пропущенные тики
+            while self._current_tick < self._elapsed_ticks():
+                self._advance()
+
+    def _advance(self):
+        self._current_tick += 1
+        tick = self._current_tick
+        # Каскад: при обороте нижнего колеса таймеры из очередного слота верхнего уровня опускаются ниже
+        span = 1
+        for level in range(1, self.levels):
+            span *= self.slots
+            if tick % span:
+                break
+            slot = self._wheels[level][(tick // span) % self.slots]
+            handles = list(slot.values())
+            slot.clear()
+            for handle in handles:
+                self._place(handle)
+
+        slot = self._wheels[0][tick % self.slots]
+        due = [handle for handle in slot.values() if handle.deadline_tick <= tick]
+        for handle in due:
+            del slot[id(handle)]
+            handle.slot = None
+            self._count -= 1
+            self.fired += 1
+            try:
+                result = handle.callback()
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                self.logger.error(f"Timer callback failed: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        per_level = [sum(len(slot) for slot in wheel) for wheel in self._wheels]
+        slot_bytes = sum(sys.getsizeof(slot) for wheel in self._wheels for slot in wheel)
+        handle_bytes = self._count * sys.getsizeof(TimerHandle(0, lambda: None))
+        return {
+            "scheduled": self._count,
+            "per_level": per_level,
+            "fired": self.fired,
+            "cancelled": self.cancelled,
+            "approx_bytes": slot_bytes + handle_bytes,
+        }
+
+
+# Глобальный экземпляр для всего приложения
+timer_wheel = HierarchicalTimerWheel()
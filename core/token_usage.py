@@ -0,0 +1,102 @@
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, Optional
+
+# Стоимость медиа в токенах (по документации Gemini): кадр видео при обычном
+# разрешении - 258 токенов, при низком (MEDIA_RESOLUTION_LOW) - 66; звук - 32 токена в секунду.
+VIDEO_FRAME_TOKENS = {"default": 258, "low": 66}
+AUDIO_TOKENS_PER_SECOND = 32
+# Видео семплируется с частотой 1 кадр в секунду, если fps не задан явно
+DEFAULT_VIDEO_FPS = 1.0
+# Грубая оценка для текста: ~4 символа на токен
+CHARS_PER_TOKEN = 4
+# Оценка для файла без временных меток, длительность которого неизвестна
+UNKNOWN_MEDIA_TOKENS = 10_000
+
+_OFFSET_REGEX = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+def estimate_video_tokens(duration_seconds: float, fps: float = DEFAULT_VIDEO_FPS, media_resolution: str = "default", with_audio: bool = True) -> int:
+    """Оценивает число входных токенов для фрагмента видео заданной длительности."""
+    frame_tokens = VIDEO_FRAME_TOKENS.get(media_resolution, VIDEO_FRAME_TOKENS["default"])
+    tokens = duration_seconds * fps * frame_tokens
+    if with_audio:
+        tokens += duration_seconds * AUDIO_TOKENS_PER_SECOND
+    return math.ceil(tokens)
+
+
+def estimate_text_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _parse_offset(offset: Optional[str]) -> Optional[float]:
+    if not offset:
+        return None
+    match = _OFFSET_REGEX.match(offset)
+    return float(match.group(1)) if match else None
+
+
+def estimate_contents_tokens(contents: Iterable[Any], media_resolution: str = "default") -> int:
+    """
+    Оценивает входные токены запроса до отправки.
+
+    Для видео используются временные метки из `video_metadata` (start/end offset) и fps,
+    для текста - длина строки.
+    """
+    total = 0
+    for item in contents:
+        if isinstance(item, str):
+            total += estimate_text_tokens(item)
+            continue
+        text = getattr(item, "text", None)
+        if text:
+            total += estimate_text_tokens(text)
+        if getattr(item, "file_data", None) is not None or getattr(item, "inline_data", None) is not None:
+            video_metadata = getattr(item, "video_metadata", None)
+            start = _parse_offset(getattr(video_metadata, "start_offset", None)) if video_metadata else None
+            end = _parse_offset(getattr(video_metadata, "end_offset", None)) if video_metadata else None
+            if start is not None and end is not None and end > start:
+                fps = getattr(video_metadata, "fps", None) or DEFAULT_VIDEO_FPS
+                total += estimate_video_tokens(end - start, fps=fps, media_resolution=media_resolution)
+            else:
+                total += UNKNOWN_MEDIA_TOKENS
+    return total
+
+
+class TokenUsageTracker:
+    """Собирает фактический расход токенов (usage_metadata) по моделям и точность оценок."""
+    def __init__(self):
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self.logger = logging.getLogger("TokenUsageTracker")
+
+    def record(self, model: str, usage_metadata: Any, estimated_tokens: int = 0) -> int:
+        """Записывает usage_metadata ответа и возвращает число входных токенов (именно они считаются в TPM)."""
+        stats = self._usage.setdefault(str(model), {
+            "requests": 0, "prompt_tokens": 0, "candidates_tokens": 0, "cached_tokens": 0,
+            "thoughts_tokens": 0, "total_tokens": 0, "estimated_prompt_tokens": 0,
+        })
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        total_tokens = getattr(usage_metadata, "total_token_count", None) or 0
+        stats["requests"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["candidates_tokens"] += getattr(usage_metadata, "candidates_token_count", None) or 0
+        stats["cached_tokens"] += getattr(usage_metadata, "cached_content_token_count", None) or 0
+        stats["thoughts_tokens"] += getattr(usage_metadata, "thoughts_token_count", None) or 0
+        stats["total_tokens"] += total_tokens
+        stats["estimated_prompt_tokens"] += estimated_tokens
+        if estimated_tokens and prompt_tokens:
+            self.logger.debug(f"{model}: estimated {estimated_tokens} prompt tokens, actual {prompt_tokens}")
+        return prompt_tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for model, stats in self._usage.items():
+            result[model] = dict(stats)
+            if stats["estimated_prompt_tokens"]:
+                result[model]["estimate_ratio"] = round(stats["prompt_tokens"] / stats["estimated_prompt_tokens"], 3)
+        return result
+
+
+# Глобальный экземпляр для всего приложения
+token_usage = TokenUsageTracker()
@@ -1,40 +1,89 @@
 import asyncio
 import logging
+import signal
 import sys
+from functools import partial
+from typing import Any
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage  # Убедитесь, что это импортировано
 
-from agents.router_agent import RouterAgent
-from agents.orchestrator_agent import OrchestratorAgent
-from services.gemini_service import GeminiService
-from use_cases.function_handler import FunctionHandler
-from telegram.responder import TelegramResponder
 from config import Config
-from core.task_manager import task_manager
-from core.analysis_manager import analysis_manager
 
-import telegram.handlers.text as text_handler
-import telegram.handlers.callbacks as callback_handler
 
-async def main():
-    config = Config()
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        stream=sys.stdout,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
+def build_dispatcher(config: Config, bot: Bot, genai_client_factory: Any) -> Dispatcher:
+    """
+    Корень композиции: создает все сервисы один раз и собирает диспетчер.
+
+    Модули приложения импортируются здесь, а не на уровне модуля, чтобы
+    импорт main.py оставался дешевым; тяжелые SDK (google-genai, ffmpeg)
+    подгружаются еще позже - при первом использовании.
+    """
+    from agents.router_agent import RouterAgent
+    from agents.orchestrator_agent import OrchestratorAgent
+    from services.gemini_service import GeminiService
+    from services.key_pool import ApiKeyPool
+    from services.context_cache_service import ContextCacheService
+    from services.segment_index import SegmentIndex
+    from services.batch_service import BatchAnalysisService, GeminiBatchBackend, LocalBatchBackend
+    from services.media_transcoder import MediaTranscoder
+    from use_cases.function_handler import FunctionHandler
+    from telegram.responder import TelegramResponder
+    from telegram.middlewares.throttling import InboundThrottlingMiddleware
+    from core.task_manager import task_manager
+    from core.analysis_manager import analysis_manager
+    from core.time_estimator import TimeEstimator
+    from core.admission import AnalysisAdmissionQueue
+    from core.loop_monitor import LoopMonitor
+    import telegram.handlers.admin as admin_handler
+    import telegram.handlers.text as text_handler
+    import telegram.handlers.callbacks as callback_handler
+
     # 1. Создаем хранилище
     storage = MemoryStorage()
     
     # 2. Инициализация всех компонентов
-    gemini_service = GeminiService()
+    # Клиенты Gemini (по одному на API-ключ) с общим HTTP-пулом на все виды запросов
+    key_pool = ApiKeyPool(
+        [client.aio for client in genai_client_factory.get_clients()],
+        labels=[genai_client_factory.key_label(i, api_key) for i, api_key in enumerate(genai_client_factory.api_keys)]
+    )
+    gemini_service = GeminiService(async_client=key_pool.primary.client, key_pool=key_pool)
     router_agent = RouterAgent(gemini_service=gemini_service)
-    function_handler = FunctionHandler(gemini_service=gemini_service)
+    context_cache_service = ContextCacheService(key_pool=key_pool)
+    segment_index = SegmentIndex(db_path=config.segment_index_path)
+    if config.batch_backend == "local":
+        batch_backend = LocalBatchBackend()
+    else:
+        # Пакеты живут дольше процесса (опрос после перезапуска), поэтому всегда идут через основной ключ
+        batch_backend = GeminiBatchBackend(async_client=gemini_service.async_client, system_prompt=gemini_service.system_prompt)
+    batch_service = BatchAnalysisService(backend=batch_backend, store_path=config.batch_jobs_path)
+    media_transcoder = MediaTranscoder(
+        min_size_bytes=config.transcode_min_size_mb * 1024 * 1024,
+        max_height=config.transcode_max_height,
+        fps=config.transcode_fps,
+        audio_bitrate=config.transcode_audio_bitrate
+    ) if config.transcode_enabled else None
+    function_handler = FunctionHandler(
+        gemini_service=gemini_service,
+        context_cache=context_cache_service,
+        segment_index=segment_index,
+        batch_service=batch_service,
+        time_estimator=TimeEstimator(state_path=config.time_estimator_path),
+        admission=AnalysisAdmissionQueue(
+            max_concurrent=config.max_concurrent_analyses,
+            max_depth=config.max_analysis_queue_depth
+        ),
+        max_videos_per_request=config.max_videos_per_request,
+        multi_video_concurrency=config.multi_video_concurrency,
+        transcoder=media_transcoder,
+        inline_video_max_bytes=int(config.inline_video_max_mb * 1024 * 1024),
+        search_concurrency=config.search_concurrency,
+        search_min_confidence=config.search_min_confidence
+    )
     responder = TelegramResponder()
+    loop_monitor = LoopMonitor(slow_threshold=config.loop_slow_threshold, profile_dir=config.profile_dir)
     
     orchestrator = OrchestratorAgent(
         router_agent=router_agent,
@@ -42,26 +91,142 @@ async def main():
         responder=responder
     )
     
-    bot = Bot(token=config.bot_token, default=DefaultBotProperties(parse_mode=None))
+    # Готовые пакеты доставляются через оркестратор, которому для этого нужен бот
+    batch_service.on_complete = partial(orchestrator.deliver_batch_report, bot)
 
     # 3. ПЕРЕДАЕМ ХРАНИЛИЩЕ В ДИСПЕТЧЕР. ЭТО КЛЮЧЕВОЙ МОМЕНТ!
+    # Сервисы без хендлеров-потребителей тоже кладем в workflow_data, чтобы корректно остановить их в shutdown
+    throttling = InboundThrottlingMiddleware()
     dispatcher = Dispatcher(
         storage=storage,
         orchestrator=orchestrator,
         responder=responder,
         task_manager=task_manager,
-        analysis_manager=analysis_manager # Передаем для порядка
+        analysis_manager=analysis_manager,
+        gemini_service=gemini_service,
+        context_cache_service=context_cache_service,
+        segment_index=segment_index,
+        batch_service=batch_service,
+        media_transcoder=media_transcoder,
+        throttling=throttling,
+        loop_monitor=loop_monitor,
+        genai_client_factory=genai_client_factory
     )
 
+    # Ограничение входящих сообщений до роутера: склейка всплесков и один запрос на пользователя
+    dispatcher.message.middleware(throttling)
+
+    # Команды администраторов - раньше общего текстового хендлера, который принимает любой текст
+    admin_handler.setup_admins(config.admin_user_ids)
+    dispatcher.include_router(admin_handler.router)
     dispatcher.include_router(text_handler.router)
     dispatcher.include_router(callback_handler.router)
+    return dispatcher
 
-    logging.info("Starting bot...")
+
+def build_genai_client_factory(config: Config) -> Any:
+    from services.genai_client import GenaiClientFactory
+
+    return GenaiClientFactory(
+        api_key=config.gemini_api_key,
+        max_connections=config.genai_max_connections,
+        max_keepalive_connections=config.genai_max_keepalive_connections,
+        keepalive_expiry=config.genai_keepalive_expiry,
+        http2=config.genai_http2,
+        connect_timeout=config.genai_connect_timeout,
+        request_timeout=config.genai_request_timeout,
+        extra_api_keys=config.gemini_api_keys
+    )
+
+
+async def shutdown(dispatcher: Dispatcher):
+    """Останавливает фоновые сервисы и пишет итоговую статистику."""
+    from telegram.outbox import outbox
+    from core.executors import shutdown_executors
+    from core.token_usage import token_usage
+    from core.timer_wheel import timer_wheel
+
+    gemini_service = dispatcher["gemini_service"]
+    await dispatcher["batch_service"].stop()
+    logging.info(f"Response cache stats: {gemini_service.response_cache.stats()}")
+    logging.info(f"Token usage stats: {token_usage.stats()}")
+    logging.info(f"Circuit breaker stats: {gemini_service.retry_policy.stats()}")
+    logging.info(f"Hedging stats: {gemini_service.hedger.stats()}")
+    logging.info(f"API key pool stats: {gemini_service.key_pool.stats()}")
+    await outbox.close()
+    logging.info(f"Telegram outbox stats: {outbox.stats()}")
+    logging.info(f"Inbound throttling stats: {dispatcher['throttling'].stats()}")
+    if dispatcher["media_transcoder"]:
+        logging.info(f"Pre-upload transcode stats: {dispatcher['media_transcoder'].stats()}")
+    function_handler = dispatcher["orchestrator"].function_handler
+    logging.info(f"Video media paths: inline={function_handler.inline_videos}, uploaded={function_handler.uploaded_videos}")
+    logging.info(f"Moment search: probes={function_handler.search_probes}, cancelled by early stop={function_handler.search_probes_skipped}")
+    logging.info(f"Analysis manager stats: {dispatcher['analysis_manager'].stats()}")
+    logging.info(f"Task manager stats: {dispatcher['task_manager'].stats()}")
+    logging.info(f"Timer wheel stats: {timer_wheel.stats()}")
+    await dispatcher["loop_monitor"].stop()
+    logging.info(f"Event loop stats: {dispatcher['loop_monitor'].stats()}")
+    await dispatcher["context_cache_service"].close()
+    dispatcher["segment_index"].close()
+    genai_client_factory = dispatcher["genai_client_factory"]
+    logging.info(f"Gemini HTTP connection stats: {genai_client_factory.stats()}")
+    await genai_client_factory.close()
+    shutdown_executors(logging.getLogger("main"))
+
+
+def install_profile_signal(loop_monitor: Any, seconds: float):
+    """SIGUSR1 снимает профиль event loop в файл - без команды в Telegram и без передеплоя."""
+    background = set()
+
+    def _on_signal():
+        task = asyncio.create_task(_capture_on_signal(loop_monitor, seconds))
+        background.add(task)
+        task.add_done_callback(background.discard)
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, _on_signal)
+    except (AttributeError, NotImplementedError):
+        # Windows: нет SIGUSR1 / add_signal_handler, остается команда /profile
+        pass
+
+
+async def _capture_on_signal(loop_monitor: Any, seconds: float):
+    try:
+        path, _ = await loop_monitor.capture_profile(seconds)
+        logging.info(f"Loop profile written to {path} (SIGUSR1)")
+    except RuntimeError as e:
+        logging.warning(f"Loop profile on SIGUSR1 skipped: {e}")
+
+
+async def main():
+    config = Config()
+    
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stdout,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    bot = Bot(token=config.bot_token, default=DefaultBotProperties(parse_mode=None))
+    genai_client_factory = build_genai_client_factory(config)
+    # Импорт google-genai (CPU) идет в потоке параллельно с сетевым запросом delete_webhook
+    genai_client_task = asyncio.create_task(asyncio.to_thread(genai_client_factory.get_client))
     await bot.delete_webhook(drop_pending_updates=True)
-    await dispatcher.start_polling(bot)
+    await genai_client_task
+    dispatcher = build_dispatcher(config, bot, genai_client_factory)
+
+    dispatcher["loop_monitor"].start()
+    install_profile_signal(dispatcher["loop_monitor"], config.signal_profile_seconds)
+
+    logging.info("Starting bot...")
+    await dispatcher["batch_service"].start()
+    try:
+        await dispatcher.start_polling(bot)
+    finally:
+        await shutdown(dispatcher)
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        logging.info("Bot stopped!")
\ No newline at end of file
+        logging.info("Bot stopped!")
@@ -0,0 +1,118 @@
+"""
+Бенчмарк нарезки видео: прежний сегментер ffmpeg (один процесс) против
+параллельной нарезки по ключевым кадрам (utils/video_cutter.py).
+
+Для каждой реализации печатаются медианное время, число сегментов и
+отклонение длительности сегментов от целевой. Без --input генерируется
+синтетическое видео (testsrc + тон) нужной длины с ключевым кадром раз в --gop секунд.
+
+Запуск из корня репозитория (нужны ffmpeg и ffprobe в PATH):
+    python scripts/cutter_benchmark.py --input yt_videos/lecture.mp4 --segment-time 600 --runs 3
+    python scripts/cutter_benchmark.py --duration 1800 --segment-time 300
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.video_cutter import cut_video_keyframe_aligned, cut_video_to_segments  # noqa: E402
+
+
+def make_sample(path: str, duration: int, gop_seconds: int):
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size=1280x720:rate=30:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", str(30 * gop_seconds),
+            "-c:a", "aac", "-shortest", path
+        ],
+        check=True
+    )
+
+
+def probe_duration(path: str) -> float:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.strip())
+
+
+def run_legacy(source: str, work_dir: str, segment_time: int):
+    # Прежняя реализация удаляет вход, поэтому режем копию
+    copy_path = os.path.join(work_dir, "input_copy.mp4")
+    shutil.copyfile(source, copy_path)
+    out_dir = os.path.join(work_dir, "legacy")
+    started = time.perf_counter()
+    paths = cut_video_to_segments(copy_path, segment_time, out_dir)
+    elapsed = time.perf_counter() - started
+    return elapsed, [probe_duration(path) for path in paths]
+
+
+def run_parallel(source: str, work_dir: str, segment_time: int, workers: int):
+    out_dir = os.path.join(work_dir, "parallel")
+    started = time.perf_counter()
+    manifest = cut_video_keyframe_aligned(source, segment_time, out_dir, max_workers=workers or None)
+    elapsed = time.perf_counter() - started
+    return elapsed, [segment.duration for segment in manifest]
+
+
+def report(name: str, timings: list, durations: list, segment_time: int):
+    full = durations[:-1] or durations
+    deviation = max(abs(duration - segment_time) for duration in full)
+    print(
+        f"{name:>9}: median {statistics.median(timings):6.2f}s  "
+        f"(min {min(timings):.2f}s, max {max(timings):.2f}s)  "
+        f"segments={len(durations)}  max |len - target|={deviation:.2f}s  total={sum(durations):.1f}s"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="Видео для нарезки (по умолчанию генерируется синтетическое)")
+    parser.add_argument("--duration", type=int, default=1200, help="Длительность синтетического видео, с")
+    parser.add_argument("--gop", type=int, default=2, help="Интервал ключевых кадров синтетического видео, с")
+    parser.add_argument("--segment-time", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="Параллельных процессов ffmpeg (0 - по числу ядер)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cutter-bench-") as tmp_dir:
+        source = args.input
+        if not source:
+            source = os.path.join(tmp_dir, "sample.mp4")
+            print(f"Generating {args.duration}s sample video...")
+            make_sample(source, args.duration, args.gop)
+        print(f"Input: {source} ({os.path.getsize(source) / 1024 / 1024:.1f} MB, {probe_duration(source):.1f}s)")
+
+        results = {"legacy": ([], []), "parallel": ([], [])}
+        for run in range(args.runs):
+            for name in results:
+                work_dir = os.path.join(tmp_dir, f"run{run}-{name}")
+                os.makedirs(work_dir)
+                if name == "legacy":
+                    elapsed, durations = run_legacy(source, work_dir, args.segment_time)
+                else:
+                    elapsed, durations = run_parallel(source, work_dir, args.segment_time, args.workers)
+                results[name][0].append(elapsed)
+                results[name] = (results[name][0], durations)
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        for name, (timings, durations) in results.items():
+            report(name, timings, durations, args.segment_time)
+        legacy_median = statistics.median(results["legacy"][0])
+        parallel_median = statistics.median(results["parallel"][0])
+        print(f"Speedup: x{legacy_median / parallel_median:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Бенчмарк пути доставки видео в Gemini: inline-байты против Files API.
+
+Для каждого файла замеряется время до готового ответа:
+- files:  upload -> ожидание ACTIVE -> generate_content -> delete
+- inline: generate_content с Part.from_bytes (только для файлов, укладывающихся в лимит запроса)
+
+По результатам печатается рекомендуемый INLINE_VIDEO_MAX_MB - наибольший размер,
+на котором inline еще быстрее. Нужен настоящий GEMINI_API_KEY (.env или окружение);
+запросы тратят квоту.
+
+Запуск из корня репозитория:
+    python scripts/inline_benchmark.py clip_2mb.mp4 clip_8mb.mp4 clip_14mb.mp4 --runs 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from config import Config  # noqa: E402
+from core.enums import GeminiModel  # noqa: E402
+from core.file_poller import file_poller  # noqa: E402
+from services.gemini_service import INLINE_VIDEO_MAX_BYTES  # noqa: E402
+from services.genai_client import GenaiClientFactory  # noqa: E402
+
+PROMPT = "Describe this video in one sentence."
+# Жесткий лимит всего запроса; файлы больше него inline не отправить
+REQUEST_LIMIT_BYTES = 20 * 1024 * 1024
+
+
+async def via_files(client, path: str, model: str) -> float:
+    from google.genai.types import Part, UploadFileConfig
+
+    started = time.perf_counter()
+    uploaded = await client.files.upload(file=path, config=UploadFileConfig(mime_type="video/mp4"))
+    try:
+        uploaded = await file_poller.wait_until_active(
+            uploaded, fetch=lambda name: client.files.get(name=name), size_bytes=os.path.getsize(path)
+        )
+        part = Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type)
+        await client.models.generate_content(model=model, contents=[part, PROMPT])
+        return time.perf_counter() - started
+    finally:
+        await client.files.delete(name=uploaded.name)
+
+
+async def via_inline(client, path: str, model: str) -> float:
+    from google.genai.types import Part
+
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        part = Part.from_bytes(data=f.read(), mime_type="video/mp4")
+    await client.models.generate_content(model=model, contents=[part, PROMPT])
+    return time.perf_counter() - started
+
+
+async def run(paths, runs: int, model: str):
+    config = Config()
+    factory = GenaiClientFactory(api_key=config.gemini_api_key)
+    client = factory.get_client().aio
+    rows = []
+    try:
+        for path in sorted(paths, key=os.path.getsize):
+            size = os.path.getsize(path)
+            files_times, inline_times = [], []
+            for _ in range(runs):
+                files_times.append(await via_files(client, path, model))
+                if size * 4 / 3 < REQUEST_LIMIT_BYTES:
+                    inline_times.append(await via_inline(client, path, model))
+            rows.append((path, size, statistics.median(files_times), statistics.median(inline_times) if inline_times else None))
+    finally:
+        await factory.close()
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="MP4-файлы разного размера")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=GeminiModel.GEMINI_2_5_FLASH_LITE.value)
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args.paths, args.runs, args.model))
+    print(f"{'file':<40} {'MB':>6} {'files, s':>9} {'inline, s':>10}")
+    best = 0
+    for path, size, files_median, inline_median in rows:
+        inline_text = f"{inline_median:10.2f}" if inline_median is not None else f"{'n/a':>10}"
+        print(f"{os.path.basename(path):<40} {size / 1024 / 1024:6.1f} {files_median:9.2f} {inline_text}")
+        if inline_median is not None and inline_median < files_median:
+            best = max(best, size)
+    print(f"Current threshold: {INLINE_VIDEO_MAX_BYTES / 1024 / 1024:.1f} MB")
+    print(f"Recommended INLINE_VIDEO_MAX_MB: {best / 1024 / 1024:.1f}" if best else "Inline was not faster for any file")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,480 @@
+"""
+Нагрузочный тест бота целиком: синтетические апдейты идут в настоящий Dispatcher из main.py.
+
+Подменяются только внешние системы:
+- Bot API - фейковая сессия aiogram, которая записывает исходящие вызовы и отвечает
+  как Telegram (ответы проходят через check_response, как у настоящей сессии);
+- Gemini - заглушка клиента google-genai с настраиваемой задержкой;
+- yt-dlp / ffprobe - заглушки, "скачивающие" маленький файл.
+
+Роутер, оркестратор, throttling, очередь допуска, лимитеры, AnalysisManager,
+TaskManager, outbox и FSM работают как в бою.
+
+Сценарии:
+- text:   каждый чат задает текстовый вопрос;
+- video:  каждый чат присылает свою ссылку и подтверждает анализ;
+- viral:  все чаты присылают одно и то же видео (одна загрузка на всех);
+- cancel: чаты запускают анализ и отменяют его через случайное время.
+
+Для каждого сценария печатаются задержки обработки апдейтов (p50/p95/p99/max),
+лаг event loop, рост памяти (RSS) и утечки: незавершенные состояния FSM,
+задачи в TaskManager, незавершенные анализы, очередь outbox, живые asyncio-задачи.
+
+Запуск из корня репозитория:
+    python scripts/load_test.py --chats 200
+    python scripts/load_test.py --scenario viral --chats 500 --limit-scale 1
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import SendDocument, SendMessage, EditMessageText, TelegramMethod  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+FINAL_STATUSES = (
+    "✅ Обработка успешно завершена.",
+    "✅ Обработка успешно отменена.",
+    "❌ Во время обработки произошла ошибка.",
+    "🕒 Видео передано в пакетную обработку.",
+)
+SCENARIOS = ("text", "video", "viral", "cancel")
+
+
+# --- Фейковый Telegram ---
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API без сети: записывает вызовы и отвечает как Telegram."""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids: Dict[int, int] = defaultdict(lambda: 1_000_000)
+        self._waiters: Dict[Any, asyncio.Future] = {}
+        self._sent_by_chat: Dict[int, List[Dict]] = defaultdict(list)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+
+        result: Any = True
+        if isinstance(method, (SendMessage, SendDocument)):
+            chat_id = int(method.chat_id)
+            self._message_ids[chat_id] += 1
+            result = self._message(chat_id, self._message_ids[chat_id], getattr(method, "text", None) or getattr(method, "caption", None), method.reply_markup)
+            if isinstance(method, SendDocument):
+                result["document"] = {"file_id": f"doc-{chat_id}-{self._message_ids[chat_id]}", "file_unique_id": "u"}
+            self._sent_by_chat[chat_id].append(result)
+            self._resolve(("sent", chat_id), result)
+        elif isinstance(method, EditMessageText):
+            chat_id = int(method.chat_id)
+            result = self._message(chat_id, method.message_id, method.text, method.reply_markup)
+            if method.text in FINAL_STATUSES:
+                self._resolve(("final", chat_id, method.message_id), method.text)
+
+        payload = json.dumps({"ok": True, "result": result}, default=str)
+        return self.check_response(bot=bot, method=method, status_code=200, content=payload).result
+
+    @staticmethod
+    def _message(chat_id: int, message_id: int, text: Optional[str], reply_markup: Any) -> Dict:
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 42, "is_bot": True, "first_name": "bot"},
+        }
+        if text:
+            message["text"] = text
+        if reply_markup is not None:
+            message["reply_markup"] = reply_markup.model_dump(exclude_none=True)
+        return message
+
+    def _resolve(self, key: Any, value: Any):
+        waiter = self._waiters.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(value)
+
+    def expect(self, key: Any) -> asyncio.Future:
+        """Фьючерс, который завершится при следующем событии с этим ключом."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        return waiter
+
+    def sent_count(self, chat_id: int) -> int:
+        return len(self._sent_by_chat[chat_id])
+
+    def find_button(self, chat_id: int, prefix: str) -> Optional[tuple]:
+        """Последнее сообщение чата с кнопкой, callback_data которой начинается с `prefix`."""
+        for message in reversed(self._sent_by_chat[chat_id]):
+            for row in message.get("reply_markup", {}).get("inline_keyboard", []):
+                for button in row:
+                    if button.get("callback_data", "").startswith(prefix):
+                        return message, button["callback_data"]
+        return None
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url: str, headers: Optional[Dict] = None, timeout: int = 30, chunk_size: int = 65536, raise_for_status: bool = True):
+        yield b""
+
+
+# --- Заглушка Gemini ---
+
+class StubGenai:
+    """Минимальный `Client.aio` google-genai: generate_content, files, caches."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+        self.files = SimpleNamespace(upload=self.upload, get=self.get, delete=self.delete)
+        self.caches = SimpleNamespace(create=self.create_cache, delete=self.delete)
+
+    async def _delay(self, scale: float = 1.0):
+        await asyncio.sleep(random.expovariate(1 / (self.latency * scale)) if self.latency else 0)
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> Any:
+        self.calls["generate_content"] += 1
+        prompt = contents[-1] if isinstance(contents, list) else contents
+        if config is not None and getattr(config, "response_mime_type", None) == "application/json":
+            await self._delay(0.3)
+            function = "analyze_video_content" if "youtu" in str(prompt) else "get_light_text_response"
+            text = json.dumps({"function_to_call": function, "language": "English"})
+        else:
+            await self._delay()
+            text = "Synthetic analysis. " * 20
+        usage = SimpleNamespace(prompt_token_count=1000, total_token_count=1200, candidates_token_count=200)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def upload(self, file: str, config: Any = None) -> Any:
+        self.calls["files.upload"] += 1
+        await self._delay()
+        return self._file(f"files/{random.getrandbits(48):x}")
+
+    async def get(self, name: str) -> Any:
+        self.calls["files.get"] += 1
+        return self._file(name)
+
+    async def delete(self, name: str) -> None:
+        self.calls["delete"] += 1
+
+    async def create_cache(self, model: str, config: Any = None) -> Any:
+        self.calls["caches.create"] += 1
+        await self._delay(0.5)
+        return SimpleNamespace(name=f"cachedContents/{random.getrandbits(48):x}")
+
+    @staticmethod
+    def _file(name: str) -> Any:
+        return SimpleNamespace(name=name, uri=f"https://stub/{name}", mime_type="video/mp4", state=SimpleNamespace(name="ACTIVE"))
+
+
+class StubGenaiClientFactory:
+    api_keys = ["stub-key"]
+
+    def __init__(self, latency: float):
+        self.aio = StubGenai(latency)
+
+    def get_client(self) -> Any:
+        return self
+
+    def get_clients(self) -> List[Any]:
+        return [self]
+
+    @staticmethod
+    def key_label(index: int, api_key: str) -> str:
+        return f"key{index + 1}"
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.aio.calls)
+
+    async def close(self):
+        pass
+
+
+def install_media_stubs(tmp_dir: str, video_seconds: float, download_latency: float) -> Dict[str, int]:
+    """Подменяет yt-dlp и ffprobe: "скачивание" создает маленький файл (идет inline, без Files API)."""
+    import ffmpeg
+    import use_cases.function_handler as function_handler
+
+    counters = defaultdict(int)
+
+    def get_info(url: str) -> Dict:
+        counters["metadata"] += 1
+        time.sleep(download_latency / 10)
+        return {"duration": video_seconds, "filesize": 1024 * 1024}
+
+    def download(url: str) -> str:
+        counters["downloads"] += 1
+        time.sleep(download_latency)
+        path = os.path.join(tmp_dir, f"{url.rsplit('=', 1)[-1]}-{random.getrandbits(32):x}.mp4")
+        with open(path, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        return path
+
+    function_handler.get_yt_video_info = get_info
+    function_handler.download_yt_video = download
+    function_handler.get_yt_playlist_video_ids = lambda url, limit=50: []
+    ffmpeg.probe = lambda path, **kwargs: {"format": {"duration": str(video_seconds)}}
+    return counters
+
+
+def scale_limits(scale: float):
+    """Поднимает лимиты моделей в `scale` раз (1 - боевые лимиты free tier)."""
+    import core.limiter as limiter
+    from core.enums import GeminiModel, RateLimits, TokenLimits
+
+    limits = {
+        GeminiModel.GEMINI_2_5_PRO: (RateLimits.RATE_LIMIT_2_5_PRO, TokenLimits.TOKEN_LIMIT_2_5_PRO),
+        GeminiModel.GEMINI_2_5_FLASH: (RateLimits.RATE_LIMIT_2_5_FLASH, TokenLimits.TOKEN_LIMIT_2_5_FLASH),
+        GeminiModel.GEMINI_2_5_FLASH_LITE: (RateLimits.RATE_LIMIT_2_5_FLASH_LITE, TokenLimits.TOKEN_LIMIT_2_5_FLASH_LITE),
+    }
+    limiter._dual_limiter_pool = {
+        model: limiter.DualLimiter(
+            max_concurrent=max(int(rate.value * scale), 1),
+            max_per_window=max(int(rate.value * scale), 1),
+            window_size=RateLimits.RATE_LIMIT_WINDOW.value,
+            max_tokens_per_window=int(tokens.value * scale)
+        )
+        for model, (rate, tokens) in limits.items()
+    }
+
+
+# --- Метрики ---
+
+class LoopLagSampler:
+    """Лаг event loop: насколько позже запланированного просыпается периодическая корутина."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return self.samples
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - started - self.interval, 0.0))
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return f"p50={pick(.5) * 1000:.0f}ms p95={pick(.95) * 1000:.0f}ms p99={pick(.99) * 1000:.0f}ms max={ordered[-1] * 1000:.0f}ms"
+
+
+# --- Драйвер ---
+
+class LoadTest:
+    def __init__(self, dispatcher, bot: Bot, session: RecordingSession, timeout: float):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.session = session
+        self.timeout = timeout
+        self._update_id = 0
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, int] = defaultdict(int)
+
+    async def feed(self, kind: str, update: Dict):
+        self._update_id += 1
+        update = Update.model_validate({"update_id": self._update_id, **update}, context={"bot": self.bot})
+        started = time.perf_counter()
+        await self.dispatcher.feed_update(self.bot, update)
+        self.latencies[kind].append(time.perf_counter() - started)
+
+    async def send_text(self, chat_id: int, text: str):
+        await self.feed("message", {"message": {
+            "message_id": random.getrandbits(20), "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        }})
+
+    async def press(self, chat_id: int, message: Dict, data: str):
+        await self.feed("callback", {"callback_query": {
+            "id": str(random.getrandbits(48)), "chat_instance": str(chat_id), "data": data, "message": message,
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        }})
+
+    async def text_chat(self, chat_id: int):
+        # feed_update возвращается, когда хендлер отработал: "Получено..." и сам ответ уже отправлены
+        await self.send_text(chat_id, f"What is the capital of country #{chat_id}?")
+        self.outcomes["answered" if self.session.sent_count(chat_id) >= 2 else "no_answer"] += 1
+
+    async def video_chat(self, chat_id: int, video_id: str, cancel_after: Optional[float] = None):
+        await self.send_text(chat_id, f"Summarize https://www.youtube.com/watch?v={video_id}")
+        found = self.session.find_button(chat_id, "vid:start:")
+        if not found:
+            self.outcomes["no_confirmation"] += 1
+            return
+        message, data = found
+        final = self.session.expect(("final", chat_id, message["message_id"]))
+        await self.press(chat_id, message, data)
+        if cancel_after is not None:
+            await asyncio.sleep(cancel_after)
+            await self.press(chat_id, message, f"cancel:{chat_id}:{message['message_id']}")
+        try:
+            status = await asyncio.wait_for(final, self.timeout)
+            self.outcomes[status] += 1
+        except asyncio.TimeoutError:
+            self.outcomes["timeout"] += 1
+
+    async def run(self, scenario: str, chat_ids: List[int]):
+        if scenario == "text":
+            jobs = [self.text_chat(chat_id) for chat_id in chat_ids]
+        elif scenario == "video":
+            jobs = [self.video_chat(chat_id, f"v{chat_id:010d}"[-11:]) for chat_id in chat_ids]
+        elif scenario == "viral":
+            jobs = [self.video_chat(chat_id, "viralVideo1") for chat_id in chat_ids]
+        else:
+            jobs = [self.video_chat(chat_id, f"c{chat_id:010d}"[-11:], cancel_after=random.uniform(0.1, 2.0)) for chat_id in chat_ids]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.outcomes[f"error: {type(result).__name__}"] += 1
+
+
+async def settle(timeout: float = 30.0):
+    """Ждет, пока outbox опустеет и фоновая работа утихнет."""
+    from telegram.outbox import outbox
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and outbox.queued_count:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(0.5)
+
+
+def leak_report(dispatcher, baseline_tasks: int) -> Dict[str, Any]:
+    from telegram.outbox import outbox
+    from telegram.states import ProcessingState
+
+    records = dispatcher.storage.storage.values()
+    return {
+        "fsm_processing_states": sum(1 for record in records if record.state == ProcessingState.is_processing.state),
+        "fsm_records": len(dispatcher.storage.storage),
+        "task_manager_tasks": dispatcher["task_manager"].stats()["tasks"],
+        "analyses_in_progress": dispatcher["analysis_manager"].stats()["in_progress"],
+        "outbox_queued": outbox.queued_count,
+        "asyncio_tasks_delta": len(asyncio.all_tasks()) - baseline_tasks,
+    }
+
+
+async def main_async(args) -> int:
+    import main as app
+
+    tmp_dir = tempfile.mkdtemp(prefix="load-test-")
+    # Фиктивные секреты и временные файлы состояния: тест не ходит в сеть и не трогает рабочие данные
+    os.environ.setdefault("BOT_TOKEN", "123456:load-test")
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    os.environ["SEGMENT_INDEX_PATH"] = os.path.join(tmp_dir, "segment_index.db")
+    os.environ["BATCH_JOBS_PATH"] = os.path.join(tmp_dir, "batch_jobs.json")
+    os.environ["TIME_ESTIMATOR_PATH"] = os.path.join(tmp_dir, "time_estimator.json")
+    os.environ["BATCH_BACKEND"] = "local"
+
+    media_counters = install_media_stubs(tmp_dir, args.video_seconds, args.download_latency)
+    scale_limits(args.limit_scale)
+
+    config = app.Config()
+    session = RecordingSession(args.telegram_latency)
+    bot = Bot(token=config.bot_token, session=session)
+    genai_factory = StubGenaiClientFactory(args.gemini_latency)
+    dispatcher = app.build_dispatcher(config, bot, genai_factory)
+    driver = LoadTest(dispatcher, bot, session, args.timeout)
+
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    lag_sampler = LoopLagSampler()
+    baseline_tasks = len(asyncio.all_tasks())
+    failed = False
+    for index, scenario in enumerate(scenarios):
+        driver.latencies.clear()
+        driver.outcomes.clear()
+        downloads_before = media_counters["downloads"]
+        gc.collect()
+        rss_before = rss_bytes()
+        lag_sampler.start()
+        started = time.perf_counter()
+        # Отдельный диапазон чатов на сценарий, чтобы состояние FSM прошлых сценариев не мешало
+        chat_ids = [100_000 * (index + 1) + i for i in range(args.chats)]
+        await driver.run(scenario, chat_ids)
+        elapsed = time.perf_counter() - started
+        await settle()
+        lag = await lag_sampler.stop()
+        gc.collect()
+        leaks = leak_report(dispatcher, baseline_tasks)
+
+        print(f"\n=== {scenario}: {args.chats} chats in {elapsed:.1f}s ===")
+        for kind, values in driver.latencies.items():
+            print(f"  {kind:<9} {len(values):>5} updates  {percentiles(values)}")
+        print(f"  loop lag  {percentiles(lag)}")
+        print(f"  memory    RSS {rss_before / 1e6:.1f} MB -> {rss_bytes() / 1e6:.1f} MB")
+        print(f"  outcomes  {dict(driver.outcomes)}")
+        print(f"  downloads {media_counters['downloads'] - downloads_before}")
+        print(f"  admission {dispatcher['orchestrator'].function_handler.admission.stats()}")
+        print(f"  leaks     {leaks}")
+        if leaks["fsm_processing_states"] or leaks["task_manager_tasks"] or leaks["analyses_in_progress"] or driver.outcomes.get("timeout"):
+            failed = True
+
+    print(f"\nTelegram calls: {dict(session.calls)}")
+    print(f"Gemini calls:   {genai_factory.stats()}")
+    await app.shutdown(dispatcher)
+    await bot.session.close()
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("all",) + SCENARIOS, default="all")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Средняя задержка ответа Gemini, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Средняя задержка Bot API, с")
+    parser.add_argument("--download-latency", type=float, default=0.5, help="Время 'скачивания' видео, с")
+    parser.add_argument("--video-seconds", type=float, default=1500, help="Длительность синтетического видео, с")
+    parser.add_argument("--limit-scale", type=float, default=100, help="Множитель лимитов моделей (1 - боевые)")
+    parser.add_argument("--timeout", type=float, default=600, help="Сколько ждать завершения одного чата, с")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, stream=sys.stderr, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Бенчмарк запуска бота.
+
+1. `python -X importtime -c "import main"` - самые тяжелые модули по суммарному времени импорта.
+2. Время до готовности к первому апдейту: от запуска процесса до собранного диспетчера
+   (импорт main, создание клиента Gemini и всех сервисов), без обращений к сети.
+
+Завершается с кодом 1, если время до готовности превышает бюджет.
+
+Запуск из корня репозитория:
+    python scripts/startup_benchmark.py --budget 5.0 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_REGEX = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+READY_SNIPPET = """
+import asyncio
+import main
+from aiogram import Bot
+
+async def build():
+    config = main.Config()
+    bot = Bot(token=config.bot_token)
+    genai_client_factory = main.build_genai_client_factory(config)
+    await asyncio.to_thread(genai_client_factory.get_client)
+    main.build_dispatcher(config, bot, genai_client_factory)
+    print("READY", flush=True)
+    await bot.session.close()
+    await genai_client_factory.close()
+
+asyncio.run(build())
+"""
+
+
+def child_env(tmp_dir: str) -> dict:
+    env = dict(os.environ)
+    # Фиктивные секреты и временные файлы состояния: бенчмарк не ходит в сеть и не трогает рабочие данные
+    env.setdefault("BOT_TOKEN", "123456:benchmark")
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env["SEGMENT_INDEX_PATH"] = os.path.join(tmp_dir, "segment_index.db")
+    env["BATCH_JOBS_PATH"] = os.path.join(tmp_dir, "batch_jobs.json")
+    env["TIME_ESTIMATOR_PATH"] = os.path.join(tmp_dir, "time_estimator.json")
+    return env
+
+
+def import_profile(env: dict, top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    total_us = sum(cumulative for cumulative, _, depth, _ in modules if depth == 0)
+    print(f"import main: {total_us / 1e6:.3f}s total")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative, self_us, _, name in sorted(modules, reverse=True)[:top]:
+        print(f"{cumulative / 1e6:>11.3f}s {self_us / 1e6:>9.3f}s  {name}")
+    heavy_loaded = [name for name in ("google.genai", "ffmpeg") if any(module == name for _, _, _, module in modules)]
+    if heavy_loaded:
+        print(f"WARNING: heavy SDKs imported eagerly by main: {', '.join(heavy_loaded)}")
+
+
+def time_to_ready(env: dict, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-c", READY_SNIPPET], cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True)
+        for line in process.stdout:
+            if line.strip() == "READY":
+                timings.append(time.perf_counter() - started)
+                break
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"Startup snippet failed with exit code {process.returncode}")
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=5.0, help="Бюджет времени до готовности, секунды")
+    parser.add_argument("--runs", type=int, default=3, help="Число запусков (берется медиана)")
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых тяжелых модулей показать")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = child_env(tmp_dir)
+        import_profile(env, args.top)
+        ready = time_to_ready(env, args.runs)
+
+    print(f"\ntime to first update (median of {args.runs}): {ready:.3f}s, budget {args.budget:.3f}s")
+    if ready > args.budget:
+        print("FAIL: startup is over budget")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
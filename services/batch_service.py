@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.executors import run_blocking
+
+# Описание одного запроса пакета: {"start": int, "end": int, "prompt": str}
+SegmentRequest = Dict[str, Any]
+
+
+class BatchState(str, Enum):
+    PENDING = "pending"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class BatchPollResult:
+    __slots__ = ("state", "texts", "error")
+
+    def __init__(self, state: BatchState, texts: Optional[List[Optional[str]]] = None, error: Optional[str] = None):
+        self.state = state
+        self.texts = texts or []
+        self.error = error
+
+
+# Получает задачу и итог пакета: SUCCEEDED с ответами по сегментам или FAILED с причиной
+BatchCompletionHandler = Callable[[Dict[str, Any], BatchPollResult], Awaitable[None]]
+
+
+class GeminiBatchBackend:
+    """Отправляет запросы через Gemini Batch API (пакетная цена, не расходует интерактивные лимиты)."""
+    name = "gemini"
+
+    _FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+    def __init__(self, async_client: Any, system_prompt: str):
+        self.async_client = async_client
+        self.system_prompt = system_prompt
+
+    async def submit(self, model: str, file_uri: str, mime_type: str, requests: List[SegmentRequest], display_name: str) -> str:
+        from google.genai.types import Content, CreateBatchJobConfig, FileData, GenerateContentConfig, InlinedRequest, Part, VideoMetadata
+
+        inlined_requests = []
+        for request in requests:
+            video_part = Part(
+                file_data=FileData(file_uri=file_uri, mime_type=mime_type),
+                video_metadata=VideoMetadata(start_offset=f"{request['start']}s", end_offset=f"{request['end']}s")
+            )
+            inlined_requests.append(InlinedRequest(
+                contents=[Content(role="user", parts=[video_part, Part.from_text(text=request["prompt"])])],
+                config=GenerateContentConfig(system_instruction=self.system_prompt)
+            ))
+        batch_job = await self.async_client.batches.create(
+            model=model,
+            src=inlined_requests,
+            config=CreateBatchJobConfig(display_name=display_name)
+        )
+        return batch_job.name
+
+    async def poll(self, batch_name: str) -> BatchPollResult:
+        batch_job = await self.async_client.batches.get(name=batch_name)
+        state = batch_job.state.name if batch_job.state else "JOB_STATE_UNSPECIFIED"
+        if state in self._FAILED_STATES:
+            return BatchPollResult(BatchState.FAILED, error=str(batch_job.error or state))
+        if state != "JOB_STATE_SUCCEEDED":
+            return BatchPollResult(BatchState.PENDING)
+
+        texts: List[Optional[str]] = []
+        for inlined_response in (batch_job.dest.inlined_responses or []) if batch_job.dest else []:
+            if inlined_response.response is not None:
+                texts.append(inlined_response.response.text)
+            else:
+                texts.append(None)
+        return BatchPollResult(BatchState.SUCCEEDED, texts=texts)
+
+
+class LocalBatchBackend:
+    """
+    Локальная замена Batch API для разработки и тестов.
+
+    Ничего не отправляет в сеть: пакет "выполняется" в памяти через `delay`
+    секунд, а ответы формирует `responder` (по умолчанию - заглушка).
+    """
+    name = "local"
+
+    def __init__(self, delay: float = 1.0, responder: Optional[Callable[[SegmentRequest], Awaitable[str]]] = None):
+        self.delay = delay
+        self.responder = responder
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def submit(self, model: str, file_uri: str, mime_type: str, requests: List[SegmentRequest], display_name: str) -> str:
+        batch_name = f"local-batches/{uuid.uuid4().hex}"
+        self._jobs[batch_name] = {"ready_at": time.monotonic() + self.delay, "requests": requests, "texts": None}
+        return batch_name
+
+    async def poll(self, batch_name: str) -> BatchPollResult:
+        job = self._jobs.get(batch_name)
+        if job is None:
+            return BatchPollResult(BatchState.FAILED, error="Unknown local batch job (lost after restart?)")
+        if time.monotonic() < job["ready_at"]:
+            return BatchPollResult(BatchState.PENDING)
+        if job["texts"] is None:
+            job["texts"] = [
+                await self.responder(request) if self.responder else f"Local batch response for {request['start']}s - {request['end']}s."
+                for request in job["requests"]
+            ]
+        return BatchPollResult(BatchState.SUCCEEDED, texts=job["texts"])
+
+
+class BatchAnalysisService:
+    """
+    Пакетный ("прислать позже") анализ длинных видео.
+
+    Запросы по всем сегментам видео отправляются одним пакетом. Дескриптор
+    пакета сохраняется на диск, фоновый цикл опрашивает незавершенные пакеты
+    (в том числе после перезапуска бота) и по готовности передает итог
+    в `on_complete` для сборки и доставки отчета (или сообщения о неудаче).
+    """
+    POLL_INTERVAL_SECONDS = 60
+
+    def __init__(self, backend: Any, store_path: str, on_complete: Optional[BatchCompletionHandler] = None):
+        self.backend = backend
+        self.store_path = store_path
+        self.on_complete = on_complete
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._poll_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger("BatchAnalysisService")
+
+    async def start(self):
+        """Загружает сохраненные пакеты и запускает фоновый опрос."""
+        self._jobs = await run_blocking("disk", self._load_jobs)
+        if self._jobs:
+            self.logger.info(f"Resuming {len(self._jobs)} pending batch job(s)")
+        self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._poll_task:
+            self._poll_task.cancel()
+
+    async def submit(
+        self, model: str, video_id: str, chat_id: int, file_uri: str, mime_type: str,
+        prompt: str, language: str, requests: List[SegmentRequest]
+    ) -> str:
+        batch_name = await self.backend.submit(model, file_uri, mime_type, requests, display_name=f"video-{video_id}")
+        self._jobs[batch_name] = {
+            "batch_name": batch_name,
+            "backend": self.backend.name,
+            "video_id": video_id,
+            "chat_id": chat_id,
+            "prompt": prompt,
+            "language": language,
+            "segments": [[request["start"], request["end"]] for request in requests],
+            "created_at": int(time.time()),
+        }
+        await run_blocking("disk", self._save_jobs, dict(self._jobs))
+        self.logger.info(f"Submitted batch {batch_name} for video {video_id} ({len(requests)} requests)")
+        return batch_name
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._jobs)
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL_SECONDS)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                self.logger.error(f"Batch polling failed: {e}", exc_info=True)
+
+    async def poll_once(self):
+        finished = []
+        for batch_name, job in list(self._jobs.items()):
+            if job.get("backend") != self.backend.name:
+                # Пакет отправлен через другой бэкенд (его сменили в настройках): опросить его нечем,
+                # поэтому считаем пакет неудачным, сообщаем пользователю и удаляем, а не пропускаем вечно
+                result = BatchPollResult(
+                    BatchState.FAILED,
+                    error=f"submitted via backend {job.get('backend')!r}, configured backend is {self.backend.name!r}"
+                )
+            else:
+                try:
+                    result = await self.backend.poll(batch_name)
+                except Exception as e:
+                    self.logger.warning(f"Failed to poll batch {batch_name}: {e}")
+                    continue
+            if result.state == BatchState.PENDING:
+                continue
+
+            finished.append(batch_name)
+            if result.state == BatchState.FAILED:
+                self.logger.error(f"Batch {batch_name} for video {job['video_id']} failed: {result.error}")
+            else:
+                self.logger.info(f"Batch {batch_name} for video {job['video_id']} succeeded")
+            if self.on_complete:
+                try:
+                    await self.on_complete(job, result)
+                except Exception as e:
+                    self.logger.error(f"Failed to deliver batch {batch_name}: {e}", exc_info=True)
+
+        if finished:
+            for batch_name in finished:
+                self._jobs.pop(batch_name, None)
+            await run_blocking("disk", self._save_jobs, dict(self._jobs))
+
+    def _load_jobs(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.store_path):
+            return {}
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                return {job["batch_name"]: job for job in json.load(f)}
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.error(f"Failed to load batch jobs from {self.store_path}: {e}")
+            return {}
+
+    def _save_jobs(self, jobs: Dict[str, Dict[str, Any]]):
+        tmp_path = f"{self.store_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(jobs.values()), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.store_path)
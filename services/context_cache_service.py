@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+
+from core.enums import GeminiModel
+from services.key_pool import ApiKeyPool
+
+
+class CachedVideoContext:
+    """Запись о кэше контекста Gemini, созданном для проанализированного видео."""
+    __slots__ = ("video_id", "cache_name", "model", "expires_at", "last_used_at")
+
+    def __init__(self, video_id: str, cache_name: str, model: str, ttl_seconds: int):
+        now = time.monotonic()
+        self.video_id = video_id
+        self.cache_name = cache_name
+        self.model = model
+        self.expires_at = now + ttl_seconds
+        self.last_used_at = now
+
+
+class ContextCacheService:
+    """
+    Управляет кэшами контекста (CachedContent) Gemini для видео.
+
+    После анализа видео для загруженного файла создается кэш с TTL, и
+    последующие вопросы по этому видео отвечаются по кэшу - без повторной
+    загрузки и по цене кэшированных токенов. Фоновый цикл удаляет кэши,
+    которые истекают или давно не использовались, чтобы не платить за хранение.
+    """
+    CACHE_TTL_SECONDS = 3600
+    # Окно контекста модели кэша: видео длиннее в кэш не помещается, caches.create для него всегда падает
+    MAX_CONTEXT_TOKENS = 1_048_576
+    IDLE_TIMEOUT_SECONDS = 900
+    # Запас до истечения, после которого кэш считаем уже непригодным
+    EXPIRY_MARGIN_SECONDS = 60
+    CLEANUP_INTERVAL_SECONDS = 60
+
+    def __init__(self, key_pool: ApiKeyPool, model: str = GeminiModel.GEMINI_2_5_FLASH):
+        # Кэш создается в проекте ключа, которому принадлежит файл видео, и закрепляется за ним
+        self.key_pool = key_pool
+        self.model = model
+        self.system_prompt = (
+            "You are a helpful AI assistant answering follow-up questions about the attached video. "
+            "Don't use markdown formatting in your responses, just plain text. "
+            "Always respond in the same language as the user's request, unless explicitly asked to switch languages."
+        )
+        self._caches: Dict[str, CachedVideoContext] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._creating: Set[asyncio.Task] = set()
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger("ContextCacheService")
+
+    def create_in_background(self, video_id: str, video_part: Any, estimated_tokens: int = 0):
+        """Создает кэш видео фоновой задачей, не задерживая вызывающего; видео больше окна контекста пропускаются."""
+        if estimated_tokens > self.MAX_CONTEXT_TOKENS:
+            self.logger.info(f"Skipping context cache for {video_id}: ~{estimated_tokens} tokens exceed the context window")
+            return
+        task = asyncio.create_task(self.create_for_video(video_id, video_part))
+        self._creating.add(task)
+        task.add_done_callback(self._creating.discard)
+
+    async def create_for_video(self, video_id: str, video_part: Any) -> Optional[CachedVideoContext]:
+        """Создает кэш контекста для видео (загруженного или inline) или возвращает уже существующий."""
+        lock = self._locks.setdefault(video_id, asyncio.Lock())
+        try:
+            async with lock:
+                existing = self.get(video_id)
+                if existing:
+                    return existing
+                key = await self.key_pool.choose(self.model, [video_part])
+                if key is None:
+                    self.logger.warning(f"Skipping context cache for {video_id}: daily quota for {self.model} is exhausted")
+                    return None
+                try:
+                    from google.genai.types import Content, CreateCachedContentConfig
+
+                    cache = await key.client.caches.create(
+                        model=self.model,
+                        config=CreateCachedContentConfig(
+                            display_name=f"video-{video_id}",
+                            system_instruction=self.system_prompt,
+                            contents=[Content(role="user", parts=[video_part])],
+                            ttl=f"{self.CACHE_TTL_SECONDS}s",
+                        )
+                    )
+                except Exception as e:
+                    self.logger.error(f"Failed to create context cache for {video_id}: {e}")
+                    return None
+
+                entry = CachedVideoContext(video_id, cache.name, self.model, self.CACHE_TTL_SECONDS)
+                self._caches[video_id] = entry
+                self.key_pool.pin(cache.name, key, self.CACHE_TTL_SECONDS)
+                self.logger.info(f"Created context cache {cache.name} for video {video_id}, TTL {self.CACHE_TTL_SECONDS}s")
+                self._ensure_cleanup_running()
+                return entry
+        finally:
+            # Блокировка нужна только пока есть кэш: после неудачи или пропуска она не должна копиться
+            if video_id not in self._caches and self._locks.get(video_id) is lock:
+                del self._locks[video_id]
+
+    def get(self, video_id: str) -> Optional[CachedVideoContext]:
+        """Возвращает живой кэш видео или None, если его нет или он скоро истечет."""
+        entry = self._caches.get(video_id)
+        if entry and entry.expires_at - time.monotonic() > self.EXPIRY_MARGIN_SECONDS:
+            return entry
+        return None
+
+    def touch(self, video_id: str):
+        entry = self._caches.get(video_id)
+        if entry:
+            entry.last_used_at = time.monotonic()
+
+    async def delete(self, video_id: str):
+        entry = self._caches.pop(video_id, None)
+        self._locks.pop(video_id, None)
+        if not entry:
+            return
+        key = self.key_pool.key_for(entry.cache_name)
+        self.key_pool.unpin(entry.cache_name)
+        try:
+            await key.client.caches.delete(name=entry.cache_name)
+            self.logger.info(f"Deleted context cache {entry.cache_name} for video {video_id}")
+        except Exception as e:
+            # Кэш мог уже истечь на стороне сервера
+            self.logger.warning(f"Failed to delete context cache {entry.cache_name}: {e}")
+
+    async def cleanup_expired(self):
+        """Удаляет кэши, которые истекают или простаивают дольше IDLE_TIMEOUT_SECONDS."""
+        now = time.monotonic()
+        stale = [
+            video_id for video_id, entry in self._caches.items()
+            if entry.expires_at - now <= self.EXPIRY_MARGIN_SECONDS or now - entry.last_used_at >= self.IDLE_TIMEOUT_SECONDS
+        ]
+        for video_id in stale:
+            await self.delete(video_id)
+
+    async def close(self):
+        """Удаляет все кэши (вызывается при остановке бота)."""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+        creating = list(self._creating)
+        for task in creating:
+            task.cancel()
+        await asyncio.gather(*creating, return_exceptions=True)
+        for video_id in list(self._caches):
+            await self.delete(video_id)
+
+    def _ensure_cleanup_running(self):
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        while self._caches:
+            await asyncio.sleep(self.CLEANUP_INTERVAL_SECONDS)
+            try:
+                await self.cleanup_expired()
+            except Exception as e:
+                self.logger.error(f"Context cache cleanup failed: {e}")
@@ -1,93 +1,180 @@
 import asyncio
 import json
 import logging
-import time
-from typing import List, Optional, Union, Any, Dict
+from typing import TYPE_CHECKING, List, Optional, Union, Any, Dict
 
-from google.genai import Client
-from google.genai.types import GenerateContentConfig, Schema, Part
-
-from config import Config
-from core.limiter import get_limiter_pool
+from core.token_usage import estimate_contents_tokens, token_usage
 from core.enums import GeminiModel
+from core.response_cache import ResponseCache
+from core.hedging import RequestHedger
+from core.retry_policy import ErrorKind, RetryPolicy, classify_error
+from core.exceptions import CircuitOpenError
+from services.key_pool import ApiKeyPool
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentConfig, Schema, Part
+
+# Запрос generate_content с inline-данными ограничен ~20 МБ целиком, а байты уходят в JSON в base64 (+33%),
+# поэтому сам файл должен быть заметно меньше
+INLINE_VIDEO_MAX_BYTES = 14 * 1024 * 1024
 
 class GeminiService:
-    def __init__(self):
-        config = Config()
-        self.async_client = Client(api_key=config.gemini_api_key).aio
+    ERROR_PREFIX = "An error occurred while processing the request"
+
+    DAILY_QUOTA_MESSAGE = "Дневной лимит запросов к Gemini API исчерпан. Попробуйте завтра или используйте другую модель."
+
+    def __init__(self, async_client: Any, key_pool: Optional[ApiKeyPool] = None):
+        # Асинхронный клиент (`Client.aio`) создается один раз в main.py и передается сюда;
+        # при нескольких API-ключах это клиент основного ключа, а запросы распределяет пул
+        self.async_client = async_client
+        self.key_pool = key_pool or ApiKeyPool([async_client])
+        self.response_cache = ResponseCache()
+        self.retry_policy = RetryPolicy()
+        self.hedger = RequestHedger()
         self.system_prompt = "You are a helpful and efficient AI assistant. Don't use markdown formatting in your responses, just plain text. Always respond in the same language as the user's request, unless explicitly asked to switch languages."
 
-    async def _base_generate(self, contents: List[Union[str, Part]], model: str, genai_config: GenerateContentConfig) -> Any:
+    async def _base_generate(self, contents: List[Union[str, "Part"]], model: str, genai_config: "GenerateContentConfig") -> Any:
         logger = logging.getLogger("GeminiService")
-        max_retries = 5
-        for attempt in range(max_retries):
+        breaker = self.retry_policy.breaker(model)
+        backoff = self.retry_policy.backoff()
+        # Оцениваем токены заранее, чтобы лимитер пропустил запрос только при запасе TPM
+        estimated_tokens = estimate_contents_tokens(contents)
+        max_retries = self.retry_policy.max_attempts
+        cached_content = getattr(genai_config, "cached_content", None)
+        attempt = 0
+        while attempt < max_retries:
+            # Ключ выбирается на каждой попытке: после 429 или исчерпания квоты запас мог появиться у другого
+            key = await self.key_pool.choose(model, contents, cached_content)
+            if key is None:
+                logger.critical(f"Daily quota for model {model} is exhausted on every API key usable for this request")
+                return {"error": "API_CALL_FAILED", "details": self.DAILY_QUOTA_MESSAGE}
+            limiter = key.limiters.get(model)
+            try:
+                # Разомкнутый предохранитель отклоняет вызов сразу, не занимая слот лимитера
+                is_probe = breaker.before_call()
+            except CircuitOpenError as e:
+                logger.error(str(e))
+                return {"error": "CIRCUIT_OPEN", "details": str(e), "retry_after": e.retry_after}
             try:
-                logger.info(f"Attempt {attempt+1}/{max_retries} to generate content for model {model}")
-                result = await self.async_client.models.generate_content(
-                    model=model,
-                    contents=contents,
-                    config=genai_config
-                )
+                logger.info(f"Attempt {attempt+1}/{max_retries} to generate content for model {model} (~{estimated_tokens} tokens)")
+                if limiter:
+                    async with limiter.request_slot(estimated_tokens) as reservation:
+                        result = await key.client.models.generate_content(
+                            model=model,
+                            contents=contents,
+                            config=genai_config
+                        )
+                else:
+                    reservation = None
+                    result = await key.client.models.generate_content(
+                        model=model,
+                        contents=contents,
+                        config=genai_config
+                    )
+                key.record_request(model)
+                breaker.record_success()
                 logger.info(f"Content generated successfully for model {model}")
+                if getattr(result, "usage_metadata", None):
+                    prompt_tokens = token_usage.record(model, result.usage_metadata, estimated_tokens)
+                    if limiter and reservation:
+                        limiter.record_actual_tokens(reservation, prompt_tokens)
                 return result
+            except asyncio.CancelledError:
+                # Отмена (например, проигравший хедж) - не вердикт; пробу освобождает только ее владелец
+                if is_probe:
+                    breaker.release_probe()
+                raise
             except Exception as e:
-                err_str = str(e)
-                logger.error(f"Error during generate_content (attempt {attempt+1}/{max_retries}) for model {model}: {err_str}")
-                # Проверка на дневной лимит (сразу, до любых ретраев)
-                if (
-                    'RESOURCE_EXHAUSTED' in err_str and
-                    'GenerateRequestsPerDayPerProjectPerModel-FreeTier' in err_str
-                ):
-                    logger.critical("Дневной лимит запросов к Gemini API исчерпан. Попробуйте завтра или используйте другую модель/аккаунт.")
-                    return {"error": "API_CALL_FAILED", "details": "Дневной лимит запросов к Gemini API исчерпан. Попробуйте завтра или используйте другую модель/аккаунт."}
-                # Обработка ошибки 429 (RESOURCE_EXHAUSTED)
-                if '429' in err_str or 'RESOURCE_EXHAUSTED' in err_str:
-                    limiter_pool = await get_limiter_pool()
-                    limiter = limiter_pool.get(model)
-                    if limiter and hasattr(limiter, 'requests') and limiter.requests:
-                        import time
-                        current_time = time.time()
-                        first_request_time = limiter.requests[0]
-                        window_size = limiter.window_size
-                        wait_time = (first_request_time + window_size) - current_time
-                        wait_time = max(wait_time, 1)
-                        logger.warning(f"429 RESOURCE_EXHAUSTED. Sleeping for {wait_time:.1f} seconds until window opens...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        logger.warning("429 RESOURCE_EXHAUSTED. Limiter not available, sleeping 60s...")
-                        await asyncio.sleep(60)
-                        continue
-                if (
-                    '503' in err_str or 'Service Unavailable' in err_str or
-                    '500' in err_str or '502' in err_str or
-                    'Internal Server Error' in err_str or 'Bad Gateway' in err_str
-                ):
-                    if attempt < max_retries - 1:
-                        logger.warning(f"{err_str}. Retrying after {2 ** attempt} seconds...")
-                        await asyncio.sleep(2 ** attempt)
-                        continue
-                logger.critical(f"API_CALL_FAILED for model {model}: {err_str}")
-                return {"error": "API_CALL_FAILED", "details": err_str}
+                # Сюда попадаем уже после выхода из request_slot: слот лимитера освобожден на время ожидания
+                error = classify_error(e)
+                logger.error(f"Error during generate_content (attempt {attempt+1}/{max_retries}) for model {model}: {e}")
+                if error.kind == ErrorKind.DAILY_QUOTA:
+                    # Ключ выбывает до сброса квоты, запрос сразу уходит на следующий, не тратя попытку
+                    if is_probe:
+                        breaker.release_probe()
+                    logger.critical(f"Daily quota exhausted for model {model} on {key.label}: {', '.join(error.quota_ids)}")
+                    self.key_pool.mark_exhausted(key, model)
+                    continue
+                if error.kind == ErrorKind.FATAL or attempt == max_retries - 1:
+                    # Предохранитель считает вызовы, а не попытки: одна неудача - после исчерпания повторов
+                    if error.kind == ErrorKind.TRANSIENT:
+                        breaker.record_failure()
+                    elif is_probe:
+                        breaker.release_probe()
+                    logger.critical(f"API_CALL_FAILED for model {model}: {e}")
+                    return {"error": "API_CALL_FAILED", "details": str(e)}
+
+                delay = backoff.next_delay(error.retry_delay)
+                if error.kind == ErrorKind.RATE_LIMITED:
+                    # 429 не говорит о неисправности модели; ставим на паузу лимитер модели на этом ключе,
+                    # чтобы остальные запросы через него тоже подождали, а не получили такой же отказ
+                    if is_probe:
+                        breaker.release_probe()
+                    logger.warning(f"429 RESOURCE_EXHAUSTED for model {model} on {key.label}. Retrying in {delay:.1f}s (server asked {error.retry_delay}s)")
+                    if limiter:
+                        # Ждать будет сам лимитер ключа; ключ с запасом (если есть) возьмет повтор сразу
+                        limiter.pause(delay)
+                        delay = 0.0
+                else:
+                    if is_probe:
+                        # Промежуточная ошибка - еще не вердикт вызова: на время паузы отпускаем пробу,
+                        # следующая попытка займет ее снова
+                        breaker.release_probe()
+                    logger.warning(f"Transient error {error.code} for model {model}. Retrying in {delay:.1f}s")
+                if delay:
+                    await asyncio.sleep(delay)
+            attempt += 1
+        return {"error": "API_CALL_FAILED", "details": f"No attempts left for model {model}"}
+
+    async def _hedged_generate(self, contents: List[Union[str, "Part"]], model: str, genai_config: "GenerateContentConfig") -> Any:
+        """Запрос с хеджированием: при долгом ответе отправляется дубликат, если хотя бы у одного ключа есть запас."""
+        return await self.hedger.run(
+            str(getattr(model, "value", model)),
+            lambda: self._base_generate(contents, model, genai_config),
+            is_success=lambda response: not (isinstance(response, dict) and "error" in response),
+            has_capacity=lambda: self.key_pool.has_spare_capacity(model)
+        )
+
+    async def generate_text(self, prompt: str, model: str = GeminiModel.GEMINI_2_5_FLASH, video_part: Optional["Part"] = None, cached_content: Optional[str] = None, use_cache: bool = False, hedge: bool = False) -> str:
+        if use_cache and not video_part and not cached_content:
+            # Одинаковые текстовые запросы отвечаются из кэша или объединяются с уже выполняющимся
+            key = ResponseCache.make_key(model, self.system_prompt, prompt)
+            return await self.response_cache.get_or_compute(
+                key,
+                lambda: self._generate_text(prompt, model, video_part, cached_content, hedge),
+                is_cacheable=lambda text: not text.startswith(self.ERROR_PREFIX)
+            )
+        return await self._generate_text(prompt, model, video_part, cached_content, hedge)
+
+    async def _generate_text(self, prompt: str, model: str, video_part: Optional["Part"], cached_content: Optional[str], hedge: bool = False) -> str:
+        from google.genai.types import GenerateContentConfig
 
-    async def generate_text(self, prompt: str, model: str = GeminiModel.GEMINI_2_5_FLASH, video_part: Optional[Part] = None) -> str:
         logger = logging.getLogger("GeminiService")
-        genai_config = GenerateContentConfig(system_instruction=self.system_prompt)
+        if cached_content:
+            # Системная инструкция и видео уже хранятся в кэше контекста
+            genai_config = GenerateContentConfig(cached_content=cached_content)
+        else:
+            genai_config = GenerateContentConfig(system_instruction=self.system_prompt)
         contents = []
         if video_part:
             contents.append(video_part)
         contents.append(prompt)
         try:
-            response = await self._base_generate(contents, model, genai_config)
+            if hedge:
+                response = await self._hedged_generate(contents, model, genai_config)
+            else:
+                response = await self._base_generate(contents, model, genai_config)
             if isinstance(response, dict) and "error" in response:
                 logger.error(f"Error in generate_text: {response['details']}")
-                return f"An error occurred while processing the request: {response['details']}"
+                return f"{self.ERROR_PREFIX}: {response['details']}"
             return response.text
         except Exception as e:
             logger.critical(f"Unhandled exception in generate_text: {e}")
-            return f"An error occurred while processing the request: {e}"
+            return f"{self.ERROR_PREFIX}: {e}"
+
+    async def generate_json(self, prompt: str, response_schema: "Schema", model: str = GeminiModel.GEMINI_2_5_FLASH_LITE, video_part: Optional["Part"] = None) -> Dict[str, Any]:
+        from google.genai.types import GenerateContentConfig
 
-    async def generate_json(self, prompt: str, response_schema: Schema, model: str = GeminiModel.GEMINI_2_5_FLASH_LITE, video_part: Optional[Part] = None) -> Dict[str, Any]:
         logger = logging.getLogger("GeminiService")
         genai_config = GenerateContentConfig(
             system_instruction=self.system_prompt,
@@ -0,0 +1,136 @@
+import importlib.util
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class ConnectionReuseStats:
+    """
+    Статистика переиспользования соединений общего HTTP-транспорта.
+
+    Считается через trace-расширение httpcore: каждый запрос и каждое новое
+    TCP-соединение / TLS-рукопожатие фиксируются, доля переиспользования -
+    это запросы, которым не понадобилось новое соединение.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.started":
+            self.new_connections += 1
+        elif event_name == "connection.start_tls.started":
+            self.tls_handshakes += 1
+        elif event_name == "http11.send_request_headers.started":
+            self.requests += 1
+        elif event_name == "http2.send_request_headers.started":
+            self.requests += 1
+            self.http2_requests += 1
+
+    def stats(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_requests": self.http2_requests,
+            "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+        }
+
+
+class GenaiClientFactory:
+    """
+    Единственная точка создания клиента Gemini.
+
+    Владеет одним асинхронным httpx-транспортом с настроенным пулом
+    соединений (размер, keep-alive, HTTP/2 при наличии пакета h2), который
+    используют и генерация, и Files API, и кэши контекста, и Batch API.
+    Без явного httpx-клиента SDK для async-вызовов берет aiohttp со своим
+    пулом, поэтому клиент передается в HttpOptions.httpx_async_client.
+
+    При нескольких API-ключах на каждый создается свой клиент SDK поверх того
+    же транспорта: ключ уходит заголовком запроса, соединения общие.
+    """
+    def __init__(
+        self,
+        api_key: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        http2: bool = True,
+        connect_timeout: float = 10.0,
+        request_timeout: float = 600.0,
+        extra_api_keys: Sequence[str] = ()
+    ):
+        self.api_key = api_key
+        self.api_keys: List[str] = list(dict.fromkeys([api_key, *(key for key in extra_api_keys if key)]))
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # HTTP/2 в httpx требует пакет h2; без него остаемся на HTTP/1.1 с keep-alive
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.connection_stats = ConnectionReuseStats()
+        self._clients: Optional[List[Any]] = None
+        self._httpx_client: Optional[Any] = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger("GenaiClientFactory")
+        if http2 and not self.http2:
+            self.logger.warning("HTTP/2 is enabled but the h2 package is not installed (pip install 'httpx[http2]'); using HTTP/1.1")
+
+    def get_client(self) -> Any:
+        """Создает клиенты при первом вызове (импорт SDK тяжелый, можно вызывать в потоке) и возвращает клиент основного ключа."""
+        return self.get_clients()[0]
+
+    def get_clients(self) -> List[Any]:
+        """Клиенты всех API-ключей в порядке конфигурации; первый - основной."""
+        with self._lock:
+            if self._clients is None:
+                self._clients = self._build()
+            return self._clients
+
+    @staticmethod
+    def key_label(index: int, api_key: str) -> str:
+        """Имя ключа для логов и статистики без самого ключа."""
+        return f"key{index + 1}(...{api_key[-4:]})"
+
+    def _build(self) -> List[Any]:
+        # SDK google-genai тяжелый (сотни миллисекунд на импорт), поэтому импортируется только здесь
+        import httpx
+        from google.genai import Client
+        from google.genai.types import HttpOptions
+
+        async def attach_trace(request: "httpx.Request"):
+            request.extensions["trace"] = self.connection_stats.trace
+
+        self._httpx_client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+            event_hooks={"request": [attach_trace]}
+        )
+        self.logger.info(
+            f"Gemini HTTP transport: {self.max_connections} connections "
+            f"({self.max_keepalive_connections} keep-alive, {self.keepalive_expiry:.0f}s), "
+            f"HTTP/{'2' if self.http2 else '1.1'}, {len(self.api_keys)} API key(s)"
+        )
+        # SDK передает свой таймаут в каждый запрос, перекрывая таймаут клиента, поэтому задаем его и здесь (в мс).
+        # HttpOptions у каждого клиента свои: SDK дописывает в них заголовок с ключом
+        return [
+            Client(api_key=api_key, http_options=HttpOptions(httpx_async_client=self._httpx_client, timeout=int(self.request_timeout * 1000)))
+            for api_key in self.api_keys
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"http2_enabled": self.http2, **self.connection_stats.stats()}
+
+    async def close(self):
+        if self._httpx_client is not None:
+            await self._httpx_client.aclose()
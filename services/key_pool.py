@@ -0,0 +1,181 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.limiter import DualLimiter, build_dual_limiter_pool, get_dual_limiter_pool
+from core.timer_wheel import HierarchicalTimerWheel, TimerHandle, timer_wheel
+
+# Дневные квоты Gemini API сбрасываются в полночь по тихоокеанскому времени
+QUOTA_RESET_TIMEZONE = "America/Los_Angeles"
+# Files API хранит загруженные файлы 48 часов
+FILE_PIN_TTL_SECONDS = 48 * 3600
+
+
+def next_quota_reset(now: Optional[float] = None) -> float:
+    """Момент (time.time()) ближайшего сброса дневных квот."""
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(QUOTA_RESET_TIMEZONE)
+    except Exception:
+        # Нет базы часовых поясов (tzdata): берем зимнее смещение, ошибка не больше часа
+        tz = timezone(timedelta(hours=-8))
+    current = datetime.fromtimestamp(now if now is not None else time.time(), tz)
+    midnight = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+def _model_name(model: str) -> str:
+    return str(getattr(model, "value", model))
+
+
+class ApiKey:
+    """Один API-ключ (проект): свой клиент, свои лимитеры по моделям и свой дневной счетчик."""
+    __slots__ = ("index", "label", "client", "limiters", "requests_today", "exhausted_until", "reset_at")
+
+    def __init__(self, index: int, label: str, client: Any):
+        self.index = index
+        self.label = label
+        self.client = client
+        self.limiters: Dict[str, DualLimiter] = {}
+        self.requests_today: Dict[str, int] = {}
+        # Модели, дневная квота которых на этом ключе исчерпана: модель -> момент сброса
+        self.exhausted_until: Dict[str, float] = {}
+        self.reset_at = next_quota_reset()
+
+    def _roll_day(self, now: float):
+        if now >= self.reset_at:
+            self.requests_today.clear()
+            self.exhausted_until.clear()
+            self.reset_at = next_quota_reset(now)
+
+    def is_exhausted(self, model: str, now: Optional[float] = None) -> bool:
+        self._roll_day(now or time.time())
+        return model in self.exhausted_until
+
+    def record_request(self, model: str):
+        self._roll_day(time.time())
+        name = _model_name(model)
+        self.requests_today[name] = self.requests_today.get(name, 0) + 1
+
+    def headroom(self, model: str) -> float:
+        limiter = self.limiters.get(model)
+        return limiter.headroom() if limiter else 1.0
+
+
+class ApiKeyPool:
+    """
+    Пул API-ключей Gemini: пропускная способность растет с числом ключей.
+
+    - У каждого ключа свои лимитеры (RPM/TPM) и дневной счетчик; запрос уходит
+      на ключ с наибольшим запасом в окне лимитера модели.
+    - Ключ с исчерпанной дневной квотой модели пропускается до полуночи по
+      тихоокеанскому времени, запрос повторяется на другом ключе.
+    - Загруженные файлы и кэши контекста принадлежат проекту ключа, который их
+      создал: их имена закрепляются за ключом, и запросы с ними идут только
+      через него. Закрепление снимается общим колесом таймеров по истечении срока.
+    """
+    def __init__(self, clients: List[Any], labels: Optional[List[str]] = None, wheel: HierarchicalTimerWheel = timer_wheel):
+        if not clients:
+            raise ValueError("At least one Gemini client is required.")
+        labels = labels or [f"key{i + 1}" for i in range(len(clients))]
+        self.keys = [ApiKey(i, label, client) for i, (label, client) in enumerate(zip(labels, clients))]
+        self._wheel = wheel
+        self._pins: Dict[str, Tuple[ApiKey, TimerHandle]] = {}
+        self._limiters_ready = False
+        self.failovers = 0
+        self.logger = logging.getLogger("ApiKeyPool")
+
+    @property
+    def primary(self) -> ApiKey:
+        return self.keys[0]
+
+    async def _ensure_limiters(self):
+        if self._limiters_ready:
+            return
+        # Первый ключ использует общий пул лимитеров (на него же смотрят оценки ожидания), остальные - свои
+        self.primary.limiters = await get_dual_limiter_pool()
+        for key in self.keys[1:]:
+            key.limiters = build_dual_limiter_pool()
+        self._limiters_ready = True
+
+    async def choose(self, model: str, contents: Iterable[Any] = (), cached_content: Optional[str] = None) -> Optional[ApiKey]:
+        """
+        Ключ для запроса к модели: закрепленный, если запрос ссылается на файл или кэш,
+        иначе ключ с наибольшим запасом. None - дневная квота модели исчерпана везде.
+        """
+        await self._ensure_limiters()
+        pinned = self.pinned_key(contents, cached_content)
+        if pinned is not None:
+            return None if pinned.is_exhausted(model) else pinned
+        now = time.time()
+        available = [key for key in self.keys if not key.is_exhausted(model, now)]
+        if not available:
+            return None
+        # При равном запасе выигрывает ключ с меньшим дневным расходом
+        return max(available, key=lambda key: (key.headroom(model), -key.requests_today.get(_model_name(model), 0)))
+
+    def pinned_key(self, contents: Iterable[Any] = (), cached_content: Optional[str] = None) -> Optional[ApiKey]:
+        """Ключ, которому принадлежат файлы и кэш из запроса; None - запрос ни к чему не привязан."""
+        names = [cached_content] if cached_content else []
+        for part in contents:
+            file_data = getattr(part, "file_data", None)
+            if file_data is not None and file_data.file_uri:
+                names.append(file_data.file_uri)
+        if not names:
+            return None
+        for name in names:
+            pin = self._pins.get(name)
+            if pin is not None:
+                return pin[0]
+        # Ресурс создан до появления пула или до перезапуска - раньше все шло через основной ключ
+        return self.primary
+
+    def pin(self, name: str, key: ApiKey, ttl_seconds: float = FILE_PIN_TTL_SECONDS):
+        """Закрепляет файл (URI) или кэш (имя) за ключом, который его создал."""
+        self.unpin(name)
+        handle = self._wheel.schedule(ttl_seconds, lambda: self._pins.pop(name, None))
+        self._pins[name] = (key, handle)
+
+    def unpin(self, name: str):
+        pin = self._pins.pop(name, None)
+        if pin is not None:
+            self._wheel.cancel(pin[1])
+
+    def key_for(self, name: str) -> ApiKey:
+        pin = self._pins.get(name)
+        return pin[0] if pin else self.primary
+
+    def mark_exhausted(self, key: ApiKey, model: str):
+        """Дневная квота модели на ключе исчерпана: не выбираем его для модели до сброса."""
+        key.exhausted_until[_model_name(model)] = key.reset_at
+        self.failovers += 1
+        remaining = sum(1 for other in self.keys if not other.is_exhausted(model))
+        self.logger.critical(
+            f"Daily quota for {_model_name(model)} exhausted on {key.label} after {key.requests_today.get(_model_name(model), 0)} requests today; "
+            f"{remaining} of {len(self.keys)} keys left until reset at "
+            f"{datetime.fromtimestamp(key.reset_at, timezone.utc):%Y-%m-%d %H:%M} UTC"
+        )
+
+    async def limiter_for(self, model: str) -> Optional[DualLimiter]:
+        """Лимитер модели на ключе, который сейчас выбрал бы пул (для оценки ожидания)."""
+        await self._ensure_limiters()
+        now = time.time()
+        available = [key for key in self.keys if not key.is_exhausted(model, now)] or self.keys
+        return max(available, key=lambda key: key.headroom(model)).limiters.get(model)
+
+    def has_spare_capacity(self, model: str) -> bool:
+        now = time.time()
+        return any(
+            key.limiters.get(model) is not None and key.limiters[model].has_spare_capacity()
+            for key in self.keys if not key.is_exhausted(model, now)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self.keys),
+            "pinned_resources": len(self._pins),
+            "failovers": self.failovers,
+            "requests_today": {key.label: dict(key.requests_today) for key in self.keys},
+            "exhausted": {key.label: sorted(key.exhausted_until) for key in self.keys if key.exhausted_until},
+        }
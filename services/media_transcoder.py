@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from core.executors import run_blocking
+from utils.video_transcoder import transcode_video
+
+
+class MediaTranscoder:
+    """
+    Необязательная стадия между скачиванием и загрузкой видео.
+
+    Gemini семплирует видео примерно с частотой 1 кадр в секунду, поэтому
+    1080p60 от yt-dlp - это в основном лишние байты на загрузку и обработку
+    файла. Файлы больше `min_size_bytes` перекодируются многопоточным ffmpeg
+    в уменьшенное разрешение и частоту кадров; результат заменяет исходный
+    файл, только если он действительно меньше.
+    """
+    def __init__(
+        self,
+        min_size_bytes: int = 150 * 1024 * 1024,
+        max_height: int = 480,
+        fps: float = 2.0,
+        audio_bitrate: str = "48k",
+        threads: int = 0
+    ):
+        self.min_size_bytes = min_size_bytes
+        self.max_height = max_height
+        self.fps = fps
+        self.audio_bitrate = audio_bitrate
+        self.threads = threads
+        self.transcoded = 0
+        self.skipped = 0
+        self.not_smaller = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_saved = 0
+        self.seconds_spent = 0.0
+        self.logger = logging.getLogger("MediaTranscoder")
+
+    async def maybe_transcode(self, video_path: str) -> str:
+        """Возвращает путь к файлу для загрузки: исходный или (на том же месте) уменьшенный."""
+        original_size = os.path.getsize(video_path)
+        if original_size < self.min_size_bytes:
+            self.skipped += 1
+            return video_path
+
+        base, _ = os.path.splitext(video_path)
+        output_path = f"{base}.transcoded.mp4"
+        started = time.monotonic()
+        try:
+            await run_blocking(
+                "media", transcode_video, video_path, output_path,
+                max_height=self.max_height, fps=self.fps, audio_bitrate=self.audio_bitrate, threads=self.threads
+            )
+        except Exception as e:
+            # Стадия необязательная: при ошибке загружаем файл как есть
+            self.failed += 1
+            self.logger.warning(f"Transcode failed for {video_path}, uploading original: {e}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return video_path
+        finally:
+            self.seconds_spent += time.monotonic() - started
+
+        new_size = os.path.getsize(output_path)
+        elapsed = time.monotonic() - started
+        if new_size >= original_size:
+            self.not_smaller += 1
+            os.remove(output_path)
+            self.logger.info(f"Transcode of {video_path} did not shrink it ({original_size} -> {new_size} bytes), uploading original")
+            return video_path
+
+        os.replace(output_path, video_path)
+        self.transcoded += 1
+        self.bytes_in += original_size
+        self.bytes_saved += original_size - new_size
+        self.logger.info(
+            f"Transcoded {video_path}: {original_size / 1024 / 1024:.1f} MB -> {new_size / 1024 / 1024:.1f} MB "
+            f"in {elapsed:.1f}s"
+        )
+        return video_path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transcoded": self.transcoded,
+            "skipped": self.skipped,
+            "not_smaller": self.not_smaller,
+            "failed": self.failed,
+            "bytes_saved": self.bytes_saved,
+            "saved_ratio": round(self.bytes_saved / self.bytes_in, 3) if self.bytes_in else 0.0,
+            "seconds_spent": round(self.seconds_spent, 1),
+        }
@@ -0,0 +1,116 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Sequence, Tuple
+
+from core.executors import run_blocking
+
+# (start_seconds, end_seconds, text)
+IndexedSegment = Tuple[int, int, str]
+
+# Служебные и вопросительные слова: они есть почти в любом тексте анализа и не говорят о теме вопроса
+STOP_WORDS = frozenset("""
+the and for are was were that this with from what when where which who why how about does did can
+there their they them then than into video videos moment minute minutes time talk talks talking said say
+что как где когда какой какая какие каком какую кто почему зачем это этот эта эти там тут для про при
+над под или если уже еще был была были было есть чем тем его она они оно видео момент моменте минуте
+минуту минута говорят говорит говорится рассказывают рассказывает речь идет
+""".split())
+
+
+class SegmentIndex:
+    """
+    Локальный полнотекстовый индекс (SQLite FTS5, ранжирование BM25) по текстам анализа сегментов.
+
+    Тексты, полученные при анализе видео, сохраняются с привязкой к video_id
+    и временному диапазону сегмента. Вопросы по уже проанализированному видео
+    ("в какой момент говорят про X") отвечаются поиском по индексу и одним
+    коротким запросом к модели - без повторной отправки видео.
+    """
+    _TOKEN_REGEX = re.compile(r"\w+", re.UNICODE)
+    # Сегмент считается найденным, только если в нем есть столько разных слов вопроса
+    # (или все слова, если их меньше); одно случайное совпадение не должно давать ответ
+    MIN_MATCHED_TERMS = 2
+    # Сколько кандидатов BM25 проверяем на число совпавших слов на каждый нужный результат
+    CANDIDATES_PER_RESULT = 5
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Соединение используется из потоков пула "disk", поэтому защищаем его блокировкой
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        self.logger = logging.getLogger("SegmentIndex")
+        with self._conn_lock, self._conn:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5("
+                "video_id UNINDEXED, start_s UNINDEXED, end_s UNINDEXED, indexed_at UNINDEXED, content, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    async def add_segments(self, video_id: str, segments: Sequence[IndexedSegment]):
+        """Сохраняет сегменты видео, заменяя ранее проиндексированные для этого video_id."""
+        await run_blocking("disk", self._add_segments, video_id, list(segments))
+
+    async def search(self, video_id: str, query: str, limit: int = 4) -> List[IndexedSegment]:
+        """Возвращает наиболее релевантные запросу сегменты видео в хронологическом порядке."""
+        return await run_blocking("disk", self._search, video_id, query, limit)
+
+    async def has_video(self, video_id: str) -> bool:
+        return await run_blocking("disk", self._has_video, video_id)
+
+    def close(self):
+        with self._conn_lock:
+            self._conn.close()
+
+    def _add_segments(self, video_id: str, segments: List[IndexedSegment]):
+        now = int(time.time())
+        with self._conn_lock, self._conn:
+            self._conn.execute("DELETE FROM segments WHERE video_id = ?", (video_id,))
+            self._conn.executemany(
+                "INSERT INTO segments (video_id, start_s, end_s, indexed_at, content) VALUES (?, ?, ?, ?, ?)",
+                [(video_id, start, end, now, text) for start, end, text in segments if text],
+            )
+        self.logger.info(f"Indexed {len(segments)} segments for video {video_id}")
+
+    def _search(self, video_id: str, query: str, limit: int) -> List[IndexedSegment]:
+        stems = self._query_stems(query)
+        if not stems:
+            return []
+        match_query = " OR ".join(f'"{stem}"*' for stem in stems)
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT start_s, end_s, content FROM segments "
+                "WHERE segments MATCH ? AND video_id = ? ORDER BY bm25(segments) LIMIT ?",
+                (match_query, video_id, limit * self.CANDIDATES_PER_RESULT),
+            ).fetchall()
+        required = min(self.MIN_MATCHED_TERMS, len(stems))
+        hits = [
+            (int(start), int(end), content) for start, end, content in rows
+            if self._matched_terms(stems, content) >= required
+        ][:limit]
+        return sorted(hits, key=lambda row: row[0])
+
+    def _has_video(self, video_id: str) -> bool:
+        with self._conn_lock:
+            row = self._conn.execute("SELECT 1 FROM segments WHERE video_id = ? LIMIT 1", (video_id,)).fetchone()
+        return row is not None
+
+    def _query_stems(self, query: str) -> List[str]:
+        # Каждое слово потом берется в кавычки, чтобы спецсимволы FTS5 в тексте пользователя не ломали запрос.
+        # У длинных слов отрезаем окончание и ищем по префиксу, чтобы находить другие словоформы.
+        tokens = {token.lower() for token in self._TOKEN_REGEX.findall(query) if len(token) > 2}
+        return sorted({self._stem(token) for token in tokens if token not in STOP_WORDS})
+
+    def _matched_terms(self, stems: List[str], content: str) -> int:
+        words = {word.lower() for word in self._TOKEN_REGEX.findall(content)}
+        return sum(1 for stem in stems if any(word.startswith(stem) for word in words))
+
+    @staticmethod
+    def _stem(token: str) -> str:
+        if len(token) > 5:
+            return token[:-2]
+        if len(token) > 3:
+            return token[:-1]
+        return token
@@ -4,6 +4,11 @@ class VideoCallback(CallbackData, prefix="vid"):
     action: str
     video_id: str
 
+class MultiVideoCallback(CallbackData, prefix="multi"):
+    # Список видео не помещается в callback_data (64 байта), он хранится в FSM, а здесь - его короткий идентификатор
+    action: str
+    batch_id: str
+
 # НОВАЯ ФАБРИКА ДЛЯ ОТМЕНЫ
 class CancelCallback(CallbackData, prefix="cancel"):
     # Нам нужен уникальный идентификатор задачи, чтобы знать, что отменять.
@@ -0,0 +1,45 @@
+import logging
+from aiogram import Router, F, types
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile
+
+from core.loop_monitor import LoopMonitor
+from telegram.outbox import outbox
+from telegram.utils.message import answer_message
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_SECONDS = 10.0
+
+
+def setup_admins(admin_user_ids):
+    """Ограничивает команды роутера администраторами; без списка администраторов роутер не отвечает никому."""
+    router.message.filter(F.from_user.id.in_(set(admin_user_ids)))
+
+
+@router.message(Command("loopstats"))
+async def loop_stats_command(message: types.Message, loop_monitor: LoopMonitor):
+    await answer_message(message, f"Event loop: {loop_monitor.stats()}")
+
+
+@router.message(Command("profile"))
+async def profile_command(message: types.Message, command: CommandObject, loop_monitor: LoopMonitor):
+    """/profile [секунды] - семплирующий профиль работающего бота в файл."""
+    try:
+        seconds = float(command.args) if command.args else DEFAULT_PROFILE_SECONDS
+    except ValueError:
+        await answer_message(message, "Использование: /profile [секунды]")
+        return
+
+    logger.info(f"Admin {message.from_user.id} requested a {seconds}s loop profile")
+    await answer_message(message, f"Снимаю профиль event loop ({seconds:g} с)...")
+    try:
+        path, top = await loop_monitor.capture_profile(seconds)
+    except RuntimeError as e:
+        await answer_message(message, f"Не удалось снять профиль: {e}")
+        return
+
+    summary = "\n".join(f"{count:>6}  {frame}" for frame, count in top)
+    await answer_message(message, f"Профиль сохранен: {path}\nЧаще всего на вершине стека:\n{summary}")
+    await outbox.send(message.chat.id, lambda: message.answer_document(FSInputFile(path)))
@@ -2,10 +2,12 @@ import logging
 from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 
-from telegram.callback_data import VideoCallback, CancelCallback
+from telegram.callback_data import VideoCallback, MultiVideoCallback, CancelCallback
 from agents.orchestrator_agent import OrchestratorAgent
+from telegram.responder import TelegramResponder
 from core.task_manager import task_manager
 from telegram.states import ProcessingState
+from telegram.utils.message import edit_message
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -15,6 +17,7 @@ async def handle_video_confirmation(
     callback_query: types.CallbackQuery,
     callback_data: VideoCallback,
     orchestrator: OrchestratorAgent,
+    responder: TelegramResponder,
     state: FSMContext  # <--- ИЗМЕНЕНИЕ
 ):
     await callback_query.answer()
@@ -31,23 +34,63 @@ async def handle_video_confirmation(
             state=state  # <--- ИЗМЕНЕНИЕ
         )
         
-        cancel_button = types.InlineKeyboardButton(
-            text="❌ Отменить обработку",
-            callback_data=CancelCallback(
-                chat_id=message_to_edit.chat.id,
-                message_id=message_to_edit.message_id
-            ).pack()
-        )
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
-        
-        await message_to_edit.edit_text(
+        await edit_message(
+            message_to_edit,
             "⏳ Обработка началась... Вы можете отменить ее в любой момент.",
-            reply_markup=keyboard
+            reply_markup=responder.cancel_keyboard(message_to_edit)
+        )
+
+    elif callback_data.action == "batch":
+        logger.info(f"User {callback_query.from_user.id} requested deferred batch processing for video_id: {callback_data.video_id}")
+
+        await state.set_state(ProcessingState.is_processing)
+        await orchestrator.launch_analysis_task(
+            video_id=callback_data.video_id,
+            original_message=message_to_edit,
+            state=state,
+            deliver_later=True
         )
+        await edit_message(message_to_edit, "⏳ Скачиваю и загружаю видео для пакетной обработки...")
 
     elif callback_data.action == "cancel":
         logger.info(f"User {callback_query.from_user.id} cancelled before starting for video_id: {callback_data.video_id}")
-        await message_to_edit.edit_text("❌ Обработка отменена.", reply_markup=None)
+        await edit_message(message_to_edit, "❌ Обработка отменена.")
+
+@router.callback_query(MultiVideoCallback.filter())
+async def handle_multi_video_confirmation(
+    callback_query: types.CallbackQuery,
+    callback_data: MultiVideoCallback,
+    orchestrator: OrchestratorAgent,
+    responder: TelegramResponder,
+    state: FSMContext
+):
+    await callback_query.answer()
+    message_to_edit = callback_query.message
+
+    if callback_data.action == "start":
+        batch = (await state.get_data()).get("pending_video_batch")
+        if not batch or batch.get("id") != callback_data.batch_id:
+            # Кнопка от старого сообщения: список видео уже заменен более новым запросом или сброшен
+            await edit_message(message_to_edit, "⚠️ Этот запрос устарел. Отправьте ссылки еще раз.")
+            return
+        logger.info(f"User {callback_query.from_user.id} confirmed processing of {len(batch['video_ids'])} videos")
+
+        await state.set_state(ProcessingState.is_processing)
+        await orchestrator.launch_multi_analysis_task(
+            video_ids=batch["video_ids"],
+            durations=batch.get("durations"),
+            original_message=message_to_edit,
+            state=state
+        )
+        await edit_message(
+            message_to_edit,
+            f"⏳ Обработка {len(batch['video_ids'])} видео началась... Вы можете отменить ее в любой момент.",
+            reply_markup=responder.cancel_keyboard(message_to_edit)
+        )
+
+    elif callback_data.action == "cancel":
+        logger.info(f"User {callback_query.from_user.id} cancelled multi-video processing before starting")
+        await edit_message(message_to_edit, "❌ Обработка отменена.")
 
 @router.callback_query(CancelCallback.filter())
 async def handle_cancel_processing(
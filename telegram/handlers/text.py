@@ -2,6 +2,8 @@ from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from agents.orchestrator_agent import OrchestratorAgent
 from telegram.responder import TelegramResponder
+from telegram.outbox import Priority
+from telegram.utils.message import answer_message, edit_message
 
 router = Router()
 
@@ -16,7 +18,7 @@ async def text_message_handler(
     if not user_text:
         return
 
-    processing_msg = await message.answer("Получено. Обрабатываю запрос...")
+    processing_msg = await answer_message(message, "Получено. Обрабатываю запрос...", priority=Priority.STATUS)
     try:
         # Передаем state в оркестратор, где и будет происходить вся логика
         response_data = await orchestrator.process_request(user_text, message=message, state=state)
@@ -26,7 +28,7 @@ async def text_message_handler(
              await processing_msg.delete()
         else:
             # Для сообщения с кнопками лучше изменить текст
-            await processing_msg.edit_text("Оценил ваш запрос:")
+            await edit_message(processing_msg, "Оценил ваш запрос:")
             
         await responder.send_response(message, response_data)
     except Exception as e:
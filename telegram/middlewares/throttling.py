@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from telegram.outbox import Priority, TokenBucket
+from telegram.utils.message import answer_message
+
+
+class _UserState:
+    __slots__ = ("bucket", "lock", "batch", "last_seen", "notified_at")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # Одновременно обрабатывается не более одного запроса пользователя
+        self.lock = asyncio.Lock()
+        # Сообщения, которые еще ждут обработки и будут склеены в один запрос
+        self.batch: Optional[List[Message]] = None
+        self.last_seen = time.monotonic()
+        self.notified_at = 0.0
+
+
+class InboundThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение входящих текстовых сообщений по пользователю в чате.
+
+    - Корзина токенов на пользователя в чате: каждый новый запрос тратит токен,
+      без токенов сообщение отбрасывается (с редким предупреждением).
+    - Сообщения, пришедшие в течение `debounce_seconds` или пока предыдущий
+      запрос пользователя еще обрабатывается, склеиваются в один запрос.
+    - У одного пользователя в чате обрабатывается не более одного запроса за раз.
+    - Команды (текст с "/") проходят сразу, без задержки и склейки.
+    """
+    NOTIFY_COOLDOWN = 30.0
+    IDLE_USER_TTL = 600.0
+
+    def __init__(self, rate: float = 1 / 3, burst: int = 3, debounce_seconds: float = 1.0, max_merged: int = 10):
+        self.rate = rate
+        self.burst = burst
+        self.debounce_seconds = debounce_seconds
+        self.max_merged = max_merged
+        self._users: Dict[Tuple[int, int], _UserState] = {}
+        self.received = 0
+        self.processed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.logger = logging.getLogger("InboundThrottling")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or not event.text or event.from_user is None:
+            return await handler(event, data)
+        if event.text.startswith("/"):
+            # Команды не склеиваются с текстом, иначе фильтры Command перестают их узнавать
+            return await handler(event, data)
+
+        self.received += 1
+        now = time.monotonic()
+        # Состояние - на пару (чат, пользователь): сообщения из группы и из лички не склеиваются,
+        # а data (в том числе FSM state) всегда относится к чату, куда уйдет ответ
+        user = self._user((event.chat.id, event.from_user.id), now)
+
+        if user.batch is not None:
+            # Запрос уже ждет обработки - присоединяем сообщение к нему
+            if len(user.batch) < self.max_merged:
+                user.batch.append(event)
+                self.merged += 1
+            else:
+                self.dropped += 1
+            return None
+
+        if user.bucket.wait_time(now) > 0:
+            self.dropped += 1
+            self.logger.warning(f"Dropping message from user {event.from_user.id}: rate limit exceeded")
+            await self._notify(event, user, now)
+            return None
+        user.bucket.consume(now)
+
+        batch = [event]
+        user.batch = batch
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+            async with user.lock:
+                # С этого момента новые сообщения формируют следующий запрос
+                user.batch = None
+                self.processed += 1
+                return await handler(self._merge(batch), data)
+        finally:
+            if user.batch is batch:
+                user.batch = None
+
+    def _user(self, key: Tuple[int, int], now: float) -> _UserState:
+        user = self._users.get(key)
+        if user is None:
+            self._forget_idle_users(now)
+            user = _UserState(TokenBucket(self.rate, self.burst))
+            self._users[key] = user
+        user.last_seen = now
+        return user
+
+    @staticmethod
+    def _merge(batch: List[Message]) -> Message:
+        if len(batch) == 1:
+            return batch[0]
+        # Ответ привязываем к последнему сообщению, текст - все сообщения по порядку
+        return batch[-1].model_copy(update={"text": "\n".join(message.text for message in batch)})
+
+    async def _notify(self, event: Message, user: _UserState, now: float):
+        if now - user.notified_at < self.NOTIFY_COOLDOWN:
+            return
+        user.notified_at = now
+        try:
+            await answer_message(event, "⏳ Слишком много сообщений подряд. Подождите немного и повторите запрос.", priority=Priority.STATUS)
+        except Exception as e:
+            self.logger.warning(f"Failed to notify user {event.from_user.id} about throttling: {e}")
+
+    def _forget_idle_users(self, now: float):
+        idle = [
+            key for key, user in self._users.items()
+            if user.batch is None and not user.lock.locked() and now - user.last_seen > self.IDLE_USER_TTL
+        ]
+        for key in idle:
+            del self._users[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "tracked_users": len(self._users),
+        }
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+TelegramCall = Callable[[], Awaitable[Any]]
+
+
+class Priority(IntEnum):
+    """Чем меньше значение, тем раньше отправка."""
+    ANSWER = 0    # итоговые ответы и отчеты
+    STATUS = 1    # смена статуса (начало, завершение, ошибка)
+    PROGRESS = 2  # промежуточные обновления (позиция в очереди)
+
+
+class TokenBucket:
+    """Корзина токенов: `rate` отправок в секунду с запасом `capacity` на всплеск."""
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - доступен сейчас)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _OutboxItem:
+    __slots__ = ("chat_id", "call", "priority", "seq", "coalesce_key", "futures", "attempts")
+
+    def __init__(self, chat_id: int, call: TelegramCall, priority: Priority, seq: int, coalesce_key: Optional[Hashable], future: asyncio.Future):
+        self.chat_id = chat_id
+        self.call = call
+        self.priority = priority
+        self.seq = seq
+        self.coalesce_key = coalesce_key
+        self.futures: List[asyncio.Future] = [future]
+        self.attempts = 0
+
+
+class _ChatState:
+    __slots__ = ("bucket", "blocked_until", "busy")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.blocked_until = 0.0
+        self.busy = False
+
+
+class TelegramOutbox:
+    """
+    Единая очередь исходящих вызовов Bot API.
+
+    Соблюдает лимиты Telegram: не чаще ~1 сообщения в секунду на чат и ~30 в
+    секунду на бота (корзины токенов), при TelegramRetryAfter приостанавливает
+    чат на указанное сервером время и повторяет вызов. Вызовы одного чата
+    выполняются по очереди, чтобы не нарушать порядок. Из готовых к отправке
+    выбирается вызов с наивысшим приоритетом, так что ответы обгоняют
+    промежуточные статусы. Правки одного сообщения с общим `coalesce_key`
+    склеиваются: пока правка ждет в очереди, новая заменяет ее.
+    """
+    PER_CHAT_RATE = 1.0
+    PER_CHAT_BURST = 3
+    GLOBAL_RATE = 30.0
+    GLOBAL_BURST = 30
+    MAX_RETRY_AFTER_ATTEMPTS = 3
+    IDLE_CHAT_TTL = 300.0
+
+    def __init__(self):
+        self._queue: List[_OutboxItem] = []
+        self._coalescing: Dict[Hashable, _OutboxItem] = {}
+        self._chats: Dict[int, _ChatState] = {}
+        self._global_bucket = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_BURST)
+        self._in_flight: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._seq = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retry_after_hits = 0
+        self.failed = 0
+        self.logger = logging.getLogger("TelegramOutbox")
+
+    async def send(self, chat_id: int, call: TelegramCall, priority: Priority = Priority.ANSWER, coalesce_key: Optional[Hashable] = None) -> Any:
+        """Ставит вызов в очередь и ждет его результата (для склеенных правок - результата последней правки)."""
+        future = asyncio.get_running_loop().create_future()
+        pending = self._coalescing.get(coalesce_key) if coalesce_key is not None else None
+        if pending is not None:
+            # Правка еще не отправлена: заменяем ее текст новым, приоритет берем более высокий
+            pending.call = call
+            pending.priority = min(pending.priority, priority)
+            pending.futures.append(future)
+            self.coalesced += 1
+        else:
+            self._seq += 1
+            item = _OutboxItem(chat_id, call, priority, self._seq, coalesce_key, future)
+            self._queue.append(item)
+            if coalesce_key is not None:
+                self._coalescing[coalesce_key] = item
+            self._ensure_running()
+        self._wakeup.set()
+        return await future
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._queue)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _chat(self, chat_id: int) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = _ChatState(TokenBucket(self.PER_CHAT_RATE, self.PER_CHAT_BURST))
+            self._chats[chat_id] = state
+        return state
+
+    def _next_ready(self, now: float) -> tuple:
+        """Возвращает (готовый вызов с наивысшим приоритетом или None, сколько ждать до следующего)."""
+        best = None
+        wait = None
+        for item in self._queue:
+            chat = self._chat(item.chat_id)
+            if chat.busy:
+                continue
+            chat_wait = max(chat.blocked_until - now, chat.bucket.wait_time(now))
+            if chat_wait > 0:
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+                continue
+            if best is None or (item.priority, item.seq) < (best.priority, best.seq):
+                best = item
+        return best, wait
+
+    async def _run(self):
+        while self._queue:
+            now = time.monotonic()
+            item, wait = self._next_ready(now)
+            if item is not None:
+                global_wait = self._global_bucket.wait_time(now)
+                if global_wait > 0:
+                    item, wait = None, global_wait
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.remove(item)
+            if item.coalesce_key is not None and self._coalescing.get(item.coalesce_key) is item:
+                # С этого момента новые правки уже не склеиваются с отправляемой
+                del self._coalescing[item.coalesce_key]
+            chat = self._chat(item.chat_id)
+            chat.busy = True
+            chat.bucket.consume(now)
+            self._global_bucket.consume(now)
+            task = asyncio.create_task(self._deliver(item, chat))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        self._forget_idle_chats(time.monotonic())
+
+    async def _deliver(self, item: _OutboxItem, chat: _ChatState):
+        try:
+            item.attempts += 1
+            result = await item.call()
+        except TelegramRetryAfter as e:
+            self.retry_after_hits += 1
+            chat.blocked_until = time.monotonic() + e.retry_after
+            if item.attempts < self.MAX_RETRY_AFTER_ATTEMPTS:
+                self.logger.warning(f"Flood control for chat {item.chat_id}: retrying in {e.retry_after}s")
+                self._requeue(item)
+            else:
+                self.failed += 1
+                self._resolve(item, exception=e)
+        except TelegramBadRequest as e:
+            if item.coalesce_key is not None and "message is not modified" in str(e):
+                self._resolve(item, result=None)
+            else:
+                self.failed += 1
+                self._resolve(item, exception=e)
+        except Exception as e:
+            self.failed += 1
+            self._resolve(item, exception=e)
+        else:
+            self.sent += 1
+            self._resolve(item, result=result)
+        finally:
+            chat.busy = False
+            self._wakeup.set()
+
+    def _requeue(self, item: _OutboxItem):
+        newer = self._coalescing.get(item.coalesce_key) if item.coalesce_key is not None else None
+        if newer is not None:
+            # Пока ждали, пришла более свежая правка - она и будет отправлена
+            newer.futures.extend(item.futures)
+            newer.priority = min(newer.priority, item.priority)
+            return
+        self._queue.append(item)
+        if item.coalesce_key is not None:
+            self._coalescing[item.coalesce_key] = item
+        self._ensure_running()
+
+    @staticmethod
+    def _resolve(item: _OutboxItem, result: Any = None, exception: Optional[BaseException] = None):
+        for future in item.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _forget_idle_chats(self, now: float):
+        idle = [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.busy and chat.blocked_until < now and now - chat.bucket.updated_at > self.IDLE_CHAT_TTL
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def close(self, timeout: float = 10.0):
+        """Дожидается отправки очереди при остановке бота."""
+        deadline = time.monotonic() + timeout
+        while (self._queue or self._in_flight) and time.monotonic() < deadline:
+            pending = set(self._in_flight)
+            if self._task and not self._task.done():
+                pending.add(self._task)
+            await asyncio.wait(pending, timeout=deadline - time.monotonic())
+        if self._queue or self._in_flight:
+            self.logger.warning(f"Outbox closed with {len(self._queue) + len(self._in_flight)} undelivered call(s)")
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retry_after_hits": self.retry_after_hits,
+            "failed": self.failed,
+            "tracked_chats": len(self._chats),
+        }
+
+
+# Глобальный экземпляр для всего приложения
+outbox = TelegramOutbox()
@@ -1,11 +1,12 @@
-import os
-from typing import Dict, Union
-from aiogram import types
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.utils.message import send_message
+from typing import Awaitable, Callable, Dict, Union
+from aiogram import Bot, types
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from core.report import Report
+from telegram.utils.message import answer_message, send_message
+from telegram.outbox import outbox
 
 # ИЗМЕНЕНО: Импортируем из нового файла, разрывая цикл
-from telegram.callback_data import VideoCallback 
+from telegram.callback_data import VideoCallback, MultiVideoCallback, CancelCallback
 
 class TelegramResponder:
     async def send_response(self, message: types.Message, response_data: Dict[str, Union[str, bool, dict]]):
@@ -23,21 +24,54 @@ class TelegramResponder:
             # Логирование ошибки было бы здесь полезно
             await send_message(message, f"Failed to send response: {e}")
 
-    async def _send_document(self, message: types.Message, file_path: str, caption: str):
-        if not os.path.isfile(file_path):
-            await send_message(message, "Internal error: report file not found.")
-            return
-        input_file = FSInputFile(file_path)
-        await message.answer_document(input_file, caption=caption)
+    async def send_response_to_chat(self, bot: Bot, chat_id: int, response_data: Dict[str, Union[str, bool, dict]]):
+        """Отправляет ответ в чат без исходного сообщения (например, отчет пакетной обработки)."""
+        response_type = response_data.get('type')
         try:
-            os.remove(file_path)
-        except OSError as e:
-            # Логирование
-            pass
+            if response_type == 'document':
+                report = response_data.get('content')
+                caption = response_data.get('caption')
+                await self._deliver_report(report, lambda document: outbox.send(chat_id, lambda: bot.send_document(chat_id, document, caption=caption)))
+            else:
+                await outbox.send(chat_id, lambda: bot.send_message(chat_id, str(response_data.get('content'))))
+        except Exception as e:
+            await outbox.send(chat_id, lambda: bot.send_message(chat_id, f"Failed to send response: {e}"))
+
+    async def _send_document(self, message: types.Message, report: Report, caption: str):
+        if not isinstance(report, Report):
+            await send_message(message, "Internal error: report not found.")
+            return
+        await self._deliver_report(report, lambda document: outbox.send(message.chat.id, lambda: message.answer_document(document, caption=caption)))
+
+    @staticmethod
+    async def _deliver_report(report: Report, send: Callable[[Union[str, BufferedInputFile]], Awaitable[types.Message]]):
+        """Отправляет отчет из памяти; после первой загрузки повторно использует file_id Telegram."""
+        if report.file_id:
+            await send(report.file_id)
+            return
+        async with report.upload_lock:
+            if report.file_id:
+                await send(report.file_id)
+                return
+            sent_message = await send(BufferedInputFile(report.content, filename=report.filename))
+            if sent_message and sent_message.document:
+                report.file_id = sent_message.document.file_id
+
+    @staticmethod
+    def cancel_keyboard(message: types.Message) -> InlineKeyboardMarkup:
+        """Клавиатура с кнопкой отмены запущенной обработки."""
+        cancel_button = InlineKeyboardButton(
+            text="❌ Отменить обработку",
+            callback_data=CancelCallback(chat_id=message.chat.id, message_id=message.message_id).pack()
+        )
+        return InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
 
     async def _send_confirmation(self, message: types.Message, response_data: dict):
         """Отправляет сообщение с кнопками 'Да' и 'Нет'."""
         text = response_data.get('text')
+        if response_data.get('video_ids'):
+            await self._send_multi_video_confirmation(message, text, response_data.get('batch_id'))
+            return
         video_id = response_data.get('video_id')
 
         confirm_button = InlineKeyboardButton(
@@ -48,8 +82,24 @@ class TelegramResponder:
             text="❌ Нет, отменить",
             callback_data=VideoCallback(action="cancel", video_id=video_id).pack()
         )
+        batch_button = InlineKeyboardButton(
+            text="🕒 Прислать позже (пакетная обработка)",
+            callback_data=VideoCallback(action="batch", video_id=video_id).pack()
+        )
         
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[[confirm_button, cancel_button]])
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[confirm_button, cancel_button], [batch_button]])
         
-        await message.answer(text, reply_markup=keyboard)
+        await answer_message(message, text, reply_markup=keyboard)
 
+    async def _send_multi_video_confirmation(self, message: types.Message, text: str, batch_id: str):
+        """Подтверждение анализа нескольких видео: одна пара кнопок на всю пачку."""
+        confirm_button = InlineKeyboardButton(
+            text="✅ Да, начать",
+            callback_data=MultiVideoCallback(action="start", batch_id=batch_id).pack()
+        )
+        cancel_button = InlineKeyboardButton(
+            text="❌ Нет, отменить",
+            callback_data=MultiVideoCallback(action="cancel", batch_id=batch_id).pack()
+        )
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[confirm_button, cancel_button]])
+        await answer_message(message, text, reply_markup=keyboard)
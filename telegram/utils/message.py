@@ -1,24 +1,44 @@
 import html
 
+from typing import Any, Optional
+
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
 
+from telegram.outbox import Priority, outbox
+
 MAX_MESSAGE_LENGTH = 4096
 
+
+async def answer_message(message: Message, text: str, priority: Priority = Priority.ANSWER, **kwargs) -> Message:
+    """Отправляет сообщение в чат `message` через общую очередь с учетом лимитов Telegram."""
+    return await outbox.send(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+
+async def edit_message(message: Message, text: str, reply_markup: Optional[Any] = None, priority: Priority = Priority.STATUS) -> Any:
+    """Редактирует сообщение через очередь; частые правки одного сообщения склеиваются, уходит последняя."""
+    return await outbox.send(
+        message.chat.id,
+        lambda: message.edit_text(text, reply_markup=reply_markup),
+        priority,
+        coalesce_key=("edit", message.chat.id, message.message_id)
+    )
+
+
 async def send_message(message: Message, text: str):
     if not isinstance(message, Message):
         return
     if not isinstance(text, str):
-        await message.answer("Internal error: response is not a string.")
+        await answer_message(message, "Internal error: response is not a string.")
         return
     if not text.strip():
         return
     safe_text = html.escape(text)
     if len(safe_text) <= MAX_MESSAGE_LENGTH:
         try:
-            await message.answer(safe_text)
+            await answer_message(message, safe_text)
         except TelegramBadRequest as e:
-            await message.answer("An error occurred while trying to send the response.")
+            await answer_message(message, "An error occurred while trying to send the response.")
     else:
         parts = []
         while len(safe_text) > 0:
@@ -36,4 +56,4 @@ async def send_message(message: Message, text: str):
                 break
         for part in parts:
             if part.strip():
-                await message.answer(part)
\ No newline at end of file
+                await answer_message(message, part)
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+
+from core.admission import AnalysisAdmissionQueue
+
+
+async def _hold(queue: AnalysisAdmissionQueue, release: asyncio.Event):
+    async with queue.slot():
+        await release.wait()
+
+
+def test_cancel_during_admission_report_releases_slot():
+    async def scenario():
+        queue = AnalysisAdmissionQueue(max_concurrent=1, max_depth=5)
+        release = asyncio.Event()
+        reporting_admission = asyncio.Event()
+
+        async def on_position(position: int, eta: float):
+            if position == 0:
+                # Зависаем в сообщении о допуске, как медленная правка статуса в Telegram
+                reporting_admission.set()
+                await asyncio.sleep(3600)
+
+        async def queued_job():
+            async with queue.slot(on_position=on_position):
+                pass
+
+        holder = asyncio.create_task(_hold(queue, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(queued_job())
+        await asyncio.sleep(0)
+        assert queue.depth == 1
+
+        release.set()
+        await holder
+        await asyncio.wait_for(reporting_admission.wait(), 1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert queue.running == 0
+        assert queue.depth == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_queued_keeps_running_count():
+    async def scenario():
+        queue = AnalysisAdmissionQueue(max_concurrent=1, max_depth=5)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(queue, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(queue, asyncio.Event()))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+
+        assert queue.running == 0
+        assert queue.depth == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from services.batch_service import BatchAnalysisService, BatchState, LocalBatchBackend
+
+REQUESTS = [
+    {"start": 0, "end": 600, "prompt": "segment 1"},
+    {"start": 600, "end": 900, "prompt": "segment 2"},
+]
+
+
+def test_submit_poll_deliver(tmp_path):
+    store_path = str(tmp_path / "batch_jobs.json")
+    delivered = []
+
+    async def on_complete(job, result):
+        delivered.append((job, result))
+
+    async def responder(request):
+        return f"analysis of {request['prompt']}"
+
+    async def scenario():
+        service = BatchAnalysisService(LocalBatchBackend(delay=0.05, responder=responder), store_path, on_complete)
+        batch_name = await service.submit("model", "vid", 42, "files/vid", "video/mp4", "summarize", "en", REQUESTS)
+        with open(store_path, encoding="utf-8") as f:
+            assert [job["batch_name"] for job in json.load(f)] == [batch_name]
+
+        # Пакет еще не готов: ничего не доставляется, задача остается
+        await service.poll_once()
+        assert delivered == []
+        assert service.pending_count == 1
+
+        await asyncio.sleep(0.1)
+        await service.poll_once()
+        assert service.pending_count == 0
+        with open(store_path, encoding="utf-8") as f:
+            assert json.load(f) == []
+
+    asyncio.run(scenario())
+    [(job, result)] = delivered
+    assert job["video_id"] == "vid" and job["chat_id"] == 42
+    assert job["segments"] == [[0, 600], [600, 900]]
+    assert result.state == BatchState.SUCCEEDED
+    assert result.texts == ["analysis of segment 1", "analysis of segment 2"]
+
+
+def test_job_of_another_backend_is_failed_and_removed(tmp_path):
+    store_path = str(tmp_path / "batch_jobs.json")
+    job = {
+        "batch_name": "batches/123", "backend": "gemini", "video_id": "vid", "chat_id": 42,
+        "prompt": "summarize", "language": "en", "segments": [[0, 600]], "created_at": 0,
+    }
+    with open(store_path, "w", encoding="utf-8") as f:
+        json.dump([job], f)
+    delivered = []
+
+    async def on_complete(job, result):
+        delivered.append((job["batch_name"], result.state))
+
+    async def scenario():
+        service = BatchAnalysisService(LocalBatchBackend(delay=0), store_path, on_complete)
+        service._jobs = service._load_jobs()
+        await service.poll_once()
+        assert service.pending_count == 0
+
+    asyncio.run(scenario())
+    assert delivered == [("batches/123", BatchState.FAILED)]
@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+from google.genai.types import Part
+
+from services.context_cache_service import ContextCacheService
+from services.key_pool import ApiKeyPool
+
+
+class _Caches:
+    def __init__(self):
+        self.created = 0
+
+    async def create(self, model, config):
+        self.created += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(name=f"cachedContents/{self.created}")
+
+    async def delete(self, name):
+        pass
+
+
+def _service():
+    caches = _Caches()
+    pool = ApiKeyPool([SimpleNamespace(caches=caches)])
+    pool._limiters_ready = True
+    return ContextCacheService(pool), caches
+
+
+def test_cache_is_created_in_background():
+    async def scenario():
+        service, caches = _service()
+        service.create_in_background("vid", Part.from_bytes(data=b"video", mime_type="video/mp4"), estimated_tokens=1000)
+        assert service.get("vid") is None
+        await asyncio.gather(*service._creating)
+        assert service.get("vid") is not None
+        assert caches.created == 1
+        await service.close()
+
+    asyncio.run(scenario())
+
+
+def test_video_over_context_window_is_skipped():
+    async def scenario():
+        service, caches = _service()
+        service.create_in_background("vid", Part.from_bytes(data=b"video", mime_type="video/mp4"), estimated_tokens=service.MAX_CONTEXT_TOKENS + 1)
+        await asyncio.sleep(0.05)
+        assert caches.created == 0
+        assert service.get("vid") is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_creation_does_not_keep_lock():
+    async def failing(model, config):
+        raise RuntimeError("too many tokens")
+
+    async def scenario():
+        service, caches = _service()
+        caches.create = failing
+        assert await service.create_for_video("vid", Part.from_bytes(data=b"video", mime_type="video/mp4")) is None
+        assert service._locks == {}
+
+    asyncio.run(scenario())
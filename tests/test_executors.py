@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+from core.executors import BoundedExecutor
+
+
+def test_cancelled_caller_keeps_permit_until_thread_finishes():
+    async def scenario():
+        executor = BoundedExecutor("test", max_workers=1, max_queue=0)
+        release = threading.Event()
+        running = threading.Event()
+
+        def blocking():
+            running.set()
+            release.wait(5)
+
+        task = asyncio.create_task(executor.run(blocking))
+        await asyncio.to_thread(running.wait, 5)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # Поток еще работает: место в пуле занято, новый вызов должен ждать
+        assert executor.active == 1
+        assert executor._admission.locked()
+
+        release.set()
+        await asyncio.wait_for(executor.run(lambda: None), 5)
+        assert executor.active == 0
+        assert executor.queued == 0
+        assert executor.completed == 2
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_before_start_does_not_leak_queued():
+    async def scenario():
+        executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = threading.Event()
+
+        def blocking():
+            running.set()
+            release.wait(5)
+
+        holder = asyncio.create_task(executor.run(blocking))
+        await asyncio.to_thread(running.wait, 5)
+        waiter = asyncio.create_task(executor.run(lambda: None))
+        await asyncio.sleep(0.05)
+        assert executor.queued == 1
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+        assert executor.queued == 0
+
+        release.set()
+        await holder
+        assert executor.active == 0
+        assert not executor._admission.locked()
+        executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.file_poller import FilePoller
+
+
+def _file(name: str, state: str):
+    return SimpleNamespace(name=name, state=SimpleNamespace(name=state), size_bytes=0)
+
+
+def test_hung_fetch_does_not_hold_other_files():
+    async def scenario():
+        poller = FilePoller()
+        poller.MIN_INTERVAL = 0.01
+        poller.FETCH_TIMEOUT = 0.05
+        poller._base_latency = 0.0
+
+        async def fetch(name):
+            if name == "files/hung":
+                await asyncio.sleep(3600)
+            return _file(name, "ACTIVE")
+
+        hung = asyncio.create_task(poller.wait_until_active(_file("files/hung", "PROCESSING"), fetch, timeout=60))
+        ready = await asyncio.wait_for(poller.wait_until_active(_file("files/ready", "PROCESSING"), fetch, timeout=60), 1.0)
+        assert ready.state.name == "ACTIVE"
+
+        await asyncio.sleep(0.2)
+        assert poller._pending["files/hung"].errors >= 1
+        hung.cancel()
+        try:
+            await hung
+        except asyncio.CancelledError:
+            pass
+        poller._task.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.enums import GeminiModel
+from core.retry_policy import RetryPolicy
+from services.gemini_service import GeminiService
+
+MODEL = GeminiModel.GEMINI_2_5_FLASH_LITE
+
+
+def _service(generate_content) -> GeminiService:
+    client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    service = GeminiService(client)
+    service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001, failure_threshold=2)
+    # Без лимитеров: тест проверяет только предохранитель
+    service.key_pool._limiters_ready = True
+    return service
+
+
+def test_transient_retries_count_as_one_breaker_failure():
+    async def failing(**kwargs):
+        raise TimeoutError("upstream timeout")
+
+    async def scenario():
+        service = _service(failing)
+        result = await service._base_generate(["hi"], MODEL, None)
+        assert result["error"] == "API_CALL_FAILED"
+        breaker = service.retry_policy.breaker(MODEL)
+        assert breaker.consecutive_failures == 1
+        assert breaker.state == breaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_call_keeps_probe_of_another_call():
+    started = asyncio.Event()
+
+    async def slow(**kwargs):
+        started.set()
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        service = _service(slow)
+        breaker = service.retry_policy.breaker(MODEL)
+        breaker.state = breaker.HALF_OPEN
+        # Пробный вызов уже идет
+        assert breaker.before_call() is True
+
+        # Обычный вызов в замкнутой цепи не пробный
+        breaker.state = breaker.CLOSED
+        task = asyncio.create_task(service._base_generate(["hi"], MODEL, None))
+        await started.wait()
+        breaker.state = breaker.HALF_OPEN
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert breaker._probe_in_flight
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+import asyncio
+
+from core.limiter import DualLimiter, track_limiter_wait
+
+
+def test_tracker_counts_only_time_when_every_request_waits():
+    async def scenario():
+        limiter = DualLimiter(max_concurrent=1, max_per_window=100, window_size=60)
+
+        async def request(seconds: float):
+            async with limiter.request_slot():
+                await asyncio.sleep(seconds)
+
+        with track_limiter_wait() as tracker:
+            # Второй запрос ждет слота, пока выполняется первый: это не простой группы
+            await asyncio.gather(request(0.05), request(0.05))
+        assert tracker.blocked_seconds < 0.02
+
+        limiter.pause(0.1)
+        with track_limiter_wait() as tracker:
+            await request(0.0)
+        assert tracker.blocked_seconds >= 0.08
+        assert tracker.waiting == 0 and tracker.running == 0
+
+    asyncio.run(scenario())
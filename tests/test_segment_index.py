@@ -0,0 +1,27 @@
+from services.segment_index import SegmentIndex
+
+SEGMENTS = [
+    (0, 600, "The speaker introduces the course and the teaching assistants."),
+    (600, 1200, "Pricing of the subscription plans is compared with competitors."),
+    (1200, 1800, "A demo of the mobile app, plans for the next release."),
+]
+
+
+def _index(tmp_path) -> SegmentIndex:
+    index = SegmentIndex(str(tmp_path / "segments.db"))
+    index._add_segments("vid", SEGMENTS)
+    return index
+
+
+def test_stop_words_alone_find_nothing(tmp_path):
+    index = _index(tmp_path)
+    assert index._search("vid", "what is this video about", 4) == []
+    index.close()
+
+
+def test_single_incidental_term_is_not_a_hit(tmp_path):
+    index = _index(tmp_path)
+    # "plans" есть в двух сегментах, но о ценах говорят только во втором
+    assert index._search("vid", "when do they talk about pricing plans", 4) == [SEGMENTS[1]]
+    assert index._search("vid", "plans for a weekend trip", 4) == []
+    index.close()
@@ -0,0 +1,35 @@
+import asyncio
+
+import core.time_estimator as time_estimator
+from core.time_estimator import TimeEstimator
+from core.timer_wheel import HierarchicalTimerWheel
+
+
+def test_unconfirmed_estimates_expire(monkeypatch):
+    monkeypatch.setattr(time_estimator, "PENDING_ESTIMATE_TTL_SECONDS", 0.03)
+
+    async def scenario():
+        wheel = HierarchicalTimerWheel(tick_seconds=0.01)
+        estimator = TimeEstimator(wheel=wheel)
+        estimator.remember_estimate("never-confirmed", 60.0)
+        assert "never-confirmed" in estimator._pending_estimates
+        await asyncio.sleep(0.1)
+        assert estimator._pending_estimates == {}
+        assert len(wheel) == 0
+
+    asyncio.run(scenario())
+
+
+def test_recorded_job_cancels_expiry_timer():
+    async def scenario():
+        wheel = HierarchicalTimerWheel(tick_seconds=0.01)
+        estimator = TimeEstimator(wheel=wheel)
+        estimator.remember_estimate("vid", 120.0)
+        estimator.remember_estimate("vid", 100.0)
+        assert len(wheel) == 1
+        await estimator.record_job("vid", 110.0)
+        assert estimator._pending_estimates == {}
+        assert len(wheel) == 0
+        assert estimator.completed_jobs == 1
+
+    asyncio.run(scenario())
@@ -1,145 +1,297 @@
 import asyncio
+import hashlib
+import heapq
 import os
 import re
 import logging
-import shutil
 import time
-from typing import Optional, Dict
-import ffmpeg
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Dict, List, Tuple, Union
 import math
 
-from services.gemini_service import GeminiService
-from core.enums import GeminiModel, RateLimits
-from utils.download_yt_video import download_yt_video, get_yt_video_info
-from google.genai.types import Part, VideoMetadata, FileData
-from google import genai
-from config import Config
+from services.gemini_service import GeminiService, INLINE_VIDEO_MAX_BYTES
+from services.context_cache_service import ContextCacheService
+from services.segment_index import SegmentIndex, IndexedSegment
+from services.batch_service import BatchAnalysisService
+from services.media_transcoder import MediaTranscoder
+from services.key_pool import ApiKey
+from core.enums import GeminiModel
+from utils.download_yt_video import download_yt_video, get_yt_video_info, get_yt_playlist_video_ids
 from core.analysis_manager import analysis_manager, AnalysisStatus
+from core.file_poller import file_poller
+from core.executors import read_file_bytes, run_blocking
+from core.limiter import track_limiter_wait
+from core.time_estimator import TimeEstimator
+from core.admission import AnalysisAdmissionQueue, QueuePositionCallback
+from core.exceptions import AdmissionRejectedError
+from core.token_usage import estimate_video_tokens
+from core.schemas import get_search_probe_schema
+from core.report import Report
 
-config = Config()
-client = genai.Client(api_key=config.gemini_api_key)
+if TYPE_CHECKING:
+    from google.genai.types import Part
+
+YOUTUBE_VIDEO_REGEX = re.compile(r'(?:https?://)?(?:www\.)?(?:youtube\.com|youtu\.be)/(?:[^\s]*?[?&]v=|embed/|v/|)([A-Za-z0-9_-]{11})')
+YOUTUBE_PLAYLIST_REGEX = re.compile(r'(?:https?://)?(?:www\.)?youtube\.com/playlist\?(?:[^\s]*?&)?list=([A-Za-z0-9_-]+)')
+MULTI_VIDEO_SEPARATOR = "\n\n" + "=" * 40 + "\n\n"
+# Текст сегмента, анализ которого не удался
+SEGMENT_ERROR_TEXT = "An error occurred."
+# Колбэк прогресса пачки видео: (готово видео, всего видео)
+MultiVideoProgressCallback = Callable[[int, int], Awaitable[None]]
 
 class FunctionHandler:
+    BATCH_SUBMITTED_MESSAGE = "🕒 Видео поставлено в очередь пакетной обработки. Отчет придет в этот чат, как только будет готов."
+
     logger = logging.getLogger("FunctionHandler")
-    def __init__(self, gemini_service: GeminiService):
+    def __init__(
+        self,
+        gemini_service: GeminiService,
+        context_cache: Optional[ContextCacheService] = None,
+        segment_index: Optional[SegmentIndex] = None,
+        batch_service: Optional[BatchAnalysisService] = None,
+        time_estimator: Optional[TimeEstimator] = None,
+        admission: Optional[AnalysisAdmissionQueue] = None,
+        max_videos_per_request: int = 10,
+        multi_video_concurrency: int = 2,
+        transcoder: Optional[MediaTranscoder] = None,
+        inline_video_max_bytes: int = INLINE_VIDEO_MAX_BYTES,
+        search_concurrency: int = 3,
+        search_min_confidence: float = 0.7
+    ):
         self.gemini_service = gemini_service
+        self.context_cache = context_cache
+        self.segment_index = segment_index
+        self.batch_service = batch_service
+        self.time_estimator = time_estimator or TimeEstimator()
+        self.admission = admission
+        self.max_videos_per_request = max_videos_per_request
+        # Сколько видео одного запроса анализируется одновременно, чтобы пачка не заняла всю очередь и квоту
+        self.multi_video_concurrency = multi_video_concurrency
+        self.transcoder = transcoder
+        # Видео не больше порога отправляются прямо в запросе, без Files API (0 - всегда загружать)
+        self.inline_video_max_bytes = inline_video_max_bytes
+        self.inline_videos = 0
+        self.uploaded_videos = 0
+        # Режим поиска момента: сегменты пробуются по порядку не больше чем по `search_concurrency`,
+        # остальные отменяются, как только найден ответ с уверенностью не ниже порога
+        self.search_concurrency = search_concurrency
+        self.search_min_confidence = search_min_confidence
+        self.search_probes = 0
+        self.search_probes_skipped = 0
 
     async def estimate_and_propose_analysis(self, text_from_router: str, message=None) -> Dict:
         self.logger.info("Phase 1: Estimating video content analysis with time range")
-        youtube_regex = re.compile(r'(?:https?://)?(?:www\.)?(?:youtube\.com|youtu\.be)/(?:.*[?&]v=|embed/|v/|)([A-Za-z0-9_-]{11})')
-        match = youtube_regex.search(text_from_router)
-        if not match: return {'type': 'text', 'content': "Не найдена ссылка на YouTube в вашем запросе."}
-        
-        video_id = match.group(1)
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        
+        video_ids, playlist_ids = self._extract_youtube_refs(text_from_router)
+        if not video_ids and not playlist_ids:
+            return {'type': 'text', 'content': "Не найдена ссылка на YouTube в вашем запросе."}
+
         try:
-            video_info = await asyncio.to_thread(get_yt_video_info, url)
-            if not video_info or not video_info.get('duration'):
-                return {'type': 'text', 'content': "Не удалось получить информацию о видео."}
+            if len(video_ids) == 1 and not playlist_ids:
+                video_id = video_ids[0]
+                video_info = await run_blocking("youtube", get_yt_video_info, self._video_url(video_id))
+                if not video_info or not video_info.get('duration'):
+                    return {'type': 'text', 'content': "Не удалось получить информацию о видео."}
+                return await self._propose_single_video(video_id, video_info)
+            return await self._propose_multiple_videos(video_ids, playlist_ids)
+        except Exception as e:
+            self.logger.error(f"Error during estimation: {e}", exc_info=True)
+            return {'type': 'text', 'content': f"Ошибка при получении данных о видео: {e}"}
 
-            duration = video_info.get('duration', 0)
-            filesize = video_info.get('filesize', 0)
-            duration_minutes = duration / 60
+    @staticmethod
+    def _extract_youtube_refs(text: str) -> Tuple[List[str], List[str]]:
+        """Все ссылки на видео и плейлисты из текста, без повторов и в порядке появления."""
+        video_ids = list(dict.fromkeys(YOUTUBE_VIDEO_REGEX.findall(text)))
+        playlist_ids = list(dict.fromkeys(YOUTUBE_PLAYLIST_REGEX.findall(text)))
+        return video_ids, playlist_ids
 
-            # --- НАЧАЛО РАСЧЕТА ДИАПАЗОНА ---
-            
-            # Компоненты, общие для обоих расчетов
-            internet_speed_mbps = 10
-            speed_in_bytes = internet_speed_mbps * 1024 * 1024
-            transfer_time_minutes = (filesize / speed_in_bytes) * 2 / 60 if filesize > 0 else 0
-            analysis_time_minutes = duration_minutes / 60
-            
-            requests_per_minute = RateLimits.RATE_LIMIT_2_5_FLASH.value # e.g., 11
-            
-            # Расчет 1: Ожидание на основе лимита ЗАПРОСОВ
-            num_segments = math.ceil(duration_minutes / 10)
-            gemini_wait_time_minutes = (num_segments / requests_per_minute) if requests_per_minute > 0 else 0
-
-            # Расчет 2: Ожидание на основе лимита ТОКЕНОВ (по вашей формуле)
-            # Учитываем, что часть видео обработается в первую минуту
-            remaining_duration = max(0, duration_minutes - (10 * requests_per_minute))
-            # 16 - это лимит для другой, более медленной модели, который мы используем для симуляции троттлинга
-            
-            gemini_wait_time_minutes1 = ((remaining_duration / 16) + 1) if remaining_duration > 0 else 0
+    @staticmethod
+    def _video_url(video_id: str) -> str:
+        return f"https://www.youtube.com/watch?v={video_id}"
 
-            # Базовое время (передача + сам анализ)
-            base_time = transfer_time_minutes + analysis_time_minutes
-            
-            # Минимальное и максимальное общее время
-            min_total_time = base_time + gemini_wait_time_minutes
-            max_total_time = base_time + max(gemini_wait_time_minutes, gemini_wait_time_minutes1)
-
-            self.logger.info(
-                f"Time estimation for {video_id}: "
-                f"Base={base_time:.2f}m, "
-                f"Wait1(req)={gemini_wait_time_minutes:.2f}m, "
-                f"Wait2(token)={gemini_wait_time_minutes1:.2f}m. "
-                f"Total Range=[{min_total_time:.1f}m - {max_total_time:.1f}m]"
-            )
+    async def _limiter_wait_seconds(self, estimated_tokens: int) -> float:
+        # Ожидание в лимитере модели (на ключе с наибольшим запасом): сколько токенов уже в окне и в очереди перед нами
+        limiter = await self.gemini_service.key_pool.limiter_for(GeminiModel.GEMINI_2_5_FLASH)
+        return self.time_estimator.limiter_wait_seconds(limiter, estimated_tokens)
 
-            # Формируем красивый ответ для пользователя
-            if max_total_time < 1:
-                estimate_text = "Обработка займет меньше минуты.\n\nНачать?"
-            # Если разница между мин и макс меньше минуты, показываем одно значение
-            elif (max_total_time - min_total_time) < 1:
-                estimate_text = (f"Видео будет обрабатываться примерно {max_total_time:.1f} минут.\n\nНачать обработку?")
-            else:
-                estimate_text = (f"Видео будет обрабатываться от {min_total_time:.1f} до {max_total_time:.1f} минут.\n\nНачать обработку?")
-            
-            return {'type': 'confirmation', 'text': estimate_text, 'video_id': video_id}
-        except Exception as e:
-            self.logger.error(f"Error during estimation: {e}", exc_info=True)
-            return {'type': 'text', 'content': f"Ошибка при получении данных о видео: {e}"}
+    async def _expected_wait_seconds(self, estimated_tokens: int) -> float:
+        wait_seconds = await self._limiter_wait_seconds(estimated_tokens)
+        if self.admission:
+            # Плюс ожидание в глобальной очереди анализов
+            wait_seconds += self.admission.expected_wait_seconds()
+        return wait_seconds
 
-    async def execute_video_analysis(self, video_id: str, original_user_prompt: str, language: str, message=None) -> str:
-        self.logger.info(f"User {message.from_user.id} requested analysis for video_id: {video_id}")
-        
-        analysis_entry = await analysis_manager.get_or_create_analysis_entry(video_id)
+    async def _propose_single_video(self, video_id: str, video_info: Dict) -> Dict:
+        duration = video_info.get('duration', 0)
+        filesize = video_info.get('filesize') or 0
+
+        estimated_tokens = estimate_video_tokens(duration)
+        wait_seconds = await self._expected_wait_seconds(estimated_tokens)
+
+        min_seconds, expected_seconds, max_seconds = self.time_estimator.estimate(duration, filesize, wait_seconds)
+        self.time_estimator.remember_estimate(video_id, expected_seconds)
+        min_total_time, max_total_time = min_seconds / 60, max_seconds / 60
+
+        self.logger.info(
+            f"Time estimation for {video_id}: "
+            f"Wait={wait_seconds:.0f}s, Tokens~{estimated_tokens}, "
+            f"Expected={expected_seconds / 60:.2f}m. "
+            f"Total Range=[{min_total_time:.1f}m - {max_total_time:.1f}m]"
+        )
+
+        # Формируем красивый ответ для пользователя
+        if max_total_time < 1:
+            estimate_text = "Обработка займет меньше минуты.\n\nНачать?"
+        # Если разница между мин и макс меньше минуты, показываем одно значение
+        elif (max_total_time - min_total_time) < 1:
+            estimate_text = (f"Видео будет обрабатываться примерно {max_total_time:.1f} минут.\n\nНачать обработку?")
+        else:
+            estimate_text = (f"Видео будет обрабатываться от {min_total_time:.1f} до {max_total_time:.1f} минут.\n\nНачать обработку?")
+
+        return {'type': 'confirmation', 'text': estimate_text, 'video_id': video_id}
+
+    async def _propose_multiple_videos(self, video_ids: List[str], playlist_ids: List[str]) -> Dict:
+        """Несколько ссылок или плейлист: метаданные всех видео собираются параллельно, оценка и подтверждение - одни на всех."""
+        if playlist_ids:
+            playlists = await asyncio.gather(*(
+                run_blocking("youtube", get_yt_playlist_video_ids, f"https://www.youtube.com/playlist?list={playlist_id}", self.max_videos_per_request)
+                for playlist_id in playlist_ids
+            ))
+            for playlist_video_ids in playlists:
+                video_ids.extend(playlist_video_ids)
+            video_ids = list(dict.fromkeys(video_ids))
+        if not video_ids:
+            return {'type': 'text', 'content': "Не удалось получить список видео плейлиста."}
+
+        skipped = max(len(video_ids) - self.max_videos_per_request, 0)
+        video_ids = video_ids[:self.max_videos_per_request]
+        infos = await asyncio.gather(*(run_blocking("youtube", get_yt_video_info, self._video_url(video_id)) for video_id in video_ids))
+        videos = [(video_id, info) for video_id, info in zip(video_ids, infos) if info and info.get('duration')]
+        unavailable = len(video_ids) - len(videos)
+        if not videos:
+            return {'type': 'text', 'content': "Не удалось получить информацию ни об одном видео."}
+        if len(videos) == 1:
+            return await self._propose_single_video(*videos[0])
+
+        durations = [info['duration'] for _, info in videos]
+        estimated_tokens = sum(estimate_video_tokens(duration) for duration in durations)
+        wait_seconds = await self._expected_wait_seconds(estimated_tokens)
+
+        estimates = [self.time_estimator.estimate(info['duration'], info.get('filesize') or 0) for _, info in videos]
+        for (video_id, _), (_, expected_seconds, _) in zip(videos, estimates):
+            self.time_estimator.remember_estimate(video_id, expected_seconds)
+        lanes = min(self.multi_video_concurrency, len(videos))
+        min_seconds, expected_seconds, max_seconds = (
+            wait_seconds + self._schedule_makespan([estimate[i] for estimate in estimates], lanes) for i in range(3)
+        )
+
+        self.logger.info(
+            f"Time estimation for {len(videos)} videos: "
+            f"Wait={wait_seconds:.0f}s, Tokens~{estimated_tokens}, Lanes={lanes}, "
+            f"Expected={expected_seconds / 60:.2f}m. "
+            f"Total Range=[{min_seconds / 60:.1f}m - {max_seconds / 60:.1f}m]"
+        )
+
+        notes = []
+        if skipped:
+            notes.append(f"ещё {skipped} видео не вошли в запрос (не больше {self.max_videos_per_request} за раз)")
+        if unavailable:
+            notes.append(f"{unavailable} видео недоступны и будут пропущены")
+        notes_text = f" ({'; '.join(notes)})" if notes else ""
+        estimate_text = (
+            f"Найдено видео: {len(videos)}{notes_text}, общая длительность {sum(durations) / 60:.0f} минут.\n"
+            f"Обработка займет от {min_seconds / 60:.1f} до {max_seconds / 60:.1f} минут. "
+            f"Вы получите общий отчет со сводкой по всем видео.\n\nНачать обработку?"
+        )
+        video_ids = [video_id for video_id, _ in videos]
+        return {
+            'type': 'confirmation',
+            'text': estimate_text,
+            'video_ids': video_ids,
+            'durations': durations,
+            'batch_id': hashlib.sha1(",".join(video_ids).encode("utf-8")).hexdigest()[:12]
+        }
+
+    @staticmethod
+    def _schedule_makespan(job_seconds: List[float], lanes: int) -> float:
+        """Время обработки пачки на `lanes` параллельных дорожках, если длинные задачи запускаются первыми (LPT)."""
+        loads = [0.0] * max(lanes, 1)
+        for seconds in sorted(job_seconds, reverse=True):
+            heapq.heapreplace(loads, loads[0] + seconds)
+        return max(loads)
+
+    async def execute_video_analysis(
+        self, video_id: str, original_user_prompt: str, language: str, message=None,
+        deliver_later: bool = False, on_queue_position: Optional[QueuePositionCallback] = None
+    ) -> Union[Report, str]:
+        self.logger.info(f"User {message.from_user.id} requested analysis for video_id: {video_id} (deliver_later={deliver_later})")
+
+        if deliver_later:
+            return await self._submit_batch_analysis(video_id, original_user_prompt, language, message)
         
-        is_worker = analysis_entry["status"] == AnalysisStatus.IN_PROGRESS and not analysis_entry["event"].is_set()
+        # Воркер - только создатель записи; по статусу их могло оказаться несколько, пока первый еще работает
+        analysis_entry, is_worker = await analysis_manager.get_or_create_analysis_entry(video_id)
 
         if not is_worker:
             self.logger.info(f"Task for {video_id} is a 'watcher'. Waiting for result...")
-            await analysis_entry["event"].wait()
+            await analysis_entry.event.wait()
             
-            self.logger.info(f"Watcher for {video_id} woke up. Status: {analysis_entry['status']}")
-            if analysis_entry["status"] == AnalysisStatus.COMPLETED:
-                return await self.get_user_copy_of_report(analysis_entry["result"], video_id, message.from_user.id)
+            self.logger.info(f"Watcher for {video_id} woke up. Status: {analysis_entry.status}")
+            if analysis_entry.status == AnalysisStatus.COMPLETED:
+                # Все наблюдатели получают один и тот же отчет из памяти (с общим file_id Telegram)
+                return analysis_entry.result
             else:
-                return analysis_entry["result"] # Возвращаем сообщение об ошибке
+                return analysis_entry.result # Возвращаем сообщение об ошибке
 
         self.logger.info(f"This process is the designated WORKER for {video_id}.")
         original_video_path = None
+        job_started = time.monotonic()
+        admission_slot = self.admission.slot(on_position=on_queue_position) if self.admission else nullcontext()
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            original_video_path = await asyncio.to_thread(download_yt_video, url)
-            
-            probe = ffmpeg.probe(original_video_path)
-            duration = float(probe['format']['duration'])
-            uploaded_file = await asyncio.to_thread(client.files.upload, file=original_video_path)
-            
-            max_wait = math.ceil(duration / 60) + 60; waited=0
-            while uploaded_file.state.name == "PROCESSING" and waited < max_wait:
-                await asyncio.sleep(5); waited+=5
-                uploaded_file = await asyncio.to_thread(client.files.get, name=uploaded_file.name)
-            if uploaded_file.state.name != "ACTIVE":
-                raise RuntimeError(f"Видео не было обработано Gemini за {waited} секунд.")
-
-            concurrency_limit = RateLimits.RATE_LIMIT_2_5_FLASH.value - 1
-            semaphore = asyncio.Semaphore(concurrency_limit)
-            num_segments = math.ceil(duration / 600)
-            
-            tasks = [ self._process_video_logical_segment(uploaded_file, i + 1, num_segments, original_user_prompt, language, i * 600, min((i + 1) * 600, int(duration)), semaphore) for i in range(num_segments) ]
-            segment_descriptions = await asyncio.gather(*tasks)
+            # Глобальная очередь допуска: ждем свободного слота (с обновлением позиции) или получаем отказ
+            async with admission_slot:
+                original_video_path, duration = await self._download_video(video_id)
+                media = await self._prepare_media(original_video_path, video_id, duration)
 
-            final_report_text = f"Full analysis for your request (in {language}): '{original_user_prompt}'\n\n" + "\n\n---\n\n".join(filter(None, segment_descriptions))
-            report_filename = f"report_{os.path.basename(original_video_path)}.txt"
-            with open(report_filename, "w", encoding="utf-8") as f: f.write(final_report_text)
+                # Параллелизм сегментов ограничивает лимитер модели; ожидание ретраев слот не занимает
+                segment_ranges = self._segment_ranges(duration)
+                num_segments = len(segment_ranges)
             
-            await analysis_manager.complete_analysis(video_id, report_filename)
-            return await self.get_user_copy_of_report(report_filename, video_id, message.from_user.id)
+                tasks = [ self._process_video_logical_segment(media, i + 1, num_segments, original_user_prompt, language, start, end) for i, (start, end) in enumerate(segment_ranges) ]
+                # Ожидание в лимитере оценка добавляет отдельно, поэтому стадию учим за вычетом
+                # фактически измеренного простоя в лимитерах
+                analysis_started = time.monotonic()
+                with track_limiter_wait() as limiter_wait:
+                    segment_descriptions = await asyncio.gather(*tasks)
+                self.time_estimator.record_stage("analysis", duration, 0, time.monotonic() - analysis_started - limiter_wait.blocked_seconds)
+
+                await self._index_segments(video_id, segment_ranges, segment_descriptions)
+
+                final_report_text = self._build_report_text(original_user_prompt, language, segment_descriptions)
+                await self.time_estimator.record_job(video_id, time.monotonic() - job_started)
+                report = Report(f"report_{video_id}.txt", final_report_text)
+
+                await analysis_manager.complete_analysis(video_id, report)
+
+            # Кэш контекста для последующих вопросов создается в фоне уже после выдачи отчета и вне слота
+            # допуска: долгий анализ не тратит его TTL, а пользователи и наблюдатели не ждут caches.create
+            if self.context_cache:
+                self.context_cache.create_in_background(video_id, media, estimate_video_tokens(duration))
+            return report
 
+        except AdmissionRejectedError:
+            error_message = (
+                "⚠️ Сейчас в обработке слишком много видео, и очередь заполнена. "
+                "Попробуйте позже или выберите режим «Прислать позже»."
+            )
+            await analysis_manager.fail_analysis(video_id, error_message)
+            # Отказ не кэшируем: повторная попытка позже должна снова встать в очередь
+            await analysis_manager.cleanup_entry(video_id)
+            return error_message
+        except asyncio.CancelledError:
+            # Отмена: будим наблюдателей и удаляем запись, чтобы следующий запрос этого видео начал анализ заново
+            await analysis_manager.fail_analysis(video_id, "Анализ этого видео был отменен. Попробуйте отправить запрос еще раз.")
+            await analysis_manager.cleanup_entry(video_id)
+            raise
         except Exception as e:
             error_message = f"Произошла критическая ошибка: {e}"
             await analysis_manager.fail_analysis(video_id, error_message)
@@ -147,37 +299,384 @@ class FunctionHandler:
         finally:
             if original_video_path and os.path.exists(original_video_path):
                 os.remove(original_video_path)
-            asyncio.create_task(self.schedule_cleanup(video_id, 600))
+            # Запись живет TTL в колесе таймеров; это нужно и если обработчик отменили до завершения
+            analysis_manager.schedule_expiry(video_id)
+
+    async def execute_video_search(
+        self, video_id: str, original_user_prompt: str, language: str, message=None,
+        on_queue_position: Optional[QueuePositionCallback] = None
+    ) -> str:
+        """
+        Режим поиска момента ("на какой минуте говорят о ценах").
+
+        Каждый сегмент проверяется дешевой структурированной пробой (найдено /
+        время / уверенность) вместо полного анализа; как только найден уверенный
+        ответ, оставшиеся сегменты отменяются, и пользователь сразу получает время.
+        Результат зависит от вопроса, поэтому в AnalysisManager он не разделяется.
+        """
+        self.logger.info(f"User {message.from_user.id} requested a moment search in video_id: {video_id}")
+        original_video_path = None
+        admission_slot = self.admission.slot(on_position=on_queue_position) if self.admission else nullcontext()
+        try:
+            async with admission_slot:
+                original_video_path, duration = await self._download_video(video_id)
+                media = await self._prepare_media(original_video_path, video_id, duration)
+                hit = await self._search_segments(media, self._segment_ranges(duration), original_user_prompt, language)
+        except AdmissionRejectedError:
+            return "⚠️ Сейчас в обработке слишком много видео, и очередь заполнена. Попробуйте позже."
+        except Exception as e:
+            self.logger.error(f"Moment search failed for {video_id}: {e}", exc_info=True)
+            return f"Произошла критическая ошибка: {e}"
+        finally:
+            if original_video_path and os.path.exists(original_video_path):
+                os.remove(original_video_path)
+
+        if hit is None:
+            return "Не удалось найти этот момент в видео. Попробуйте переформулировать запрос или запросите полный анализ."
+        seconds = int(hit["timestamp"])
+        timestamp = f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}" if seconds >= 3600 else f"{seconds // 60}:{seconds % 60:02d}"
+        hedge = "" if hit["confidence"] >= self.search_min_confidence else " (не уверен, проверьте)"
+        description = f"\n{hit['description']}" if hit["description"] else ""
+        return f"⏱ {timestamp}{hedge}{description}\n{self._video_url(video_id)}&t={seconds}s"
+
+    async def _search_segments(self, media: "Part", segment_ranges: List[Tuple[int, int]], question: str, language: str) -> Optional[Dict]:
+        """Пробует сегменты по порядку; возвращает первый уверенный ответ или самый уверенный из найденных."""
+        schema = get_search_probe_schema()
+        semaphore = asyncio.Semaphore(self.search_concurrency)
+        total = len(segment_ranges)
+
+        async def probe(index: int, start: int, end: int) -> Optional[Dict]:
+            # Семафор FIFO: ранние сегменты запускаются первыми
+            async with semaphore:
+                return await self._probe_segment(media, schema, index, total, start, end, question, language)
+
+        tasks = [asyncio.create_task(probe(i + 1, start, end)) for i, (start, end) in enumerate(segment_ranges)]
+        best = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                hit = await next_done
+                if hit is None:
+                    continue
+                if best is None or hit["confidence"] > best["confidence"]:
+                    best = hit
+                if hit["confidence"] >= self.search_min_confidence:
+                    break
+        finally:
+            skipped = sum(1 for task in tasks if not task.done())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.search_probes_skipped += skipped
+        self.logger.info(f"Moment search: {total - skipped}/{total} segments finished before the early stop, best hit: {best}")
+        return best
+
+    async def _probe_segment(
+        self, media: "Part", schema, index: int, total: int, start_time: int, end_time: int, question: str, language: str
+    ) -> Optional[Dict]:
+        from google.genai.types import Part, VideoMetadata
+
+        part = Part(
+            file_data=media.file_data, inline_data=media.inline_data,
+            video_metadata=VideoMetadata(start_offset=f"{int(start_time)}s", end_offset=f"{int(end_time)}s")
+        )
+        prompt = (
+            f"This is segment {index} of {total} of a video; it covers {start_time}s to {end_time}s of the whole video. "
+            f"The user is looking for a specific moment: \"{question}\". Decide whether this moment is in this segment. "
+            f"If it is, give its time in seconds from the start of the whole video, your confidence from 0 to 1 "
+            f"and one sentence in {language} about what happens there."
+        )
+        self.search_probes += 1
+        result = await self.gemini_service.generate_json(prompt, schema, model=GeminiModel.GEMINI_2_5_FLASH_LITE, video_part=part)
+        if not isinstance(result, dict) or "error" in result or not result.get("found"):
+            return None
+        try:
+            timestamp = float(result.get("timestamp_seconds") or start_time)
+            confidence = min(max(float(result.get("confidence") or 0.0), 0.0), 1.0)
+        except (TypeError, ValueError):
+            return None
+        if not start_time <= timestamp <= end_time and 0 <= timestamp <= end_time - start_time:
+            # Модель отсчитала время от начала сегмента, а не всего видео
+            timestamp += start_time
+        return {
+            "timestamp": min(max(timestamp, start_time), end_time),
+            "confidence": confidence,
+            "description": str(result.get("description") or "").strip(),
+        }
+
+    async def execute_multi_video_analysis(
+        self, video_ids: List[str], original_user_prompt: str, language: str, message=None,
+        durations: Optional[List[float]] = None, on_progress: Optional[MultiVideoProgressCallback] = None
+    ) -> Union[Report, str]:
+        """
+        Анализ нескольких видео одного запроса с общим отчетом и сводкой по всем видео.
+
+        Каждое видео проходит обычный путь (дедупликация в AnalysisManager, очередь
+        допуска, общий лимитер модели), но одновременно анализируется не больше
+        `multi_video_concurrency` видео пачки, и длинные запускаются первыми.
+        """
+        self.logger.info(f"User {message.from_user.id} requested analysis for {len(video_ids)} videos")
+        order = list(range(len(video_ids)))
+        if durations and len(durations) == len(video_ids):
+            order.sort(key=lambda i: durations[i], reverse=True)
+
+        lanes = asyncio.Semaphore(self.multi_video_concurrency)
+        finished = 0
+
+        async def analyze(video_id: str) -> Union[Report, str]:
+            nonlocal finished
+            async with lanes:
+                result = await self.execute_video_analysis(video_id, original_user_prompt, language, message)
+            finished += 1
+            if on_progress:
+                await on_progress(finished, len(video_ids))
+            return result
+
+        tasks = {i: asyncio.create_task(analyze(video_ids[i])) for i in order}
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        results = [tasks[i].result() for i in range(len(video_ids))]
+
+        reports = [(video_id, result) for video_id, result in zip(video_ids, results) if isinstance(result, Report)]
+        if not reports:
+            return "Не удалось проанализировать ни одно видео:\n" + "\n".join(
+                f"{self._video_url(video_id)}: {result}" for video_id, result in zip(video_ids, results)
+            )
+
+        summary = await self._cross_video_summary(original_user_prompt, language, reports) if len(reports) > 1 else None
+        sections = [
+            f"## Video {i + 1}/{len(video_ids)}: {self._video_url(video_id)}\n\n"
+            + (result.content.decode("utf-8") if isinstance(result, Report) else str(result))
+            for i, (video_id, result) in enumerate(zip(video_ids, results))
+        ]
+        final_report_text = f"Combined analysis of {len(video_ids)} videos for your request (in {language}): '{original_user_prompt}'\n\n"
+        if summary:
+            final_report_text += f"# Cross-video summary\n\n{summary}{MULTI_VIDEO_SEPARATOR}"
+        final_report_text += MULTI_VIDEO_SEPARATOR.join(sections)
+        return Report(f"report_{len(video_ids)}_videos.txt", final_report_text)
+
+    async def _cross_video_summary(self, user_prompt: str, language: str, reports: List[Tuple[str, Report]]) -> Optional[str]:
+        analyses = "\n\n".join(
+            f"=== Video {i + 1}: {self._video_url(video_id)} ===\n{report.content.decode('utf-8')}"
+            for i, (video_id, report) in enumerate(reports)
+        )
+        prompt = (
+            f"Below are analyses of {len(reports)} videos made for the user's request: \"{user_prompt}\".\n\n{analyses}\n\n"
+            f"Write a cross-video summary: answer the user's request across all videos, point out common themes, "
+            f"differences and how the videos build on each other, referring to videos by their numbers. "
+            f"IMPORTANT: Your entire response MUST be in {language}."
+        )
+        summary = await self.gemini_service.generate_text(prompt=prompt, model=GeminiModel.GEMINI_2_5_FLASH)
+        if summary.startswith(self.gemini_service.ERROR_PREFIX):
+            self.logger.error(f"Cross-video summary failed: {summary}")
+            return None
+        return summary
+
+    async def _submit_batch_analysis(self, video_id: str, original_user_prompt: str, language: str, message) -> str:
+        """Режим "прислать позже": все сегменты уходят одним пакетом в Batch API, отчет доставляется по готовности."""
+        if not self.batch_service:
+            return "Пакетная обработка сейчас недоступна."
+
+        original_video_path = None
+        try:
+            original_video_path, duration = await self._download_video(video_id)
+            # Batch API работает через основной ключ, файл должен принадлежать его проекту
+            uploaded_file = await self._upload_video(original_video_path, video_id, duration, key=self.gemini_service.key_pool.primary)
+
+            segment_ranges = self._segment_ranges(duration)
+            requests = [
+                {"start": start, "end": end, "prompt": self._segment_prompt(i + 1, len(segment_ranges), original_user_prompt, language)}
+                for i, (start, end) in enumerate(segment_ranges)
+            ]
+            await self.batch_service.submit(
+                model=GeminiModel.GEMINI_2_5_FLASH,
+                video_id=video_id,
+                chat_id=message.chat.id,
+                file_uri=uploaded_file.uri,
+                mime_type=uploaded_file.mime_type,
+                prompt=original_user_prompt,
+                language=language,
+                requests=requests
+            )
+            return self.BATCH_SUBMITTED_MESSAGE
+        except Exception as e:
+            self.logger.error(f"Failed to submit batch analysis for {video_id}: {e}", exc_info=True)
+            return f"Произошла критическая ошибка: {e}"
+        finally:
+            if original_video_path and os.path.exists(original_video_path):
+                os.remove(original_video_path)
+
+    async def complete_batch_analysis(self, job: Dict, texts: List[Optional[str]]) -> Report:
+        """Собирает отчет по результатам пакета."""
+        segment_ranges = [tuple(segment) for segment in job["segments"]]
+        total = len(segment_ranges)
+        segment_descriptions = [
+            self._format_segment(i + 1, total, start, end, texts[i] if i < len(texts) and texts[i] else SEGMENT_ERROR_TEXT)
+            for i, (start, end) in enumerate(segment_ranges)
+        ]
+        await self._index_segments(job["video_id"], segment_ranges, segment_descriptions)
+
+        final_report_text = self._build_report_text(job["prompt"], job["language"], segment_descriptions)
+        return Report(f"report_{job['video_id']}.txt", final_report_text)
+
+    async def _download_video(self, video_id: str) -> Tuple[str, float]:
+        import ffmpeg
+
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        started = time.monotonic()
+        original_video_path = await run_blocking("youtube", download_yt_video, url)
+        probe = await run_blocking("media", ffmpeg.probe, original_video_path)
+        duration = float(probe['format']['duration'])
+        self.time_estimator.record_stage("download", duration, os.path.getsize(original_video_path), time.monotonic() - started)
+        return original_video_path, duration
+
+    async def _prepare_media(self, video_path: str, video_id: str, duration: float) -> "Part":
+        """
+        Часть запроса с видео для анализа сегментов.
+
+        Маленький файл отправляется inline-байтами прямо в generate_content: без
+        загрузки, ожидания PROCESSING и удаления. Остальные идут через Files API.
+        """
+        from google.genai.types import Part
+
+        filesize = os.path.getsize(video_path)
+        if filesize <= self.inline_video_max_bytes:
+            data = await run_blocking("disk", read_file_bytes, video_path)
+            self.inline_videos += 1
+            self.logger.info(f"Sending video {video_id} inline ({filesize / 1024 / 1024:.1f} MB), skipping Files API")
+            return Part.from_bytes(data=data, mime_type="video/mp4")
+
+        uploaded_file = await self._upload_video(video_path, video_id, duration)
+        self.uploaded_videos += 1
+        return Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)
+
+    async def _upload_video(self, video_path: str, video_id: str, duration: float, key: Optional[ApiKey] = None):
+        from google.genai.types import UploadFileConfig
+
+        if self.transcoder:
+            # Большие файлы сначала уменьшаем: Gemini все равно семплирует ~1 кадр в секунду
+            video_path = await self.transcoder.maybe_transcode(video_path)
+
+        # Файл принадлежит проекту ключа, через который загружен; все запросы с ним пойдут через этот ключ
+        key_pool = self.gemini_service.key_pool
+        key = key or await key_pool.choose(GeminiModel.GEMINI_2_5_FLASH) or key_pool.primary
+        files = key.client.files
+        filesize = os.path.getsize(video_path)
+        started = time.monotonic()
+        # Асинхронный клиент загружает файл по resumable-протоколу, читая его частями
+        uploaded_file = await files.upload(
+            file=video_path,
+            config=UploadFileConfig(mime_type="video/mp4", display_name=video_id)
+        )
+        uploaded_at = time.monotonic()
+        self.time_estimator.record_stage("upload", duration, filesize, uploaded_at - started)
+
+        max_wait = math.ceil(duration / 60) + 60
+        uploaded_file = await file_poller.wait_until_active(
+            uploaded_file,
+            fetch=lambda name: files.get(name=name),
+            size_bytes=filesize,
+            timeout=max_wait
+        )
+        self.time_estimator.record_stage("processing", duration, filesize, time.monotonic() - uploaded_at)
+        key_pool.pin(uploaded_file.uri, key)
+        return uploaded_file
+
+    @staticmethod
+    def _segment_ranges(duration: float) -> List[Tuple[int, int]]:
+        num_segments = math.ceil(duration / 600)
+        return [(i * 600, min((i + 1) * 600, int(duration))) for i in range(num_segments)]
+
+    @staticmethod
+    def _segment_prompt(index: int, total: int, user_prompt: str, language: str) -> str:
+        return f"""This is segment {index} of {total} from a video. Analyze it based on the user's original request: "{user_prompt}". IMPORTANT: Your entire response MUST be in {language}."""
+
+    @staticmethod
+    def _format_segment(index: int, total: int, start_time: int, end_time: int, text: str) -> str:
+        return f"### Segment Analysis {index}/{total} ({start_time}s - {end_time}s)\n\n{text}"
+
+    @staticmethod
+    def _build_report_text(user_prompt: str, language: str, segment_descriptions: List[Optional[str]]) -> str:
+        return f"Full analysis for your request (in {language}): '{user_prompt}'\n\n" + "\n\n---\n\n".join(filter(None, segment_descriptions))
+
+    async def _index_segments(self, video_id: str, segment_ranges: List[Tuple[int, int]], segment_descriptions: List[Optional[str]]):
+        if not self.segment_index:
+            return
+        try:
+            await self.segment_index.add_segments(
+                video_id, [
+                    (start, end, text) for (start, end), text in zip(segment_ranges, segment_descriptions)
+                    if text and not self._is_failed_segment(text)
+                ]
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to index segments for {video_id}: {e}")
+
+    def _is_failed_segment(self, text: str) -> bool:
+        # Текст ошибки не должен находиться поиском и попадать в ответ как "анализ" сегмента
+        body = text.split("\n\n", 1)[-1].strip()
+        return body == SEGMENT_ERROR_TEXT or body.startswith(self.gemini_service.ERROR_PREFIX)
+
+    async def has_video_context(self, video_id: str) -> bool:
+        """Можно ли отвечать на вопросы по видео: есть живой кэш контекста или проиндексированные сегменты."""
+        if self.context_cache and self.context_cache.get(video_id):
+            return True
+        return bool(self.segment_index and await self.segment_index.has_video(video_id))
+
+    async def search_video_segments(self, text_from_router: str, video_id: str) -> str:
+        """
+        Отвечает на вопрос по проанализированному видео, используя локальный индекс сегментов.
+
+        Видео повторно не отправляется: в модель уходят только найденные тексты сегментов.
+        Если ничего не найдено, вопрос передается в кэш контекста видео.
+        """
+        hits = await self.segment_index.search(video_id, text_from_router) if self.segment_index else []
+        if not hits:
+            self.logger.info(f"No indexed segments matched for video {video_id}, falling back to context cache")
+            return await self.answer_video_followup(text_from_router, video_id)
+        return await self._answer_from_segments(text_from_router, hits)
+
+    async def answer_video_followup(self, text_from_router: str, video_id: str) -> str:
+        """Отвечает на дополнительный вопрос по уже проанализированному видео через кэш контекста."""
+        entry = self.context_cache.get(video_id) if self.context_cache else None
+        if not entry:
+            # Кэш истек - пробуем ответить хотя бы по проиндексированным текстам сегментов
+            hits = await self.segment_index.search(video_id, text_from_router) if self.segment_index else []
+            if hits:
+                return await self._answer_from_segments(text_from_router, hits)
+            return "Контекст видео уже истек. Отправьте ссылку на видео еще раз, чтобы задать по нему вопрос."
+        self.logger.info(f"Answering follow-up for video {video_id} using context cache {entry.cache_name}")
+        self.context_cache.touch(video_id)
+        return await self.gemini_service.generate_text(prompt=text_from_router, model=entry.model, cached_content=entry.cache_name)
+
+    async def _answer_from_segments(self, question: str, hits: List[IndexedSegment]) -> str:
+        excerpts = "\n\n".join(f"[{start}s - {end}s]\n{text}" for start, end, text in hits)
+        prompt = (
+            f"Below are excerpts from an earlier analysis of a video, each with its time range.\n\n{excerpts}\n\n"
+            f"Using only these excerpts, answer the user's question and point to the relevant time ranges: \"{question}\""
+        )
+        return await self.gemini_service.generate_text(prompt=prompt, model=GeminiModel.GEMINI_2_5_FLASH_LITE)
 
     async def get_hard_text_response(self, text_from_router: str) -> str:
-        return await self.gemini_service.generate_text(prompt=text_from_router, model=GeminiModel.GEMINI_2_5_PRO)
+        return await self.gemini_service.generate_text(prompt=text_from_router, model=GeminiModel.GEMINI_2_5_PRO, use_cache=True)
 
     async def get_light_text_response(self, text_from_router: str) -> str:
-        return await self.gemini_service.generate_text(prompt=text_from_router, model=GeminiModel.GEMINI_2_5_FLASH_LITE)
+        # Легкие ответы пользователь ждет напрямую, поэтому срезаем хвостовую задержку хеджированием
+        return await self.gemini_service.generate_text(prompt=text_from_router, model=GeminiModel.GEMINI_2_5_FLASH_LITE, use_cache=True, hedge=True)
     
-    async def _process_video_logical_segment(self, uploaded_file, index: int, total: int, user_prompt: str, language: str, start_time: int, end_time: int, semaphore: asyncio.Semaphore) -> Optional[str]:
-        async with semaphore:
-            try:
-                self.logger.info(f"Processing segment {index}/{total}...")
-                video_metadata = {"start_offset": f"{int(start_time)}s", "end_offset": f"{int(end_time)}s"}
-                file_data_for_part = FileData(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)
-                part = Part(file_data=file_data_for_part, video_metadata=VideoMetadata(**video_metadata))
-                prompt = f"""This is segment {index} of {total} from a video. Analyze it based on the user's original request: "{user_prompt}". IMPORTANT: Your entire response MUST be in {language}."""
-                response = await self.gemini_service.generate_text(prompt=prompt, model=GeminiModel.GEMINI_2_5_FLASH, video_part=part)
-                return f"### Segment Analysis {index}/{total} ({start_time}s - {end_time}s)\n\n{str(response)}"
-            except Exception as e:
-                self.logger.error(f"Error processing segment {index}/{total}: {e}", exc_info=True)
-                return f"### Segment Analysis {index}/{total}\n\nAn error occurred."
-
-    async def schedule_cleanup(self, video_id: str, delay: int):
-        await asyncio.sleep(delay)
-        self.logger.info(f"Cleaning up cached analysis entry for video_id: {video_id}")
-        await analysis_manager.cleanup_entry(video_id)
-
-    async def get_user_copy_of_report(self, original_report_path: str, video_id: str, user_id: int) -> str:
+    async def _process_video_logical_segment(self, media: "Part", index: int, total: int, user_prompt: str, language: str, start_time: int, end_time: int) -> Optional[str]:
         try:
-            unique_report_name = f"report_{video_id}_{user_id}_{int(time.time())}.txt"
-            shutil.copyfile(original_report_path, unique_report_name)
-            return unique_report_name
-        except Exception:
-            return original_report_path
\ No newline at end of file
+            self.logger.info(f"Processing segment {index}/{total}...")
+            video_metadata = {"start_offset": f"{int(start_time)}s", "end_offset": f"{int(end_time)}s"}
+            from google.genai.types import Part, VideoMetadata
+
+            # Тот же файл (по URI или inline-байтами), но только нужный отрезок
+            part = Part(file_data=media.file_data, inline_data=media.inline_data, video_metadata=VideoMetadata(**video_metadata))
+            prompt = self._segment_prompt(index, total, user_prompt, language)
+            response = await self.gemini_service.generate_text(prompt=prompt, model=GeminiModel.GEMINI_2_5_FLASH, video_part=part)
+            return self._format_segment(index, total, start_time, end_time, str(response))
+        except Exception as e:
+            self.logger.error(f"Error processing segment {index}/{total}: {e}", exc_info=True)
+            return f"### Segment Analysis {index}/{total}\n\n{SEGMENT_ERROR_TEXT}"
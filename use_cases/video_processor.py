@@ -2,24 +2,28 @@ import asyncio
 import os
 import re
 import shutil
+from typing import TYPE_CHECKING
 
-from google.genai import Client
-from google.genai.types import Part
-
-from services.gemini_service import GeminiService
+from services.gemini_service import GeminiService, INLINE_VIDEO_MAX_BYTES
 from core.enums import GeminiModel
-from utils.video_cutter import cut_video_to_segments
+from core.file_poller import file_poller
+from core.executors import read_file_bytes, run_blocking
+from utils.video_cutter import VideoSegment, cut_video_keyframe_aligned
 from utils.download_yt_video import download_yt_video
 
+if TYPE_CHECKING:
+    from google.genai import Client
+
 class VideoProcessor:
     YOUTUBE_REGEX = re.compile(
         r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/'
         r'(watch\?v=|embed/|v/|.+\?v=)?(?P<id>[^"&?\s]{11})'
     )
-    def __init__(self, gemini_service: GeminiService, file_client: Client, segment_duration: int):
+    def __init__(self, gemini_service: GeminiService, file_client: "Client", segment_duration: int, inline_max_bytes: int = INLINE_VIDEO_MAX_BYTES):
         self.gemini_service = gemini_service
         self.file_client = file_client
         self.segment_duration = segment_duration
+        self.inline_max_bytes = inline_max_bytes
 
     async def analyze_video_from_prompt(self, user_prompt: str) -> str:
         match = self.YOUTUBE_REGEX.search(user_prompt)
@@ -35,18 +39,19 @@ class VideoProcessor:
         segments_dir = None
 
         try:
-            original_video_path = await asyncio.to_thread(download_yt_video, url)
+            original_video_path = await run_blocking("youtube", download_yt_video, url)
             
             base_name = os.path.basename(original_video_path).rsplit('.', 1)[0]
             segments_dir = os.path.join(os.getcwd(), 'segments', base_name)
             
-            video_segments_paths = await asyncio.to_thread(
-                cut_video_to_segments, original_video_path, self.segment_duration, segments_dir
+            # Манифест с точными границами: сегменты режутся по ключевым кадрам параллельно
+            manifest = await run_blocking(
+                "media", cut_video_keyframe_aligned, original_video_path, self.segment_duration, segments_dir
             )
             
             tasks = [
-                self._process_video_segment(path, i + 1, len(video_segments_paths), user_prompt)
-                for i, path in enumerate(video_segments_paths)
+                self._process_video_segment(segment, len(manifest), user_prompt)
+                for segment in manifest
             ]
             segment_descriptions = await asyncio.gather(*tasks)
 
@@ -61,29 +66,38 @@ class VideoProcessor:
             if segments_dir and os.path.exists(segments_dir):
                 shutil.rmtree(segments_dir, ignore_errors=True)
 
-    async def _process_video_segment(self, segment_path: str, index: int, total: int, user_prompt: str) -> str:
-        uploaded_file = None
-        try:
-            uploaded_file = await asyncio.to_thread(self.file_client.files.upload, file=segment_path)
-
-            while uploaded_file.state and uploaded_file.state.name == "PROCESSING":
-                await asyncio.sleep(5)
-                uploaded_file = await asyncio.to_thread(self.file_client.files.get, name=uploaded_file.name)
+    async def _process_video_segment(self, segment: VideoSegment, total: int, user_prompt: str) -> str:
+        from google.genai.types import Part, UploadFileConfig
 
-            if uploaded_file.state and uploaded_file.state.name == "FAILED":
-                raise RuntimeError(f"Server failed to process segment: {uploaded_file.name}")
+        segment_path = segment.path
+        index = segment.index + 1
 
-            if not uploaded_file.uri or not uploaded_file.mime_type:
-                raise RuntimeError(f"File {uploaded_file.name} is active but is missing a URI or MIME type.")
-
-
-            video_part = Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)
+        uploaded_file = None
+        try:
+            segment_size = os.path.getsize(segment_path)
+            if segment_size <= self.inline_max_bytes:
+                # Короткий сегмент уходит прямо в запрос: без загрузки, ожидания PROCESSING и удаления
+                data = await run_blocking("disk", read_file_bytes, segment_path)
+                video_part = Part.from_bytes(data=data, mime_type="video/mp4")
+            else:
+                uploaded_file = await self.file_client.aio.files.upload(
+                    file=segment_path, config=UploadFileConfig(mime_type="video/mp4")
+                )
+
+                uploaded_file = await file_poller.wait_until_active(
+                    uploaded_file,
+                    fetch=lambda name: self.file_client.aio.files.get(name=name),
+                    size_bytes=segment_size
+                )
+
+                if not uploaded_file.uri or not uploaded_file.mime_type:
+                    raise RuntimeError(f"File {uploaded_file.name} is active but is missing a URI or MIME type.")
+
+                video_part = Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)
             
-            start_time = (index - 1) * self.segment_duration
-            end_time = start_time + self.segment_duration
             prompt = (
                 f"This is segment {index} of {total} from a large video. This segment covers "
-                f"the time from {start_time} to {end_time} seconds. Analyze its content based on "
+                f"the time from {segment.start:.0f} to {segment.end:.0f} seconds. Analyze its content based on "
                 f"the user's original request: \"{user_prompt}\""
             )
 
@@ -98,7 +112,7 @@ class VideoProcessor:
         finally:
             if uploaded_file and uploaded_file.name:
                 try:
-                    await asyncio.to_thread(self.file_client.files.delete, name=uploaded_file.name)
+                    await self.file_client.aio.files.delete(name=uploaded_file.name)
                 except Exception:
                     pass
             if os.path.exists(segment_path):
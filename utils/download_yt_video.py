@@ -1,7 +1,8 @@
 import os
 import subprocess
 import json
-from typing import Optional, Dict
+import uuid
+from typing import Optional, Dict, List
 
 def get_yt_video_info(url: str) -> Optional[Dict]:
     """
@@ -27,16 +28,40 @@ def get_yt_video_info(url: str) -> Optional[Dict]:
         print(f"Error getting video info for {url}: {e}")
         return None
 
+def get_yt_playlist_video_ids(url: str, limit: int = 50) -> List[str]:
+    """
+    Получает ID видео плейлиста через yt-dlp (--flat-playlist), не запрашивая метаданные каждого видео.
+    """
+    cmd = [
+        "yt-dlp",
+        "--flat-playlist",
+        "--print", "id",
+        "--playlist-end", str(limit),
+        "--no-warnings",
+        url
+    ]
+    try:
+        process = subprocess.run(
+            cmd, check=True, capture_output=True, text=True, encoding='utf-8'
+        )
+        return [line.strip() for line in process.stdout.splitlines() if line.strip()]
+    except Exception as e:
+        print(f"Error getting playlist items for {url}: {e}")
+        return []
+
 def download_yt_video(url: str) -> str:
     """
     Скачивает видео с YouTube, используя безопасные параметры для имени файла.
+
+    Каждый вызов получает свой файл (ID видео + уникальный суффикс): одновременные
+    задачи по одному видео не удаляют и не подменяют файл друг друга.
     """
     if not isinstance(url, str) or not url.strip():
         raise ValueError("url must be a non-empty string")
     
     save_dir = os.path.join(os.getcwd(), 'yt_videos')
     os.makedirs(save_dir, exist_ok=True)
-    output_template = os.path.join(save_dir, '%(title)s.%(ext)s')
+    output_template = os.path.join(save_dir, f'%(id)s-{uuid.uuid4().hex[:12]}.%(ext)s')
     
     cmd = [
         "yt-dlp",
@@ -1,7 +1,131 @@
+import bisect
 import os
-import ffmpeg
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+class VideoSegment:
+    """Элемент манифеста нарезки: точные границы сегмента в исходном видео."""
+    __slots__ = ("index", "path", "start", "end")
+
+    def __init__(self, index: int, path: str, start: float, end: float):
+        self.index = index
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self) -> Dict:
+        return {"index": self.index, "path": self.path, "start": self.start, "end": self.end}
+
+
+def probe_keyframes(input_path: str) -> Tuple[List[float], float]:
+    """
+    Индекс ключевых кадров видеодорожки и длительность файла через ffprobe.
+
+    Читаются только заголовки пакетов (флаг K), кадры не декодируются,
+    поэтому индекс часового видео строится за секунды.
+    """
+    packets = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", input_path
+        ],
+        check=True, capture_output=True, text=True
+    )
+    keyframes = set()
+    for line in packets.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.add(float(pts_time))
+
+    fmt = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_path],
+        check=True, capture_output=True, text=True
+    )
+    return sorted(keyframes), float(fmt.stdout.strip())
+
+
+def plan_segments(keyframes: List[float], duration: float, segment_time: float) -> List[Tuple[float, float]]:
+    """
+    Границы сегментов на ключевых кадрах, ближайших к целевой длине.
+
+    Граница ищется в окне ±50% от `segment_time`; если в окне ключевых кадров
+    нет, берется первый ключевой кадр после цели (или конец файла). Хвост
+    короче четверти целевой длины присоединяется к последнему сегменту.
+    """
+    ranges = []
+    start = 0.0
+    while duration - start > segment_time * 1.25:
+        target = start + segment_time
+        low = bisect.bisect_left(keyframes, start + segment_time * 0.5)
+        high = bisect.bisect_right(keyframes, start + segment_time * 1.5)
+        candidates = keyframes[low:high]
+        if candidates:
+            boundary = min(candidates, key=lambda keyframe: abs(keyframe - target))
+        else:
+            after = bisect.bisect_right(keyframes, target)
+            boundary = keyframes[after] if after < len(keyframes) else duration
+        if boundary >= duration:
+            break
+        ranges.append((start, boundary))
+        start = boundary
+    ranges.append((start, duration))
+    return ranges
+
+
+def _cut_segment(input_path: str, output_path: str, start: float, end: float):
+    # -ss/-to как опции входа: поиск по ключевому кадру без декодирования, потоки копируются как есть
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-ss", f"{start:.6f}", "-to", f"{end:.6f}", "-i", input_path,
+            "-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero",
+            output_path
+        ],
+        check=True, capture_output=True
+    )
+
+
+def cut_video_keyframe_aligned(
+    input_path: str, segment_time: int = 600, output_dir: Optional[str] = None, max_workers: Optional[int] = None
+) -> List[VideoSegment]:
+    """
+    Нарезает видео на сегменты по ключевым кадрам и возвращает манифест.
+
+    Сегменты режутся копированием потоков параллельно (по процессу ffmpeg
+    на сегмент, не больше `max_workers` одновременно). Исходный файл не удаляется.
+
+    Анализ в боте файл не режет, а передает границы сегментов модели через
+    video_metadata; нарезка используется scripts/cutter_benchmark.py и
+    VideoProcessor, который в main.py не подключен.
+    """
+    keyframes, duration = probe_keyframes(input_path)
+    ranges = plan_segments(keyframes, duration, segment_time)
+
+    output_dir = output_dir or os.getcwd()
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    manifest = [
+        VideoSegment(index, os.path.join(output_dir, f"{base_name}_{index:03d}.mp4"), start, end)
+        for index, (start, end) in enumerate(ranges)
+    ]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(manifest))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cutter") as pool:
+        # list() пробрасывает первую ошибку ffmpeg вызывающему
+        list(pool.map(lambda segment: _cut_segment(input_path, segment.path, segment.start, segment.end), manifest))
+    return manifest
+
 
 def cut_video_to_segments(input_filename: str, segment_time: int = 600, output_dir: str = None) -> list:
+    """Прежняя нарезка одним процессом сегментера ffmpeg (оставлена для сравнения в scripts/cutter_benchmark.py)."""
+    import ffmpeg
+
     yt_dir = os.path.join(os.getcwd(), 'yt_videos')
     yt_file_path = os.path.join(yt_dir, input_filename) if not os.path.isabs(input_filename) else input_filename
     if not os.path.isfile(yt_file_path):
@@ -31,4 +155,4 @@ def cut_video_to_segments(input_filename: str, segment_time: int = 600, output_d
         os.remove(yt_file_path)
     except Exception:
         pass
-    return output_files
\ No newline at end of file
+    return output_files
@@ -0,0 +1,39 @@
+import subprocess
+
+
+def transcode_video(
+    input_path: str,
+    output_path: str,
+    max_height: int = 480,
+    fps: float = 2.0,
+    audio_bitrate: str = "48k",
+    crf: int = 28,
+    preset: str = "veryfast",
+    threads: int = 0
+) -> str:
+    """
+    Перекодирует видео в компактный вид для загрузки в Gemini.
+
+    Высота кадра уменьшается до `max_height` (меньшие видео не увеличиваются),
+    частота кадров - до `fps`, звук - моно AAC с битрейтом `audio_bitrate`.
+    `threads=0` - ffmpeg сам задействует все ядра.
+    """
+    video_filter = f"scale=-2:'min(ih,{max_height})',fps={fps}"
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-i", input_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", video_filter,
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", audio_bitrate, "-ac", "1",
+        "-threads", str(threads),
+        "-movflags", "+faststart",
+        output_path
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise RuntimeError("'ffmpeg' command not found. Make sure it is installed and available in PATH.")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed to transcode video. Error: {e.stderr.strip()}")
+    return output_path